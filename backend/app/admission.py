@@ -0,0 +1,224 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, FrozenSet, List, Tuple
+from dotenv import load_dotenv
+from logger import app_logger
+from tracing import metrics, record_stage
+
+load_dotenv()
+ADMISSION_GLOBAL_CAPACITY = int(os.getenv("ADMISSION_GLOBAL_CAPACITY", "32"))  # weight of all upstream work in flight, 0 disables
+ADMISSION_LLM_CAPACITY = int(os.getenv("ADMISSION_LLM_CAPACITY", "24"))  # weight of OpenAI agent runs in flight, 0 disables
+ADMISSION_MCP_CAPACITY = int(os.getenv("ADMISSION_MCP_CAPACITY", "12"))  # MCP tool calls in flight, 0 disables
+ADMISSION_MAX_WAITING = int(os.getenv("ADMISSION_MAX_WAITING", "64"))  # callers queued per limiter, more are rejected with 429
+ADMISSION_WAIT_TIMEOUT = float(os.getenv("ADMISSION_WAIT_TIMEOUT", "30"))  # seconds a caller may queue before a 503
+# weight of each call type: roughly the number of LLM calls (or MCP calls) it fans out into.
+# a guardian run may hand off to the travel agent, so it reserves for both.
+ADMISSION_WEIGHTS = os.getenv("ADMISSION_WEIGHTS", "guardian=4,travel_agent=3,pick_options=1,trip_plan=1,summary=1,mcp_call=1")
+CALL_WEIGHTS = {name.strip(): int(weight) for name, _, weight in (item.partition("=") for item in ADMISSION_WEIGHTS.split(",") if item.strip())}
+
+rejected_total = metrics.counter("trip_planner_admission_rejected_total", "Calls turned away by admission control")
+
+
+class Overloaded(Exception):
+    """An upstream limiter could not admit the call, maps to an HTTP error with Retry-After"""
+
+    def __init__(self, upstream: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"Server is busy ({upstream} {reason}), retry in {retry_after}s")
+        self.upstream = upstream
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class WeightedLimiter:
+    """Weighted semaphore with a bounded FIFO wait queue.
+
+    A call holds `weight` units of `capacity` while it runs. Callers that do not
+    fit wait in arrival order; when `max_waiting` are already waiting the call
+    is rejected right away (429), and a caller that waited `wait_timeout`
+    seconds gives up (503). A weight above the capacity is clamped, so a single
+    heavy call can always run on an idle limiter.
+    """
+
+    def __init__(self, name: str, capacity: int, max_waiting: int = ADMISSION_MAX_WAITING, wait_timeout: float = ADMISSION_WAIT_TIMEOUT):
+        self.name = name
+        self.capacity = capacity
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.in_use = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+        self.hold_avg = 0.0  # moving average of seconds a call holds its units, for Retry-After
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new caller has likely drained"""
+        estimate = self.hold_avg * (self.waiting + 1) / max(self.capacity, 1)
+        return max(1, int(estimate + 0.5))
+
+    async def acquire(self, weight: int) -> int:
+        """Take `weight` units, returns the weight actually taken (clamped to the capacity)"""
+        weight = min(weight, self.capacity)
+        if not self._waiters and self.in_use + weight <= self.capacity:
+            self.in_use += weight
+            self.admitted += 1
+            return weight
+        if len(self._waiters) >= self.max_waiting:
+            self.rejected += 1
+            rejected_total.inc(upstream=self.name, reason="queue_full")
+            raise Overloaded(self.name, 429, self.retry_after(), "queue is full")
+        future = asyncio.get_running_loop().create_future()
+        entry = (weight, future)
+        self._waiters.append(entry)
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.wait_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # admitted just as we gave up, hand the units back
+                self.release(weight)
+            else:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                # a heavy caller leaving the head may let lighter ones through
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                rejected_total.inc(upstream=self.name, reason="timeout")
+                raise Overloaded(self.name, 503, self.retry_after(), f"no capacity within {self.wait_timeout:g}s") from None
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_total += waited
+            record_stage("admission_wait", waited, upstream=self.name)
+        self.admitted += 1
+        return weight
+
+    def reclaim(self, weight: int) -> None:
+        """Take units back right away, even above the capacity, for a call that was admitted before"""
+        self.in_use += weight
+
+    def release(self, weight: int, held: float = 0.0) -> None:
+        self.in_use -= weight
+        if held:
+            self.hold_avg = held if self.hold_avg == 0 else 0.9 * self.hold_avg + 0.1 * held
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_use + self._waiters[0][0] <= self.capacity:
+            weight, future = self._waiters.popleft()
+            if not future.done():
+                self.in_use += weight
+                future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": round(self.wait_total / self.queued, 4) if self.queued else 0.0,
+            "avg_hold_seconds": round(self.hold_avg, 4),
+        }
+
+
+# Global limiters, every upstream call takes units from "global" and from its own upstream
+global_limiter = WeightedLimiter("global", ADMISSION_GLOBAL_CAPACITY)
+limiters: Dict[str, WeightedLimiter] = {
+    "openai": WeightedLimiter("openai", ADMISSION_LLM_CAPACITY),
+    "mcp": WeightedLimiter("mcp", ADMISSION_MCP_CAPACITY),
+}
+
+# names of the limiters the current task already holds units of. a call made while its parent
+# waits for it (a tool of an agent run, the summary of a turn) runs inside the parent's
+# reservation, which its weight is sized for, instead of queueing behind its own parent, which
+# could deadlock. calls started in parallel go through fan_out() and are admitted one by one.
+held_limiters_ctx: ContextVar[FrozenSet[str]] = ContextVar("held_limiters", default=frozenset())
+
+
+class _Reservation:
+    """The units one admit() block holds, fan_out() lends them out"""
+
+    def __init__(self):
+        self.taken: List[Tuple[WeightedLimiter, int]] = []
+
+
+reservations_ctx: ContextVar[Tuple[_Reservation, ...]] = ContextVar("admission_reservations", default=())
+
+
+@asynccontextmanager
+async def admit(upstream: str, call: str):
+    """Hold admission for one upstream call of type `call` (see CALL_WEIGHTS) while the block runs"""
+    held = held_limiters_ctx.get()
+    weight = CALL_WEIGHTS.get(call, 1)
+    needed = [limiter for limiter in (global_limiter, limiters[upstream]) if limiter.enabled and limiter.name not in held]
+    reservation = _Reservation()
+    started = time.perf_counter()
+    try:
+        for limiter in needed:
+            try:
+                reservation.taken.append((limiter, await limiter.acquire(weight)))
+            except Overloaded as e:
+                app_logger.warning(f"Admission rejected {call}: {e}")
+                raise
+        token = held_limiters_ctx.set(held | {limiter.name for limiter in needed})
+        reservations_token = reservations_ctx.set(reservations_ctx.get() + (reservation,))
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            reservations_ctx.reset(reservations_token)
+            held_limiters_ctx.reset(token)
+    finally:
+        seconds = time.perf_counter() - started
+        for limiter, units in reversed(reservation.taken):
+            limiter.release(units, seconds)
+
+
+@asynccontextmanager
+async def fan_out():
+    """Lend out the units the current task holds while it waits for calls it started in parallel.
+
+    Inside the block every admit() takes its own units, as if nothing were held,
+    so N concurrent agent runs count N times against their limiters. The units
+    are taken back afterwards without queueing, the parent was admitted already.
+    """
+    lent = [(reservation, list(reservation.taken)) for reservation in reservations_ctx.get()]
+    for reservation, taken in lent:
+        reservation.taken.clear()
+        for limiter, units in taken:
+            limiter.release(units)
+    held_token = held_limiters_ctx.set(frozenset())
+    reservations_token = reservations_ctx.set(())
+    try:
+        yield
+    finally:
+        reservations_ctx.reset(reservations_token)
+        held_limiters_ctx.reset(held_token)
+        for reservation, taken in lent:
+            for limiter, units in taken:
+                limiter.reclaim(units)
+            reservation.taken.extend(taken)
+
+
+def admission_stats() -> dict:
+    return {limiter.name: limiter.stats() for limiter in (global_limiter, *limiters.values())}
+
@@ -0,0 +1,195 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from dotenv import load_dotenv
+from logger import app_logger
+
+load_dotenv()
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "256"))  # max cached chats, 0 disables the cache
+CHAT_CACHE_MAX_BYTES = int(os.getenv("CHAT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CHAT_CACHE_FLUSH_INTERVAL = float(os.getenv("CHAT_CACHE_FLUSH_INTERVAL", "2.0"))  # max seconds a change stays unwritten
+
+
+def approx_chat_size(chat) -> int:
+    """Rough in-memory footprint of a chat, counted from its message texts"""
+    size = 512
+    for message in chat.messages:
+        if isinstance(message.content, str):
+            size += 128 + len(message.content)
+        else:
+            size += 128 + sum(len(content.text) + len(content.link or "") for content in message.content)
+        plan = getattr(message, "plan", None)
+        if isinstance(plan, str):
+            size += len(plan)
+        elif plan:
+            size += sum(64 + len(item.activity_title) + len(item.activity_content) for item in plan)
+    return size
+
+
+class ChatCache:
+    """LRU cache of hot Chat objects with write-behind flushing.
+
+    Dirty chats are written by a background task at most `flush_interval` seconds
+    after they changed, when they are evicted, and on shutdown. While the
+    background task is not running every change is written straight away.
+    All methods run on the event loop, the writes themselves go to the storage
+    thread pool through `Chat.flush_async`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CHAT_CACHE_SIZE,
+        max_bytes: int = CHAT_CACHE_MAX_BYTES,
+        flush_interval: float = CHAT_CACHE_FLUSH_INTERVAL,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self._entries: "OrderedDict[str, object]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._dirty: Dict[str, object] = {}
+        # dirty chats pushed out of the LRU whose write has not landed yet
+        self._evicting: Dict[str, object] = {}
+        self._eviction_tasks: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, chat_id: str):
+        if not self.enabled:
+            return None
+        chat = self._entries.get(chat_id)
+        if chat is None:
+            chat = self._evicting.get(chat_id)
+            if chat is None:
+                self.misses += 1
+                return None
+            # still being written back, the stored copy would be stale
+            self.put(chat)
+        self._entries.move_to_end(chat_id)
+        self.hits += 1
+        return chat
+
+    def peek(self, chat_id: str):
+        """Look up a chat without touching the LRU order or the counters"""
+        return self._entries.get(chat_id) or self._evicting.get(chat_id)
+
+    def put(self, chat) -> None:
+        if not self.enabled:
+            return
+        self._entries[chat.id] = chat
+        self._entries.move_to_end(chat.id)
+        self._resize(chat)
+        self._evict()
+
+    def _resize(self, chat) -> None:
+        size = approx_chat_size(chat)
+        self._bytes += size - self._sizes.get(chat.id, 0)
+        self._sizes[chat.id] = size
+
+    def _evict(self) -> None:
+        # the most recently used chat always stays, even if it is over the byte budget alone
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            chat_id, chat = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(chat_id, 0)
+            self.evictions += 1
+            if self._dirty.pop(chat_id, None) is not None:
+                self._evicting[chat_id] = chat
+                task = asyncio.create_task(self._write_evicted(chat))
+                self._eviction_tasks.add(task)
+                task.add_done_callback(self._eviction_tasks.discard)
+
+    async def _write_evicted(self, chat) -> None:
+        try:
+            await chat.flush_async()
+            self.flushes += 1
+        finally:
+            if self._evicting.get(chat.id) is chat:
+                del self._evicting[chat.id]
+
+    def remove(self, chat_id: str):
+        """Drop a chat and its unwritten changes, returns the cached object if there was one"""
+        chat = self._entries.pop(chat_id, None)
+        self._bytes -= self._sizes.pop(chat_id, 0)
+        dirty = self._dirty.pop(chat_id, None)
+        evicting = self._evicting.pop(chat_id, None)
+        return chat or dirty or evicting
+
+    async def mark_dirty(self, chat) -> None:
+        """Schedule a write for the chat, or write it now when write-behind is off"""
+        if not self.enabled or self._task is None:
+            await chat.flush_async()
+            return
+        self._dirty[chat.id] = chat
+        if chat.id in self._entries:
+            self._resize(chat)
+            self._evict()
+        else:
+            self.put(chat)
+
+    def pending_chats(self) -> List[object]:
+        """Chats whose latest changes are not in the database yet"""
+        return list(self._dirty.values()) + list(self._evicting.values())
+
+    def unflushed_new_chats(self) -> List[object]:
+        """Chats created in memory that the database does not know about yet"""
+        return [chat for chat in self.pending_chats() if chat.is_new]
+
+    async def flush_dirty(self) -> int:
+        dirty, self._dirty = self._dirty, {}
+        await asyncio.gather(*(chat.flush_async() for chat in dirty.values()))
+        self.flushes += len(dirty)
+        return len(dirty)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                flushed = await self.flush_dirty()
+                if flushed:
+                    app_logger.info(f"Chat cache wrote behind {flushed} chats")
+            except Exception as e:
+                app_logger.error(f"Chat cache write-behind failed: {e}")
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the write-behind task and write everything that is still dirty"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        flushed = await self.flush_dirty()
+        if self._eviction_tasks:
+            await asyncio.gather(*self._eviction_tasks, return_exceptions=True)
+        app_logger.info(f"Chat cache flushed {flushed} chats on shutdown")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "dirty": len(self._dirty) + len(self._evicting),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "flushes": self.flushes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Global chat cache
+chat_cache = ChatCache()
@@ -0,0 +1,176 @@
+import os
+from typing import List, Optional, Union
+from dotenv import load_dotenv
+from logger import app_logger
+from tracing import span
+from admission import admit, Overloaded
+
+try:
+    import tiktoken
+except ImportError:  # optional, token counts are estimated from the text length without it
+    tiktoken = None
+
+load_dotenv()
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # max tokens of history sent with a turn
+CONTEXT_KEEP_MESSAGES = int(os.getenv("CONTEXT_KEEP_MESSAGES", "4"))  # latest messages that are never summarized
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "400"))
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "gpt-4o")
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+summary_instructions = f"""You maintain a running summary of a conversation between a user and a travel planning assistant.
+You get the current summary (may be empty) and the messages that are being removed from the conversation.
+Return an updated summary in at most {CONTEXT_SUMMARY_TOKENS} tokens. Keep every travel detail the user gave
+(departure and arrival locations, dates, budget, preferences, travellers), the options that were selected and
+anything the assistant asked that is still unanswered. Write in the language of the conversation, no preamble."""
+
+_summary_agent = None
+
+
+def summary_agent():
+    """The summary agent, built on first use so importing this module does not load the agents SDK"""
+    global _summary_agent
+    if _summary_agent is None:
+        from agents import Agent
+
+        _summary_agent = Agent(
+            name="ConversationSummaryAgent",
+            instructions=summary_instructions,
+            output_type=str,
+            model=CONTEXT_SUMMARY_MODEL,
+        )
+    return _summary_agent
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+        except KeyError:
+            _encoding = tiktoken.get_encoding("o200k_base")
+    return len(_encoding.encode(text))
+
+
+def render_content(content) -> str:
+    """Plain text of a message content, assistant Content lists become their texts and links"""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for item in content:
+        text = item.get("text") if isinstance(item, dict) else item.text
+        link = item.get("link") if isinstance(item, dict) else item.link
+        parts.append(f"{text} ({link})" if link else text)
+    return "\n".join(parts)
+
+
+def render_plan(plan) -> str:
+    if not plan:
+        return ""
+    if isinstance(plan, str):
+        return f"\nPlan: {plan}"
+    return "\nPlan: " + "; ".join(f"day {item.day_number} {item.hour} {item.activity_title}" for item in plan)
+
+
+def render_message(message) -> str:
+    """One history line for a RequestMessage / ResponseMessage or a {"role", "content"} dict"""
+    if isinstance(message, dict):
+        role, content, plan = message["role"], message["content"], message.get("plan")
+    else:
+        role, content, plan = message.role, message.content, getattr(message, "plan", None)
+    if role == "user":
+        return f"User: {render_content(content)}"
+    return f"Assistant: {render_content(content)}{render_plan(plan)}"
+
+
+def build_context(input_text: str, conversation_history: Optional[Union[str, List[dict]]] = None) -> str:
+    """Prompt for a turn, from an already rendered history string or a list of messages"""
+    if not conversation_history:
+        return input_text
+    if isinstance(conversation_history, str):
+        return f"{conversation_history}\nUser: {input_text}"
+    return "\n".join([render_message(message) for message in conversation_history] + [f"User: {input_text}"])
+
+
+class ChatContext:
+    """Rendered, token counted history of one chat, kept under a token budget.
+
+    Messages are rendered once as they are appended. When the history grows over
+    `budget` tokens the oldest lines are folded into a rolling summary written by
+    `summary_agent()`, down to half the budget so this does not happen every turn.
+    Lives next to the Chat in memory and is rebuilt after a reload.
+    """
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, keep_messages: int = CONTEXT_KEEP_MESSAGES):
+        self.budget = budget
+        self.keep_messages = keep_messages
+        self.summary = ""
+        self.summary_tokens = 0
+        self._lines: List[str] = []
+        self._tokens: List[int] = []
+        self._rendered = 0  # messages of the chat rendered so far, including summarized ones
+        self._total = 0
+        self.summaries = 0
+
+    @property
+    def tokens(self) -> int:
+        return self._total + self.summary_tokens
+
+    def sync(self, messages: list) -> None:
+        """Render the messages appended since the last call"""
+        if len(messages) < self._rendered:
+            # messages went away, start over
+            self.__init__(self.budget, self.keep_messages)
+        for message in messages[self._rendered:]:
+            line = render_message(message)
+            tokens = count_tokens(line)
+            self._lines.append(line)
+            self._tokens.append(tokens)
+            self._total += tokens
+        self._rendered = len(messages)
+
+    async def compact(self) -> None:
+        """Fold the oldest lines into the summary while the history is over budget"""
+        if self.budget <= 0 or self.tokens <= self.budget:
+            return
+        target = self.budget // 2
+        fold = 0
+        remaining = self.tokens
+        while len(self._lines) - fold > self.keep_messages and remaining > target:
+            remaining -= self._tokens[fold]
+            fold += 1
+        if fold == 0:
+            return
+        folded = self._lines[:fold]
+        from agents import Runner
+
+        try:
+            async with admit("openai", "summary"):
+                with span("summary"):
+                    result = await Runner.run(
+                        summary_agent(),
+                        input=f"Current summary: {self.summary or '(none)'}\n\nMessages to fold in:\n" + "\n".join(folded),
+                    )
+            summary = result.final_output
+        except Overloaded:
+            # turn the request away rather than dropping history unsummarized
+            raise
+        except Exception as e:
+            # keep the history as it is, this turn goes over budget and the next one tries again
+            app_logger.warning(f"Could not summarize conversation history, keeping the {fold} oldest messages: {e}")
+            return
+        self.summary = summary
+        self.summary_tokens = count_tokens(SUMMARY_PREFIX + summary) if summary else 0
+        self._total -= sum(self._tokens[:fold])
+        del self._lines[:fold]
+        del self._tokens[:fold]
+        self.summaries += 1
+        app_logger.info(f"Folded {fold} messages into the conversation summary, history is now {self.tokens} tokens")
+
+    def render(self) -> str:
+        lines = [SUMMARY_PREFIX + self.summary] if self.summary else []
+        return "\n".join(lines + self._lines)
@@ -0,0 +1,75 @@
+import json
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional
+from pydantic import ValidationError
+from models.Message import PlanItem
+from logger import app_logger
+
+if TYPE_CHECKING:
+    from agents import RunResultStreaming
+
+# tools whose output is a json array of PlanItems
+PLAN_TOOLS = {"trip_plan"}
+
+
+def parse_plan_items(output) -> List[PlanItem]:
+    """Parse the PlanItems out of a trip_plan tool output, skipping anything that does not validate"""
+    if isinstance(output, str):
+        text = output.strip()
+        # models sometimes wrap the array in a markdown code fence
+        if text.startswith("```"):
+            text = text.strip("`")
+            text = text[text.find("["):] if "[" in text else text
+        try:
+            output = json.loads(text)
+        except ValueError:
+            return []
+    if not isinstance(output, list):
+        return []
+    items = []
+    for raw in output:
+        try:
+            items.append(raw if isinstance(raw, PlanItem) else PlanItem.model_validate(raw))
+        except ValidationError:
+            continue
+    return items
+
+
+def _field(raw, name: str) -> Optional[str]:
+    # raw items are pydantic models for calls and plain dicts for outputs
+    if isinstance(raw, dict):
+        return raw.get(name)
+    return getattr(raw, name, None)
+
+
+async def translate_stream(result: "RunResultStreaming") -> AsyncIterator[dict]:
+    """Turn agents SDK stream events into the events of our SSE endpoint.
+
+    Yields {"event": name, "data": dict} for text deltas, tool call start/finish,
+    handoffs and every PlanItem as soon as trip_plan returns. The final output is
+    left on `result.final_output`.
+    """
+    tool_names = {}
+    async for event in result.stream_events():
+        if event.type == "raw_response_event":
+            if getattr(event.data, "type", None) == "response.output_text.delta":
+                yield {"event": "delta", "data": {"text": event.data.delta}}
+        elif event.type == "agent_updated_stream_event":
+            yield {"event": "agent", "data": {"name": event.new_agent.name}}
+        elif event.type == "run_item_stream_event":
+            item = event.item
+            if event.name == "tool_called":
+                call_id = _field(item.raw_item, "call_id")
+                name = _field(item.raw_item, "name")
+                tool_names[call_id] = name
+                yield {"event": "tool_call_started", "data": {"call_id": call_id, "name": name, "arguments": _field(item.raw_item, "arguments")}}
+            elif event.name == "tool_output":
+                call_id = _field(item.raw_item, "call_id")
+                name = tool_names.get(call_id)
+                yield {"event": "tool_call_finished", "data": {"call_id": call_id, "name": name}}
+                if name in PLAN_TOOLS:
+                    for plan_item in parse_plan_items(item.output):
+                        yield {"event": "plan_item", "data": plan_item.model_dump()}
+            elif event.name == "handoff_occured":
+                target = getattr(item, "target_agent", None)
+                yield {"event": "handoff", "data": {"to": target.name if target else None}}
+    app_logger.info(f"Stream finished after {result.current_turn} turns")
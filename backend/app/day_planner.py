@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import re
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+from agents import Agent, Runner
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from admission import admit, fan_out
+from logger import app_logger
+from models.Message import PlanItem
+from tracing import span
+from stage_hooks import StageHooks
+
+load_dotenv()
+TRIP_PLAN_PARALLEL = os.getenv("TRIP_PLAN_PARALLEL", "1") == "1"  # plan trips a few days per LLM call, concurrently
+TRIP_PLAN_MIN_DAYS = int(os.getenv("TRIP_PLAN_MIN_DAYS", "3"))  # shorter trips are planned in one call
+TRIP_PLAN_DAYS_PER_TASK = int(os.getenv("TRIP_PLAN_DAYS_PER_TASK", "1"))  # consecutive days planned by one call
+TRIP_PLAN_CONCURRENCY = int(os.getenv("TRIP_PLAN_CONCURRENCY", "4"))  # calls of one plan running at once
+TRIP_PLAN_DAY_RETRIES = int(os.getenv("TRIP_PLAN_DAY_RETRIES", "2"))  # extra attempts for a call that fails or returns bad items
+TRIP_PLAN_MAX_DAYS = int(os.getenv("TRIP_PLAN_MAX_DAYS", "30"))  # longer spans are more likely misread dates, planned in one call
+
+# "2025-11-03" or "2025-11-03T09:15" anywhere in the selected options
+MOMENT = re.compile(r"\b(\d{4}-\d{2}-\d{2})(?:[T ](\d{1,2}:\d{2}))?")
+# the "Trip: ..." line pick_options adds
+TRIP_LINE = re.compile(r"Trip: [^\n]*?(\d{4}-\d{2}-\d{2}) to (\d{4}-\d{2}-\d{2})")
+
+
+class DayPlan(BaseModel):
+    items: List[PlanItem]
+
+
+day_planner_agent = Agent(
+    name="TripDayPlannerAgent",
+    instructions=(
+        "You plan a single day or a few days of a longer trip, the other days are planned separately. "
+        "Using the selected options for flight, hotel, and car rental, plan only the days you are asked for: divide each day into morning/afternoon/evening and suggest activities and food. "
+        "Make each day distinct and fitting for its place in the trip, and respect the flight constraints you are given. "
+        "Every item has day_number (the day's number in the whole trip), hour (HH:MM 24h), activity_title and activity_content."
+    ),
+    output_type=DayPlan,
+    model="gpt-4o-mini",
+)
+
+
+def trip_window(selected_options: str) -> Optional[Tuple[date, date, Optional[str], Optional[str]]]:
+    """(first day, last day, outbound flight time, return flight time) from the dates in the selected options"""
+    moments = []
+    for day, hour in MOMENT.findall(selected_options):
+        try:
+            moments.append((date.fromisoformat(day), hour or None))
+        except ValueError:
+            continue
+    if not moments:
+        return None
+    first, last = min(day for day, _ in moments), max(day for day, _ in moments)
+    line = TRIP_LINE.search(selected_options)
+    if line is not None:
+        try:
+            first, last = date.fromisoformat(line.group(1)), date.fromisoformat(line.group(2))
+        except ValueError:
+            pass
+    outbound = next((hour for day, hour in moments if day == first and hour), None)
+    inbound = next((hour for day, hour in reversed(moments) if day == last and hour), None)
+    return first, last, outbound, inbound
+
+
+def _day_notes(number: int, days: int, outbound: Optional[str], inbound: Optional[str]) -> str:
+    if number == 1 and days > 1:
+        leaves = f"leaves at {outbound}" if outbound else "time is in the selected options"
+        return "the arrival day, the outbound flight " + leaves + ". Start the activities after landing and checking in"
+    if number == days:
+        leaves = f"leaves at {inbound}" if inbound else "time is in the selected options"
+        return "the departure day, the return flight " + leaves + ". End the activities in time to reach the airport two hours before"
+    return "a full day at the destination"
+
+
+async def _plan_chunk(numbers: List[int], first: date, days: int, outbound, inbound, selected_options: str, preferences: str, limit: asyncio.Semaphore) -> List[PlanItem]:
+    lines = "\n".join(
+        f"- Day {number} of {days} ({(first + timedelta(days=number - 1)).isoformat()}): {_day_notes(number, days, outbound, inbound)}."
+        for number in numbers
+    )
+    prompt = f"Plan these days:\n{lines}\nSelected options: {selected_options}\nUser preferences and budget: {preferences}"
+    error = None
+    for attempt in range(TRIP_PLAN_DAY_RETRIES + 1):
+        try:
+            async with limit:
+                async with admit("openai", "trip_plan"):
+                    with span("trip_plan_days"):
+                        result = await Runner.run(day_planner_agent, input=prompt, hooks=StageHooks())
+            items = result.final_output.items
+            missing = set(numbers) - {item.day_number for item in items}
+            if missing:
+                raise ValueError(f"no items for day {', '.join(map(str, sorted(missing)))}")
+            # a day that wandered into another task's range is dropped, not duplicated
+            return [item for item in items if item.day_number in numbers]
+        except Exception as e:
+            error = e
+            app_logger.warning(f"Planning day {numbers[0]}-{numbers[-1]} failed (attempt {attempt + 1}): {e}")
+    raise RuntimeError(f"could not plan day {numbers[0]}-{numbers[-1]}: {error}")
+
+
+async def plan_days(selected_options: str, preferences: str) -> Optional[str]:
+    """The trip plan as a JSON array of PlanItems, planned in concurrent chunks of days.
+
+    Returns None when the trip is too short for it or its dates can't be read
+    from the selected options, then the plan is made in one call. A chunk that
+    fails is retried on its own; if it still fails, None is returned as well.
+    """
+    if not TRIP_PLAN_PARALLEL:
+        return None
+    window = trip_window(selected_options)
+    if window is None:
+        return None
+    first, last, outbound, inbound = window
+    days = (last - first).days + 1
+    if days < max(TRIP_PLAN_MIN_DAYS, 2) or days > TRIP_PLAN_MAX_DAYS:
+        return None
+    size = max(TRIP_PLAN_DAYS_PER_TASK, 1)
+    chunks = [list(range(start, min(start + size, days + 1))) for start in range(1, days + 1, size)]
+    limit = asyncio.Semaphore(max(TRIP_PLAN_CONCURRENCY, 1))
+    # each chunk is its own LLM call and takes its own admission
+    with span("trip_plan", mode="parallel"):
+        async with fan_out():
+            results = await asyncio.gather(
+                *(_plan_chunk(chunk, first, days, outbound, inbound, selected_options, preferences, limit) for chunk in chunks),
+                return_exceptions=True,
+            )
+    failed = [result for result in results if isinstance(result, BaseException)]
+    if failed:
+        app_logger.error(f"Parallel trip plan failed, planning it in one call: {failed[0]}")
+        return None
+    items = [item for chunk in results for item in sorted(chunk, key=lambda item: item.day_number)]
+    app_logger.info(f"Planned {days} days in {len(chunks)} parallel calls")
+    return json.dumps([item.model_dump() for item in items], ensure_ascii=False)
@@ -1,8 +1,12 @@
-from agents import Agent, handoff, Runner
-from travelAgent import TravelAgent, run_travel_agent
-from typing import List, Optional
+from agents import Agent, handoff, Runner, RunResultStreaming
+from travelAgent import travelAgent
+from typing import List, Optional, Union
 from models.Message import Content, OutputResponse
 from logger import app_logger
+from chat_context import build_context
+from tracing import span
+from stage_hooks import StageHooks
+from admission import admit
 
 
 guardian_instructions = """You are a friendly and excited guardian agent that ensures the user provides all necessary information for travel planning.
@@ -18,10 +22,9 @@ Once all information is provided, you will handoff the conversation to the trave
 IMPORTANT: You have access to the full conversation history. Use this context to understand what information has already been provided and what is still missing. Reference previous messages when asking for missing information."""
 
 
-agent=TravelAgent()
-
+# hands off to the travel agent instance of travelAgent.py rather than building a second one
 travelAgentHandoff = handoff(
-    agent=agent,
+    agent=travelAgent,
     tool_description_override="This tool is called once the user has provided all necessary travel information. It helps plan the trip based on the user's preferences and budget."
 )
 
@@ -39,22 +42,18 @@ class GuardianAgent(Agent):
 guardian_agent = GuardianAgent()
 
 
-async def run_guardian_agent(input_text: str, conversation_history: Optional[List[dict]] = None):
-    """Run the guardian agent with the given input text and conversation history."""
-    # Build context from conversation history if provided
+async def run_guardian_agent(input_text: str, conversation_history: Optional[Union[str, List[dict]]] = None):
+    """Run the guardian agent with the given input text and conversation history (rendered string or message dicts)."""
     app_logger.info("Running Guardian Agent")
-    context = input_text
-    if conversation_history:
-        context_parts = []
-        for message in conversation_history:
-            role = message["role"]
-            content = message["content"]
-            if role == "user":
-                context_parts.append(f"User: {content}")
-            elif role == "assistant":
-                context_parts.append(f"Assistant: {content}")
-        context_parts.append(f"User: {input_text}")
-        context = "\n".join(context_parts)
-    
-    result = await Runner.run(guardian_agent, input=context)
+    context = build_context(input_text, conversation_history)
+    async with admit("openai", "guardian"):
+        with span("guardian"):
+            result = await Runner.run(guardian_agent, input=context, hooks=StageHooks())
     return result.final_output
+
+
+def run_guardian_agent_streamed(input_text: str, conversation_history: Optional[Union[str, List[dict]]] = None) -> RunResultStreaming:
+    """Start the guardian agent in streaming mode, iterate `stream_events()` of the result and read `final_output` at the end."""
+    app_logger.info("Running Guardian Agent (streamed)")
+    context = build_context(input_text, conversation_history)
+    return Runner.run_streamed(guardian_agent, input=context, hooks=StageHooks())
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import re
+from typing import List, Optional
+from dotenv import load_dotenv
+from mcp_cache import MCPResultCache
+from models.Message import OutputResponse
+from normalize import fold_text
+from slot_extractor import ABLATIVE, CITIES, DATIVE, DAY_MONTH, DEPARTURE_WORDS, LOCATIVE, MONTH_DAY, MONTHS, NUMERIC_DATE, RETURN_WORDS, SLOTS, TripSlots
+
+load_dotenv()
+ITINERARY_CACHE_SIZE = int(os.getenv("ITINERARY_CACHE_SIZE", "256"))  # max cached itineraries in memory, 0 disables the cache
+ITINERARY_CACHE_TTL = float(os.getenv("ITINERARY_CACHE_TTL", "1800"))  # seconds, a plan quotes fares that go stale
+ITINERARY_CACHE_DIR = os.getenv("ITINERARY_CACHE_DIR", "")  # optional on-disk tier that survives restarts, off when empty
+ITINERARY_CACHE_DISK_SIZE = int(os.getenv("ITINERARY_CACHE_DISK_SIZE", "2000"))  # max files kept in ITINERARY_CACHE_DIR
+
+# words that say "plan me a trip" in some way without changing what the plan should look like
+FILLER_WORDS = {
+    "merhaba", "selam", "lutfen", "bir", "bu", "ve", "ile", "icin", "ben", "bana", "benim", "mi", "mu", "misin", "musun",
+    "istiyorum", "isterim", "gitmek", "gidip", "gidecegim", "gidiyorum", "donup", "donecegim", "donmek", "donus", "gidis",
+    "tatil", "tatili", "gezi", "gezisi", "seyahat", "seyahati", "plan", "planla", "planlar", "planlamak", "planlayabilir",
+    "hi", "hello", "please", "i", "i'd", "i'll", "i'm", "me", "my", "a", "an", "the", "and", "to", "from", "on", "in", "at",
+    "for", "of", "want", "would", "like", "help", "can", "you", "could", "trip", "holiday", "vacation", "travel",
+    "visit", "fly", "flying", "leave", "coming", "come", "go", "going", "back", "return", "returning",
+}
+
+
+def _is_city(word: str) -> bool:
+    base = word.partition("'")[0]
+    if base in CITIES:
+        return True
+    return any(word.endswith(ending) and word[:-len(ending)] in CITIES for ending in ABLATIVE + DATIVE + LOCATIVE)
+
+
+def preference_words(texts: List[str]) -> List[str]:
+    """What the user asked for beyond the trip slots: folded words without cities, dates and filler, sorted"""
+    words = set()
+    for text in texts:
+        folded = fold_text(text)
+        for pattern in (NUMERIC_DATE, DAY_MONTH, MONTH_DAY):
+            folded = pattern.sub(" ", folded)
+        for word in re.findall(r"[a-z]+(?:'[a-z]+)?", folded):
+            if word in FILLER_WORDS or word in MONTHS or word in RETURN_WORDS or word in DEPARTURE_WORDS or _is_city(word):
+                continue
+            words.add(word.partition("'")[0])
+    words.discard("")
+    return sorted(words - FILLER_WORDS)
+
+
+def itinerary_key(slots: TripSlots, texts: List[str], language: str) -> dict:
+    """Cache arguments of a trip: the slots, the reply language and a hash of the preference words"""
+    preferences = hashlib.sha256(" ".join(preference_words(texts)).encode("utf-8")).hexdigest()[:16]
+    key = {slot: getattr(slots, slot) for slot in SLOTS}
+    key.update(language=language, preferences=preferences)
+    return key
+
+
+async def get_itinerary(key: dict) -> Optional[OutputResponse]:
+    value = await itinerary_cache.get("itinerary", key)
+    return OutputResponse(**value) if value is not None else None
+
+
+async def put_itinerary(key: dict, response: OutputResponse) -> None:
+    # only finished plans, a question back to the user depends on more than the key
+    if getattr(response, "plan", None):
+        await itinerary_cache.put("itinerary", key, response.model_dump(mode="json"))
+
+
+# Global cache of complete travel agent replies, same TTL + LRU cache as the MCP results
+itinerary_cache = MCPResultCache(
+    max_entries=ITINERARY_CACHE_SIZE,
+    ttls={},
+    default_ttl=ITINERARY_CACHE_TTL,
+    directory=ITINERARY_CACHE_DIR,
+    max_files=ITINERARY_CACHE_DISK_SIZE,
+)
@@ -0,0 +1,252 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+from dotenv import load_dotenv
+from logger import app_logger, request_id_ctx
+from models.Chat import Chat
+from schemas import JobSchema, RequestMessageSchema
+from tracing import request_trace, span
+from unit_of_work import lock_chat, unit_of_work
+
+load_dotenv()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # trip pipelines running at once
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))  # jobs waiting for a worker, more are rejected
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))  # seconds a job may run, 0 for no limit
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))  # seconds a finished job stays pollable
+JOB_EVENT_HISTORY = int(os.getenv("JOB_EVENT_HISTORY", "2000"))  # events kept per job for late subscribers
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "30"))  # seconds shutdown waits for running jobs
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised by submit when no more jobs may wait, retry_after is a hint in seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Job queue is full")
+        self.retry_after = retry_after
+
+
+class Job:
+    """One queued turn of a chat, with the stream events it has produced so far"""
+
+    def __init__(self, chat_id: str, message: RequestMessageSchema, request_id: str):
+        self.id = str(uuid.uuid4())
+        self.chat_id = chat_id
+        self.message = message
+        self.request_id = request_id
+        self.status = QUEUED
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.finished = 0.0  # monotonic, for expiry
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._events: List[dict] = []
+        self._dropped = 0  # events trimmed off the front of _events
+        self._updated = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def publish(self, event: dict) -> None:
+        self._events.append(event)
+        if len(self._events) > JOB_EVENT_HISTORY:
+            del self._events[0]
+            self._dropped += 1
+        # wake every subscriber, the next wait uses a fresh event
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    def set_status(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        if status == RUNNING:
+            self.started_at = datetime.utcnow()
+        elif self.done:
+            self.finished_at = datetime.utcnow()
+            self.finished = time.monotonic()
+        self.publish({"event": "status", "data": {"status": status, "error": error}})
+
+    async def follow(self) -> AsyncIterator[dict]:
+        """Every event from the start of the job (as far as still kept), until it is done"""
+        position = 0
+        while True:
+            while position < self._dropped + len(self._events):
+                index = max(position - self._dropped, 0)
+                position = self._dropped + index + 1
+                yield self._events[index]
+            if self.done:
+                return
+            await self._updated.wait()
+
+    def to_schema(self) -> JobSchema:
+        return JobSchema(
+            id=self.id,
+            chat_id=self.chat_id,
+            status=self.status,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            result=self.result,
+            error=self.error,
+        )
+
+
+class JobManager:
+    """Runs chat turns as background jobs on a fixed number of worker tasks.
+
+    Jobs wait in a bounded queue, `submit` raises JobQueueFull when it is full.
+    A job runs in its own unit of work with the chat locked, exactly like a
+    streamed turn, so its reply is committed to the chat whether or not anyone
+    is still polling. Finished jobs stay available for `result_ttl` seconds.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE, timeout: float = JOB_TIMEOUT, result_ttl: float = JOB_RESULT_TTL):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+        self.running = 0
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.avg_seconds = 0.0  # moving average of job run time, for Retry-After
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._accepting = True
+        app_logger.info(f"Job manager started with {self.workers} workers and room for {self.queue_size} queued jobs")
+
+    async def stop(self, timeout: float = JOB_SHUTDOWN_TIMEOUT) -> None:
+        """Stop taking jobs, give the queued and running ones `timeout` seconds, then cancel the rest"""
+        self._accepting = False
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            app_logger.warning(f"{self.running} running and {self._queue.qsize()} queued jobs did not finish before shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            job.set_status(FAILED, "Server shut down before the job ran")
+            self.failed += 1
+
+    def submit(self, chat_id: str, message: RequestMessageSchema) -> Job:
+        self._prune()
+        if not self._accepting:
+            raise JobQueueFull(self.retry_after())
+        job = Job(chat_id, message, request_id_ctx.get())
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull(self.retry_after())
+        self._jobs[job.id] = job
+        self.submitted += 1
+        app_logger.info(f"Job ID={job.id} queued for chat ID={chat_id}, {self._queue.qsize()} jobs waiting")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        return self._jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        """Seconds until a worker is likely free for one more job"""
+        waiting = self._queue.qsize() if self._queue is not None else 0
+        estimate = self.avg_seconds * (waiting + 1) / max(self.workers, 1)
+        return max(1, int(estimate + 0.5))
+
+    def _prune(self) -> None:
+        # jobs finish roughly in submission order, so expired ones gather at the front
+        now = time.monotonic()
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if not job.done or now - job.finished <= self.result_ttl:
+                break
+            del self._jobs[job.id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                self.running += 1
+                await self._run(job)
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        # the job's logs carry the id of the request that submitted it
+        request_id_ctx.set(job.request_id)
+        job.set_status(RUNNING)
+        started = time.perf_counter()
+        try:
+            with request_trace("job"), span("job"):
+                if self.timeout > 0:
+                    await asyncio.wait_for(self._turn(job), self.timeout)
+                else:
+                    await self._turn(job)
+        except asyncio.CancelledError:
+            job.set_status(FAILED, "Job was cancelled")
+            self.failed += 1
+            raise
+        except Exception as e:
+            error = f"Job timed out after {self.timeout:g} seconds" if isinstance(e, asyncio.TimeoutError) else str(e)
+            app_logger.error(f"Job ID={job.id} for chat ID={job.chat_id} failed: {error}")
+            job.publish({"event": "error", "data": {"detail": error}})
+            job.set_status(FAILED, error)
+            self.failed += 1
+            return
+        finally:
+            seconds = time.perf_counter() - started
+            self.avg_seconds = seconds if self.avg_seconds == 0 else 0.8 * self.avg_seconds + 0.2 * seconds
+        job.set_status(SUCCEEDED)
+        self.succeeded += 1
+        app_logger.info(f"Job ID={job.id} for chat ID={job.chat_id} finished in {seconds:.2f}s")
+
+    async def _turn(self, job: Job) -> None:
+        # same as the stream endpoint: the chat stays locked until the reply is committed
+        async with unit_of_work():
+            await lock_chat(job.chat_id)
+            chat = await Chat.get_chat(job.chat_id)
+            if chat is None:
+                raise LookupError("Chat not found")
+            async for event in chat.add_message_streamed(job.message):
+                job.publish(event)
+                if event["event"] == "message":
+                    job.result = event["data"]
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_seconds": round(self.avg_seconds, 3),
+            "kept": len(self._jobs),
+        }
+
+
+# Global job manager, its workers are started in the app lifespan
+job_manager = JobManager()
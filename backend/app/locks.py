@@ -0,0 +1,52 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict
+
+
+class KeyedLocks:
+    """One asyncio.Lock per key, dropped again once nobody holds or waits for it."""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    async def acquire(self, key: str) -> None:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            await lock.acquire()
+        except BaseException:
+            # cancelled while waiting, we never got the lock
+            self._drop_user(key)
+            raise
+
+    def release(self, key: str) -> None:
+        self._locks[key].release()
+        self._drop_user(key)
+
+    def _drop_user(self, key: str) -> None:
+        self._users[key] -= 1
+        if self._users[key] == 0:
+            del self._users[key]
+            del self._locks[key]
+
+    def locked(self, key: str) -> bool:
+        lock = self._locks.get(key)
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+# Global per chat id locks, serialize every mutation of the same chat
+chat_locks = KeyedLocks()
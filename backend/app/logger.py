@@ -1,11 +1,23 @@
 import logging
+import queue
 import sys
+import threading
+import time
 import uuid
 import requests
+from requests.adapters import HTTPAdapter
 from contextvars import ContextVar
 import os 
 from dotenv import load_dotenv
 load_dotenv()
+OPENSEARCH_URL = os.getenv("OPENSEARCH_URL", "http://wegathon-opensearch.uzlas.com:2021/teams-ingest-pipeline/ingest")  # empty disables shipping
+OPENSEARCH_QUEUE_SIZE = int(os.getenv("OPENSEARCH_QUEUE_SIZE", "10000"))  # records waiting to be shipped
+OPENSEARCH_BATCH_SIZE = int(os.getenv("OPENSEARCH_BATCH_SIZE", "200"))
+OPENSEARCH_FLUSH_INTERVAL = float(os.getenv("OPENSEARCH_FLUSH_INTERVAL", "2.0"))  # max seconds a record waits in the queue
+OPENSEARCH_QUEUE_POLICY = os.getenv("OPENSEARCH_QUEUE_POLICY", "drop")  # drop | block, when the queue is full
+OPENSEARCH_BLOCK_TIMEOUT = float(os.getenv("OPENSEARCH_BLOCK_TIMEOUT", "0.5"))  # max seconds "block" waits before dropping
+OPENSEARCH_TIMEOUT = float(os.getenv("OPENSEARCH_TIMEOUT", "5"))
+OPENSEARCH_CLOSE_TIMEOUT = float(os.getenv("OPENSEARCH_CLOSE_TIMEOUT", "10"))
 
 # ContextVar for request IDs
 request_id_ctx = ContextVar("request_id", default="-")
@@ -19,34 +31,146 @@ class RequestIdFilter(logging.Filter):
         return True
 
 class OpenSearchHandler(logging.Handler):
-    """Custom log handler that sends logs to OpenSearch ingest pipeline."""
+    """Log handler that ships records to the OpenSearch ingest pipeline in batches.
 
-    def __init__(self, url: str, username: str, password: str):
+    `emit` only formats the record and puts it on a bounded queue, a background
+    thread posts the queued entries over a pooled session once `batch_size` are
+    waiting or `flush_interval` seconds have passed. When the queue is full the
+    record is dropped ("drop") or the caller waits up to `block_timeout` for room
+    ("block"). `flush` waits for everything queued so far, `close` flushes and
+    stops the thread.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        username: str,
+        password: str,
+        queue_size: int = OPENSEARCH_QUEUE_SIZE,
+        batch_size: int = OPENSEARCH_BATCH_SIZE,
+        flush_interval: float = OPENSEARCH_FLUSH_INTERVAL,
+        policy: str = OPENSEARCH_QUEUE_POLICY,
+        block_timeout: float = OPENSEARCH_BLOCK_TIMEOUT,
+    ):
         super().__init__()
         self.url = url
         self.auth = (username, password)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._stop = object()
+        self._flush = object()
+        self._closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._worker = threading.Thread(target=self._run, name="opensearch-log-shipper", daemon=True)
+        self._worker.start()
 
     def emit(self, record):
-        log_entry = self.format(record)
+        try:
+            entry = {
+                "team": "abiento",             # 🔹 you can make this dynamic
+                "user": os.getenv("opensearch_user"),            # 🔹 static or from your context
+                "action": record.levelname,    # INFO, ERROR, DEBUG, etc.
+                "message": self.format(record)
+            }
+            if self._closed:
+                raise queue.Full
+            if self.policy == "block":
+                self._queue.put(entry, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            batch, taken, stopping = self._next_batch()
+            if batch:
+                self._send(batch)
+            for _ in range(taken):
+                self._queue.task_done()
+            if stopping:
+                break
+        self.session.close()
+
+    def _next_batch(self):
+        """Wait for a full batch, the flush interval, a flush request or the stop marker.
 
-        payload = [{
-            "team": "abiento",             # 🔹 you can make this dynamic
-            "user": os.getenv("opensearch_user"),            # 🔹 static or from your context
-            "action": record.levelname,    # INFO, ERROR, DEBUG, etc.
-            "message": log_entry
-        }]
+        Returns (entries, queue items taken, stopping).
+        """
+        batch, taken = [], 0
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = self.flush_interval if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            taken += 1
+            if entry is self._stop:
+                return batch, taken, True
+            if entry is self._flush:
+                break
+            batch.append(entry)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch, taken, False
 
+    def _send(self, batch):
         try:
-            requests.post(
-                self.url,
-                json=payload,
-                headers={"Content-Type": "application/json"},
-                auth=self.auth,
-                timeout=2
-            )
+            response = self.session.post(self.url, json=batch, auth=self.auth, timeout=OPENSEARCH_TIMEOUT)
+            response.raise_for_status()
+            self.sent += len(batch)
+            self.batches += 1
         except Exception as e:
+            self.failed += len(batch)
             # fallback: still log locally if OpenSearch fails
-            logging.getLogger("fallback").error(f"Failed to send log to OpenSearch: {e}")
+            logging.getLogger("fallback").error(f"Failed to send {len(batch)} logs to OpenSearch: {e}")
+
+    def flush(self, timeout: float = OPENSEARCH_CLOSE_TIMEOUT):
+        """Ship everything queued so far, waiting at most timeout seconds"""
+        if self._closed or not self._worker.is_alive():
+            return
+        try:
+            self._queue.put(self._flush, timeout=timeout)
+        except queue.Full:
+            return
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks and time.monotonic() < deadline:
+                self._queue.all_tasks_done.wait(deadline - time.monotonic())
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            try:
+                self._queue.put(self._stop, timeout=OPENSEARCH_CLOSE_TIMEOUT)
+                self._worker.join(OPENSEARCH_CLOSE_TIMEOUT)
+            except queue.Full:
+                pass
+        super().close()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
 
 def setup_logger(name: str) -> logging.Logger:
     logger = logging.getLogger(name)
@@ -63,16 +187,30 @@ def setup_logger(name: str) -> logging.Logger:
         logger.addHandler(stream_handler)
 
         # OpenSearch handler
-        os_handler = OpenSearchHandler(
-            url="http://wegathon-opensearch.uzlas.com:2021/teams-ingest-pipeline/ingest",
-            username=os.getenv("opensearch_user"),  
-            password=os.getenv("opensearch_key")  
-        )
-        os_handler.setFormatter(formatter)
-        os_handler.addFilter(RequestIdFilter())
-        logger.addHandler(os_handler)
+        if OPENSEARCH_URL:
+            os_handler = OpenSearchHandler(
+                url=OPENSEARCH_URL,
+                username=os.getenv("opensearch_user"),  
+                password=os.getenv("opensearch_key")  
+            )
+            os_handler.setFormatter(formatter)
+            os_handler.addFilter(RequestIdFilter())
+            logger.addHandler(os_handler)
 
     return logger
 
 # Global logger
 app_logger = setup_logger("ai_trip_planner")
+
+
+def log_shipping_stats() -> dict:
+    for handler in app_logger.handlers:
+        if isinstance(handler, OpenSearchHandler):
+            return handler.stats()
+    return {}
+
+
+def flush_logs() -> None:
+    """Wait until the queued log records are shipped, called on shutdown"""
+    for handler in app_logger.handlers:
+        handler.flush()
@@ -1,16 +1,73 @@
-from fastapi import FastAPI, Body, Request
+import time
+_import_started = time.perf_counter()
+import asyncio
+from fastapi import FastAPI, Body, Request, Query, Response
+from contextlib import asynccontextmanager
+from sse_starlette.sse import EventSourceResponse
+import json
 from fastapi import HTTPException
 from dotenv import load_dotenv
 import os 
 load_dotenv()
-from models.Chat import Chat
-from schemas import RequestMessageSchema, ChatSchema, ResponseMessageSchema
-from typing import List
-from logger import app_logger, request_id_ctx, generate_request_id
+from models.Chat import Chat, encode_cursor, decode_cursor
+from schemas import RequestMessageSchema, ChatSchema, ResponseMessageSchema, ChatSummarySchema, ChatPageSchema, JobSchema
+from typing import List, Optional, Union
+from logger import app_logger, request_id_ctx, generate_request_id, flush_logs, log_shipping_stats
+from storage import get_store, run_blocking
+from unit_of_work import unit_of_work, lock_chat
+from chat_cache import chat_cache
+from mcp_pool import mcp_pool
+from mcp_cache import mcp_cache
+from itinerary_cache import itinerary_cache
+from single_flight import search_flights, tool_flights
+from slot_extractor import route_counts
+from tracing import metrics, request_trace, request_seconds
+from jobs import job_manager, JobQueueFull
+from admission import Overloaded, admission_stats
+from warmup import startup
+from responses import FastJSONResponse
+from fastapi.responses import PlainTextResponse, JSONResponse
 from contextvars import ContextVar
 import uuid
 
-app = FastAPI(title="AI Trip Planner API")
+def register_gauges() -> None:
+    """Gauges that read the components' own counters at scrape time"""
+    metrics.gauge("trip_planner_chat_cache_hit_ratio", "Chat cache hit ratio", lambda: chat_cache.stats()["hit_rate"])
+    metrics.gauge("trip_planner_chat_cache_dirty", "Chats waiting for write-behind", lambda: chat_cache.stats()["dirty"])
+    metrics.gauge("trip_planner_mcp_pool_sessions", "MCP sessions by state", lambda: {(("state", "idle"),): mcp_pool.stats()["idle"], (("state", "in_use"),): mcp_pool.stats()["in_use"]})
+    metrics.gauge("trip_planner_mcp_cache_hit_ratio", "MCP result cache hit ratio", lambda: mcp_cache.stats()["hit_rate"])
+    metrics.gauge("trip_planner_itinerary_cache_hit_ratio", "Itinerary cache hit ratio", lambda: itinerary_cache.stats()["hit_rate"])
+    metrics.gauge("trip_planner_single_flight_coalesced", "Upstream calls saved by coalescing", lambda: {(("group", group.name),): group.coalesced for group in (search_flights, tool_flights)})
+    metrics.gauge("trip_planner_slot_routes", "Turns by slot fast path route", lambda: {(("route", route),): count for route, count in route_counts.items()})
+    metrics.gauge("trip_planner_jobs", "Trip planning jobs by state", lambda: {(("state", "queued"),): job_manager.stats()["queued"], (("state", "running"),): job_manager.stats()["running"]})
+    metrics.gauge("trip_planner_admission_in_use", "Weight units held per admission limiter", lambda: {(("upstream", name),): stats["in_use"] for name, stats in admission_stats().items()})
+    metrics.gauge("trip_planner_admission_waiting", "Calls queued per admission limiter", lambda: {(("upstream", name),): stats["waiting"] for name, stats in admission_stats().items()})
+    metrics.gauge("trip_planner_ready", "1 once the startup warm-up has finished", lambda: int(startup.ready))
+    metrics.gauge("trip_planner_startup_seconds", "Startup time by phase", lambda: {(("phase", phase),): seconds for phase, seconds in startup.stats()["phases"].items()})
+    metrics.gauge("trip_planner_logs_dropped", "Log records dropped by the OpenSearch shipper", lambda: log_shipping_stats().get("dropped", 0))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    register_gauges()
+    chat_cache.start()
+    await run_blocking(mcp_cache.prune_disk)
+    await run_blocking(itinerary_cache.prune_disk)
+    job_manager.start()
+    # build the agents and spawn the MCP server processes once, requests borrow them from the pool
+    await startup.start()
+    yield
+    await startup.stop()
+    # running jobs still need the MCP pool and commit through the chat cache
+    await job_manager.stop()
+    await mcp_pool.close()
+    # write back everything the cache still holds before the process exits
+    await chat_cache.stop()
+    get_store().close()
+    # ship the queued log records before the process exits
+    await asyncio.to_thread(flush_logs)
+
+app = FastAPI(title="AI Trip Planner API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 origins = [
     "http://localhost:3000",   # Next.js dev server
@@ -27,13 +84,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded) -> JSONResponse:
+    # 429 when the wait queue of an upstream is full, 503 when the wait for capacity timed out
+    return JSONResponse({"detail": str(exc)}, status_code=exc.status_code, headers={"Retry-After": str(exc.retry_after)})
+
+# registered before add_request_id so it runs inside it and the commit is logged with the request id
+@app.middleware("http")
+async def flush_dirty_chats(request: Request, call_next):
+    # every chat changed by the request is committed once, after the endpoint returns
+    async with unit_of_work():
+        response = await call_next(request)
+    return response
+
 @app.middleware("http")
 async def add_request_id(request: Request, call_next):
     request_id = generate_request_id()
     request_id_ctx.set(request_id)
 
     app_logger.info(f"Incoming request: {request.method} {request.url}")
-    response = await call_next(request)
+    started = time.perf_counter()
+    # stage timings of the request are logged as one breakdown when it ends
+    with request_trace(f"{request.method} {request.url.path}"):
+        response = await call_next(request)
+    route = request.scope.get("route")
+    request_seconds.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        route=route.path if route is not None else "unmatched",
+        status=str(response.status_code),
+    )
     response.headers["X-Request-ID"] = request_id
     app_logger.info(f"Response status: {response.status_code}")
     return response
@@ -44,47 +124,166 @@ MCP_BASE_URL = os.getenv("mcp_base_url")
 
 #implement them one by one 
 
+# the chat endpoints hand their schema to FastJSONResponse, response_model only documents them
 @app.post("/api/chat", response_model=ChatSchema)
 async def add_chat():
     # create a runtime Chat instance
     new_chat = Chat()
     schema=new_chat.to_schema() #convert to schema for response
-    print(f"New chat added: {schema}")
-    return schema
+    app_logger.info(f"Chat created: {schema.id}")
+    return FastJSONResponse(schema)
 
 @app.delete("/api/chat/{chat_id}")
 async def delete_chat(chat_id: str) -> dict:
-    deleted = Chat.delete_chat(chat_id)
+    await lock_chat(chat_id)
+    deleted = await Chat.delete_chat(chat_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Chat not found")
-    print(f"Chat deleted: {chat_id}")
     return {f"message": "Chat with id {chat_id} deleted successfully"}
 
-@app.get("/api/chats")
-async def get_chats() -> List[ChatSchema]:
-    chats = Chat.get_chats() #returns list of all chats, no user for now 
-    print(f"Chats fetched: {chats}")
-    schemas = [chat.to_schema() for chat in chats]
-    return schemas
+@app.get("/api/chats", response_model=Union[ChatPageSchema, List[ChatSchema]])
+async def get_chats(
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
+):
+    if limit is None and cursor is None:
+        chats = await Chat.get_chats() #returns list of all chats, no user for now 
+        app_logger.info(f"Chats fetched: {len(chats)}")
+        schemas = [chat.to_schema() for chat in chats]
+        return FastJSONResponse(schemas)
+    # paginated listing for the sidebar, metadata only, newest first
+    try:
+        decoded = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items, next_cursor = await Chat.list_chats(limit or 50, decoded)
+    return FastJSONResponse(ChatPageSchema(
+        items=[ChatSummarySchema(**item) for item in items],
+        next_cursor=encode_cursor(next_cursor) if next_cursor else None,
+    ))
     
 
-@app.get("/api/chat/{chat_id}")
-async def get_chat(chat_id: str) -> ChatSchema:
-    chat = Chat.get_chat(chat_id)
-    print(f"Chat fetched: {chat}")
+@app.get("/api/chat/{chat_id}", response_model=ChatSchema)
+async def get_chat(chat_id: str) -> FastJSONResponse:
+    chat = await Chat.get_chat(chat_id)
+    if chat is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    app_logger.debug(f"Chat fetched: {chat_id} ({len(chat.messages)} messages)")
     #returns chat with all messages
     schema = chat.to_schema()
-    return schema
+    return FastJSONResponse(schema)
 
 
-@app.post("/api/chat/{chat_id}/message")
-async def chat_with_llm(chat_id: str, message: RequestMessageSchema = Body(...)) -> ResponseMessageSchema:
-    chat = Chat.get_chat(chat_id)
+@app.post("/api/chat/{chat_id}/message", response_model=ResponseMessageSchema)
+async def chat_with_llm(chat_id: str, message: RequestMessageSchema = Body(...)) -> FastJSONResponse:
+    # held until the request's changes are committed, so turns on the same chat never interleave
+    await lock_chat(chat_id)
+    chat = await Chat.get_chat(chat_id)
+    if chat is None:
+        # deleted while we were waiting for the lock
+        raise HTTPException(status_code=404, detail="Chat not found")
     response=await chat.add_message(message) #this will call the llm to generate a response
     response_schema=ResponseMessageSchema(role="assistant", content=response.contents, plan =response.plan if hasattr(response, 'plan') else None)
-    return response_schema
+    return FastJSONResponse(response_schema)
+
+
+@app.post("/api/chat/{chat_id}/message/stream")
+async def chat_with_llm_stream(chat_id: str, message: RequestMessageSchema = Body(...)):
+    # Server-Sent Events: delta, agent, handoff, tool_call_started, tool_call_finished, plan_item, then message (or error)
+    if await Chat.get_chat(chat_id) is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    async def event_stream():
+        # the body is sent after the request middleware has returned, so the stream commits its own
+        # unit of work and logs its own stage breakdown
+        with request_trace("POST /api/chat/{chat_id}/message/stream"):
+            async with unit_of_work():
+                await lock_chat(chat_id)
+                chat = await Chat.get_chat(chat_id)
+                if chat is None:
+                    yield {"event": "error", "data": json.dumps({"detail": "Chat not found"})}
+                    return
+                try:
+                    async for event in chat.add_message_streamed(message):
+                        yield {"event": event["event"], "data": json.dumps(event["data"])}
+                except Overloaded as e:
+                    # the status line is already sent, the client retries from the event
+                    yield {"event": "error", "data": json.dumps({"detail": str(e), "retry_after": e.retry_after})}
+                except Exception as e:
+                    app_logger.error(f"Streaming message for chat ID={chat_id} failed: {e}")
+                    yield {"event": "error", "data": json.dumps({"detail": str(e)})}
+
+    return EventSourceResponse(event_stream())
+
+
+@app.post("/api/chat/{chat_id}/jobs", status_code=202)
+async def submit_chat_job(chat_id: str, response: Response, message: RequestMessageSchema = Body(...)) -> JobSchema:
+    # the turn runs on a job worker, poll GET /api/jobs/{id} or follow GET /api/jobs/{id}/events
+    if await Chat.get_chat(chat_id) is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    try:
+        job = job_manager.submit(chat_id, message)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    return job.to_schema()
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str) -> JobSchema:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_schema()
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def follow_job(job_id: str):
+    # Server-Sent Events: status changes plus the same events as the stream endpoint, replayed from the start
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for event in job.follow():
+            yield {"event": event["event"], "data": json.dumps(event["data"])}
+
+    return EventSourceResponse(event_stream())
+
+
+@app.get("/api/stats")
+async def get_stats() -> dict:
+    # storage read/write counters, a read-only endpoint must leave "writes" untouched
+    return {
+        "storage": get_store().stats(),
+        "chat_cache": chat_cache.stats(),
+        "mcp_pool": mcp_pool.stats(),
+        "mcp_cache": mcp_cache.stats(),
+        "itinerary_cache": itinerary_cache.stats(),
+        "single_flight": {search_flights.name: search_flights.stats(), tool_flights.name: tool_flights.stats()},
+        "slot_fast_path": route_counts,
+        "jobs": job_manager.stats(),
+        "admission": admission_stats(),
+        "log_shipping": log_shipping_stats(),
+        "startup": startup.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    # Prometheus text format: stage/request histograms, stage error and handoff counters, cache and pool gauges
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready_check():
+    # 503 until the agents are built and the MCP warm-up has finished or given up, for load balancers
+    return JSONResponse(startup.stats(), status_code=200 if startup.ready else 503)
+
+
+startup.imported(_import_started)
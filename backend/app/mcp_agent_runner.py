@@ -9,6 +9,7 @@ load_dotenv(override=True)
 from agents.mcp.util import create_static_tool_filter, MCPUtil
 from agents import tool
 from logger import app_logger
+from mcp_pool import mcp_pool, MCPSessionPool
 
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -29,32 +30,19 @@ class MCPAgentRunner:
     def __init__(self, 
                  name: str = "AssistantWithMCP",
                  instructions: str = instructions,
-                 command: str = "npx",
-                 args: Optional[list] = None,
+                 pool: Optional[MCPSessionPool] = None,
                  ):
-        if args is None:
-            args = ["-y", "mcp-remote", "https://mcp.enuygun.com/mcp"]
-
-        self.command = command
-        self.args = args
+        # MCP server processes are borrowed from the shared pool instead of spawned per run
+        self.pool = pool or mcp_pool
         self.agent_name = name
         self.instructions = instructions
         self.mcp_server: Optional[MCPServerStdio] = None
         self.agent: Optional[Agent] = None
         self.conversation_history: List[dict] = []
 
-    async def _setup(self):
-        """Initialize MCP server and agent."""
-        self.mcp_server = MCPServerStdio(
-            name="enuygun-mcp",
-            params={"command": self.command, "args": self.args},
-            client_session_timeout_seconds=60.0,  # wait up to 60 seconds
-            cache_tools_list=True,                 # optional, avoids round trips
-            max_retry_attempts=2,                  # optional, adds retries
-            retry_backoff_seconds_base=2.0        # optional, adds exponential backoff on retries
-        )
-        await self.mcp_server.__aenter__()  # manually enter async context
-
+    def _setup(self, mcp_server: MCPServerStdio):
+        """Build the agent around a borrowed MCP server."""
+        self.mcp_server = mcp_server
         self.agent = Agent(
             name=self.agent_name,
             instructions=self.instructions,
@@ -64,9 +52,6 @@ class MCPAgentRunner:
     async def run(self, input_text: str, conversation_history: Optional[List[dict]] = None):
         """Run the agent with the given input text and conversation history."""
         app_logger.info("Running MCP Agent Runner")
-        if self.mcp_server is None or self.agent is None:
-            await self._setup()
-        
         # Update conversation history if provided
         if conversation_history is not None:
             self.conversation_history = conversation_history
@@ -74,18 +59,20 @@ class MCPAgentRunner:
         # Add current user message to history
         self.conversation_history.append({"role": "user", "content": input_text})
         
-        try:
-            # Create context from conversation history
-            context = self._build_context_from_history()
-            result = await Runner.run(starting_agent=self.agent, input=context)
-            
-            # Add assistant response to history
-            assistant_content = result.final_output
-            self.conversation_history.append({"role": "assistant", "content": assistant_content})
-            
-            return result.final_output
-        finally:
-            await self.close()
+        async with self.pool.session() as mcp_server:
+            try:
+                self._setup(mcp_server)
+                # Create context from conversation history
+                context = self._build_context_from_history()
+                result = await Runner.run(starting_agent=self.agent, input=context)
+                
+                # Add assistant response to history
+                assistant_content = result.final_output
+                self.conversation_history.append({"role": "assistant", "content": assistant_content})
+                
+                return result.final_output
+            finally:
+                await self.close()
     
     def _build_context_from_history(self) -> str:
         """Build context string from conversation history."""
@@ -112,11 +99,9 @@ class MCPAgentRunner:
         self.conversation_history = []
 
     async def close(self):
-        """Clean up MCP server properly."""
-        if self.mcp_server:
-            await self.mcp_server.__aexit__(None, None, None)
-            self.mcp_server = None
-            self.agent = None
+        """Drop the borrowed MCP server, the pool owns its lifetime."""
+        self.mcp_server = None
+        self.agent = None
 
 
 # Example usage
@@ -137,5 +122,6 @@ if __name__ == "__main__":
         print(f"Response time: {end_time - start_time} seconds")
         print("Final output:", response)
         await session.close()
+        await mcp_pool.close()
 
     asyncio.run(main())
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+from logger import app_logger
+from normalize import canonical_key
+from storage import atomic_write, run_blocking
+
+load_dotenv()
+MCP_CACHE_SIZE = int(os.getenv("MCP_CACHE_SIZE", "1024"))  # max cached results in memory, 0 disables the cache
+MCP_CACHE_TTL = float(os.getenv("MCP_CACHE_TTL", "600"))  # seconds, for tools without their own ttl
+# fares go stale a lot faster than hotel and car lists
+MCP_CACHE_TTLS = {
+    "flight_search": float(os.getenv("MCP_CACHE_TTL_FLIGHT", "300")),
+    "hotel_search": float(os.getenv("MCP_CACHE_TTL_HOTEL", "3600")),
+    "car_search": float(os.getenv("MCP_CACHE_TTL_CAR", "1800")),
+}
+MCP_CACHE_DIR = os.getenv("MCP_CACHE_DIR", "")  # optional on-disk tier that survives restarts, off when empty
+MCP_CACHE_DISK_SIZE = int(os.getenv("MCP_CACHE_DISK_SIZE", "10000"))  # max files kept in MCP_CACHE_DIR
+
+
+class MCPResultCache:
+    """TTL + LRU cache of MCP tool results keyed by tool name and canonicalized arguments.
+
+    Entries live in memory and, when `directory` is set, also as one json file per
+    key so they survive restarts. Expiry uses wall clock time so the disk entries
+    stay valid across processes. Only successful results are cached.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = MCP_CACHE_SIZE,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = MCP_CACHE_TTL,
+        directory: str = MCP_CACHE_DIR,
+        max_files: int = MCP_CACHE_DISK_SIZE,
+    ):
+        self.max_entries = max_entries
+        self.ttls = ttls if ttls is not None else MCP_CACHE_TTLS
+        self.default_ttl = default_ttl
+        self.directory = directory
+        self.max_files = max_files
+        self._entries: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expired = 0
+        self.tool_hits: Dict[str, int] = {}
+        self.tool_misses: Dict[str, int] = {}
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def ttl(self, tool_name: str) -> float:
+        return self.ttls.get(tool_name, self.default_ttl)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    async def get(self, tool_name: str, arguments: dict):
+        """Cached result for the call, or None"""
+        if not self.enabled:
+            return None
+        key = canonical_key(tool_name, arguments)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.time():
+            del self._entries[key]
+            self.expired += 1
+            entry = None
+        if entry is None and self.directory:
+            entry = await run_blocking(self._read_file, key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+        if entry is None:
+            self.misses += 1
+            self.tool_misses[tool_name] = self.tool_misses.get(tool_name, 0) + 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.tool_hits[tool_name] = self.tool_hits.get(tool_name, 0) + 1
+        return entry[1]
+
+    async def put(self, tool_name: str, arguments: dict, value) -> None:
+        if not self.enabled:
+            return
+        key = canonical_key(tool_name, arguments)
+        entry = (time.time() + self.ttl(tool_name), value)
+        self._remember(key, entry)
+        self.stores += 1
+        if self.directory:
+            try:
+                await run_blocking(self._write_file, key, tool_name, entry)
+            except (OSError, TypeError, ValueError) as e:
+                app_logger.warning(f"Could not write MCP cache entry for {tool_name}: {e}")
+
+    def _remember(self, key: str, entry: Tuple[float, object]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _read_file(self, key: str) -> Optional[Tuple[float, object]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        # the file name is a hash, make sure it is really our key
+        if data.get("key") != key:
+            return None
+        if data["expires_at"] <= time.time():
+            self.expired += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return data["expires_at"], data["value"]
+
+    def _write_file(self, key: str, tool_name: str, entry: Tuple[float, object]) -> None:
+        data = {"key": key, "tool": tool_name, "expires_at": entry[0], "value": entry[1]}
+        atomic_write(self._path(key), json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def prune_disk(self) -> int:
+        """Remove expired files and the oldest ones above max_files, returns how many were removed"""
+        if not self.directory:
+            return 0
+        now = time.time()
+        files = []
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as file:
+                    expires_at = json.load(file)["expires_at"]
+            except (OSError, ValueError, KeyError):
+                expires_at = 0
+            if expires_at <= now:
+                os.remove(entry.path)
+                removed += 1
+            else:
+                files.append((entry.stat().st_mtime, entry.path))
+        files.sort()
+        for _, path in files[:max(len(files) - self.max_files, 0)]:
+            os.remove(path)
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "tools": {
+                tool: {"hits": self.tool_hits.get(tool, 0), "misses": self.tool_misses.get(tool, 0)}
+                for tool in sorted(set(self.tool_hits) | set(self.tool_misses))
+            },
+        }
+
+
+# Global MCP result cache
+mcp_cache = MCPResultCache()
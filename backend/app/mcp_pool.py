@@ -0,0 +1,320 @@
+import asyncio
+import os
+import shlex
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional, Set
+from dotenv import load_dotenv
+from logger import app_logger
+from tracing import span, record_stage
+
+load_dotenv()
+MCP_COMMAND = os.getenv("MCP_COMMAND", "npx")
+MCP_ARGS = shlex.split(os.getenv("MCP_ARGS", "-y mcp-remote https://mcp.enuygun.com/mcp"))
+MCP_POOL_MIN = int(os.getenv("MCP_POOL_MIN", "1"))  # sessions kept warm
+MCP_POOL_MAX = int(os.getenv("MCP_POOL_MAX", "4"))
+MCP_POOL_IDLE_SECONDS = float(os.getenv("MCP_POOL_IDLE_SECONDS", "300"))  # idle sessions above the minimum are reaped after this
+MCP_POOL_HEALTH_INTERVAL = float(os.getenv("MCP_POOL_HEALTH_INTERVAL", "30"))
+MCP_PING_TIMEOUT = float(os.getenv("MCP_PING_TIMEOUT", "5"))
+MCP_POOL_CLOSE_TIMEOUT = float(os.getenv("MCP_POOL_CLOSE_TIMEOUT", "10"))  # seconds shutdown waits for borrowed sessions to come back
+
+
+class PooledMCPSession:
+    """One long-lived MCP server process.
+
+    The stdio client has to be entered and exited by the same task, so each session
+    is owned by a small task that opens the server, waits until asked to stop and
+    closes it again. Borrowers just use `server`.
+    """
+
+    def __init__(self, command: str, args: list):
+        # imported on first spawn, it pulls in the whole agents and mcp stack
+        from agents.mcp import MCPServerStdio
+
+        self.server = MCPServerStdio(
+            name="enuygun-mcp",
+            params={"command": command, "args": args},
+            client_session_timeout_seconds=60.0,  # wait up to 60 seconds
+            cache_tools_list=True,                 # tool list is fetched once per process, not per run
+            max_retry_attempts=2,
+            retry_backoff_seconds_base=2.0,
+        )
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def open(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self) -> None:
+        try:
+            async with self.server:
+                self._ready.set()
+                await self._stop.wait()
+        except BaseException as e:
+            if not self._ready.is_set():
+                # the stdio client cancels through its own scope when the server dies, that must not
+                # reach the borrower as a CancelledError of its own task
+                self._error = e if isinstance(e, Exception) else ConnectionError(f"MCP server exited during startup: {e!r}")
+                self._ready.set()
+            elif not isinstance(e, asyncio.CancelledError):
+                app_logger.warning(f"MCP session exited with error: {e}")
+
+    @property
+    def alive(self) -> bool:
+        return self._task is not None and not self._task.done() and self.server.session is not None
+
+    async def ping(self, timeout: float = MCP_PING_TIMEOUT) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.server.session.send_ping(), timeout)
+            self.last_checked = time.monotonic()
+            return True
+        except Exception as e:
+            app_logger.warning(f"MCP session failed health check: {e}")
+            return False
+
+    async def close(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, MCP_POOL_CLOSE_TIMEOUT)
+            except (asyncio.TimeoutError, Exception) as e:
+                app_logger.warning(f"MCP session did not close cleanly: {e}")
+
+
+class MCPSessionPool:
+    """Process wide pool of long-lived MCP sessions.
+
+    Keeps `min_size` sessions warm and grows up to `max_size` under load. Idle
+    sessions are health checked (and replaced when dead) and the ones above the
+    minimum are reaped after `idle_seconds`. A session not checked for
+    `health_interval` is pinged again when it is borrowed. Once the pool is
+    closed, borrowed sessions are closed when they come back.
+    """
+
+    def __init__(
+        self,
+        command: str = MCP_COMMAND,
+        args: Optional[list] = None,
+        min_size: int = MCP_POOL_MIN,
+        max_size: int = MCP_POOL_MAX,
+        idle_seconds: float = MCP_POOL_IDLE_SECONDS,
+        health_interval: float = MCP_POOL_HEALTH_INTERVAL,
+    ):
+        self.command = command
+        self.args = args if args is not None else MCP_ARGS
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.idle_seconds = idle_seconds
+        self.health_interval = health_interval
+        self._idle: Deque[PooledMCPSession] = deque()
+        self._size = 0  # idle + borrowed + being spawned
+        self._cond = asyncio.Condition()
+        self._maintenance: Optional[asyncio.Task] = None
+        self._closed = False
+        # closes of sessions found dead while idle, awaited on shutdown
+        self._close_tasks: Set[asyncio.Task] = set()
+        self.spawn_count = 0
+        self.spawn_failures = 0
+        self.reconnects = 0
+        self.reaped = 0
+        self.borrows = 0
+        self.borrow_wait_total = 0.0
+        self.borrow_wait_max = 0.0
+
+    async def _spawn(self) -> PooledMCPSession:
+        session = PooledMCPSession(self.command, self.args)
+        started = time.monotonic()
+        try:
+            with span("mcp_spawn"):
+                await session.open()
+        except BaseException:
+            self.spawn_failures += 1
+            raise
+        self.spawn_count += 1
+        app_logger.info(f"Spawned MCP session in {time.monotonic() - started:.2f}s (total spawned: {self.spawn_count})")
+        return session
+
+    async def _checkout(self) -> Optional[PooledMCPSession]:
+        """An idle live session, or None after reserving room to spawn one"""
+        async with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("MCP pool is closed")
+                while self._idle:
+                    session = self._idle.pop()
+                    if session.alive:
+                        return session
+                    # died while idle, make room for a replacement
+                    self._size -= 1
+                    self.reconnects += 1
+                    task = asyncio.create_task(session.close())
+                    self._close_tasks.add(task)
+                    task.add_done_callback(self._close_tasks.discard)
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+                await self._cond.wait()
+
+    async def acquire(self) -> PooledMCPSession:
+        started = time.monotonic()
+        while True:
+            session = await self._checkout()
+            if session is None:
+                break
+            # same check as the reaper, for sessions it has not looked at lately
+            if time.monotonic() - session.last_checked < self.health_interval or await session.ping():
+                self._record_wait(started)
+                return session
+            self.reconnects += 1
+            await self.release(session, broken=True)
+        # spawn outside the condition so other borrowers are not blocked behind it
+        try:
+            session = await self._spawn()
+        except BaseException:
+            async with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._record_wait(started)
+        return session
+
+    def _record_wait(self, started: float) -> None:
+        waited = time.monotonic() - started
+        record_stage("mcp_borrow_wait", waited)
+        self.borrows += 1
+        self.borrow_wait_total += waited
+        self.borrow_wait_max = max(self.borrow_wait_max, waited)
+
+    async def release(self, session: PooledMCPSession, broken: bool = False) -> None:
+        if broken or self._closed or not session.alive:
+            # closed before it leaves the count, so close() knows the subprocess is gone
+            await session.close()
+            async with self._cond:
+                self._size -= 1
+                self._cond.notify_all()
+            return
+        session.last_used = time.monotonic()
+        async with self._cond:
+            self._idle.append(session)
+            self._cond.notify()
+
+    @asynccontextmanager
+    async def session(self):
+        """Borrow a connected MCPServerStdio, it goes back to the pool afterwards"""
+        session = await self.acquire()
+        broken = False
+        try:
+            yield session.server
+        except BaseException:
+            # we can't tell whether the failure was the session's, check it before reuse
+            broken = not await session.ping()
+            raise
+        finally:
+            await self.release(session, broken=broken)
+
+    async def _fill(self) -> None:
+        while True:
+            async with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                session = await self._spawn()
+            except Exception as e:
+                async with self._cond:
+                    self._size -= 1
+                app_logger.error(f"Could not spawn MCP session: {e}")
+                return
+            await self.release(session)
+
+    async def _check_idle(self) -> None:
+        now = time.monotonic()
+        async with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        keep, drop = [], []
+        for session in idle:
+            if self._size - len(drop) > self.min_size and now - session.last_used > self.idle_seconds:
+                self.reaped += 1
+                drop.append(session)
+            elif now - session.last_checked >= self.health_interval and not await session.ping():
+                self.reconnects += 1
+                drop.append(session)
+            else:
+                keep.append(session)
+        async with self._cond:
+            self._idle.extend(keep)
+            self._size -= len(drop)
+            self._cond.notify(len(drop) + len(keep))
+        for session in drop:
+            await session.close()
+
+    async def _maintain(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.health_interval, self.idle_seconds))
+            try:
+                await self._check_idle()
+                await self._fill()
+            except Exception as e:
+                app_logger.error(f"MCP pool maintenance failed: {e}")
+
+    async def start(self) -> None:
+        """Spawn the minimum number of sessions and start health checks and idle reaping"""
+        await self._fill()
+        if self._maintenance is None:
+            self._maintenance = asyncio.create_task(self._maintain())
+
+    async def close(self) -> None:
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+            try:
+                await self._maintenance
+            except asyncio.CancelledError:
+                pass
+            self._maintenance = None
+        async with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            # borrowers waiting for a session get the "closed" error
+            self._cond.notify_all()
+        await asyncio.gather(*(session.close() for session in idle), *self._close_tasks, return_exceptions=True)
+        borrowed = self._size
+        if borrowed:
+            # borrowed sessions are closed by release(), wait for them so no subprocess outlives the app
+            try:
+                async with self._cond:
+                    await asyncio.wait_for(self._cond.wait_for(lambda: self._size <= 0), MCP_POOL_CLOSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                app_logger.warning(f"MCP pool closed with {self._size} sessions still borrowed")
+        app_logger.info(f"MCP pool closed {len(idle)} idle and {borrowed - max(self._size, 0)} borrowed sessions")
+
+    def stats(self) -> dict:
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "in_use": self._size - len(self._idle),
+            "spawn_count": self.spawn_count,
+            "spawn_failures": self.spawn_failures,
+            "reconnects": self.reconnects,
+            "reaped": self.reaped,
+            "borrows": self.borrows,
+            "borrow_wait_avg": self.borrow_wait_total / self.borrows if self.borrows else 0.0,
+            "borrow_wait_max": self.borrow_wait_max,
+        }
+
+
+# Global MCP session pool, started in the FastAPI lifespan
+mcp_pool = MCPSessionPool()
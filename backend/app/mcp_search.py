@@ -0,0 +1,230 @@
+import asyncio
+import functools
+import json
+import os
+import time
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from logger import app_logger
+from mcp_cache import mcp_cache
+from mcp_pool import mcp_pool
+from normalize import canonical_key
+from single_flight import tool_flights
+from tracing import span
+from admission import admit, fan_out, Overloaded
+
+load_dotenv()
+MCP_SEARCH_TIMEOUT = float(os.getenv("MCP_SEARCH_TIMEOUT", "30"))  # seconds, per tool call
+SEARCH_TIMEOUTS = {
+    "flight_search": float(os.getenv("MCP_FLIGHT_SEARCH_TIMEOUT", str(MCP_SEARCH_TIMEOUT))),
+    "hotel_search": float(os.getenv("MCP_HOTEL_SEARCH_TIMEOUT", str(MCP_SEARCH_TIMEOUT))),
+    "car_search": float(os.getenv("MCP_CAR_SEARCH_TIMEOUT", str(MCP_SEARCH_TIMEOUT))),
+}
+
+# key of each tool's result in the merged payload
+SEARCH_TOOLS = {"flight_search": "flights", "hotel_search": "hotels", "car_search": "cars"}
+
+# schema property names each of our trip fields may appear under, per tool.
+# properties are compared lowercased with "_" and "-" removed.
+ARGUMENT_ALIASES = {
+    "flight_search": {
+        "departure_location": ["origin", "from", "departure", "departurelocation", "departurecity", "origincity", "fromcity"],
+        "arrival_location": ["destination", "to", "arrival", "arrivallocation", "arrivalcity", "destinationcity", "tocity"],
+        "departure_date": ["departuredate", "date", "departure_date", "outbounddate", "fromdate"],
+        "return_date": ["returndate", "inbounddate", "todate"],
+    },
+    "hotel_search": {
+        "arrival_location": ["location", "city", "destination", "query", "arrivallocation", "place"],
+        "departure_date": ["checkin", "checkindate", "startdate", "fromdate", "departuredate"],
+        "return_date": ["checkout", "checkoutdate", "enddate", "todate", "returndate"],
+    },
+    "car_search": {
+        "arrival_location": ["location", "city", "pickuplocation", "pickupcity", "dropofflocation", "dropoffcity", "returnlocation", "arrivallocation"],
+        "departure_date": ["pickupdate", "startdate", "fromdate", "departuredate", "date"],
+        "return_date": ["dropoffdate", "returndate", "enddate", "todate"],
+    },
+}
+
+# counts nobody asked us about but the tools may require
+DEFAULT_COUNTS = {"adults", "adult", "adultcount", "passengers", "passengercount", "guests", "guestcount", "rooms", "roomcount"}
+
+
+def _normalize(name: str) -> str:
+    return name.lower().replace("_", "").replace("-", "")
+
+
+def build_arguments(tool_name: str, trip: Dict[str, str], schema: Optional[dict] = None) -> dict:
+    """Map our trip fields onto the input schema of an MCP search tool.
+
+    Without a schema the trip fields are passed under their own names. Raises
+    ValueError when the schema requires a property we have no value for.
+    """
+    if not schema or not schema.get("properties"):
+        return {field: value for field, value in trip.items() if value}
+    lookup = {}
+    for field, aliases in ARGUMENT_ALIASES.get(tool_name, {}).items():
+        for alias in [field] + aliases:
+            lookup.setdefault(_normalize(alias), field)
+    arguments = {}
+    for prop, spec in schema["properties"].items():
+        field = lookup.get(_normalize(prop))
+        if field is not None and trip.get(field):
+            arguments[prop] = trip[field]
+        elif _normalize(prop) in DEFAULT_COUNTS and "default" not in spec:
+            arguments[prop] = 1
+    missing = [prop for prop in schema.get("required", []) if prop not in arguments]
+    if missing:
+        raise ValueError(f"{tool_name} requires {', '.join(missing)} which the trip details do not provide")
+    return arguments
+
+
+def parse_tool_result(result):
+    """Pull the payload out of a CallToolResult, json decoded when possible"""
+    if result.isError:
+        text = " ".join(getattr(item, "text", "") for item in result.content)
+        raise RuntimeError(text or "tool returned an error")
+    if result.structuredContent:
+        return result.structuredContent
+    parts = []
+    for item in result.content:
+        text = getattr(item, "text", None)
+        if text is None:
+            continue
+        try:
+            parts.append(json.loads(text))
+        except ValueError:
+            parts.append(text)
+    return parts[0] if len(parts) == 1 else parts
+
+
+# input schemas of the MCP tools, fetched once so cache lookups don't need a session
+_schemas: Optional[Dict[str, dict]] = None
+
+
+async def _list_schemas() -> Dict[str, dict]:
+    global _schemas
+    async with mcp_pool.session() as server:
+        with span("mcp_list_tools"):
+            _schemas = {tool.name: tool.inputSchema for tool in await server.list_tools()}
+    return _schemas
+
+
+async def tool_schemas() -> Dict[str, dict]:
+    if _schemas is None:
+        return await tool_flights.do("list_tools", _list_schemas)
+    return _schemas
+
+
+async def _call(server, tool_name: str, arguments: dict, timeout: float):
+    started = time.monotonic()
+    try:
+        with span("mcp_tool", tool=tool_name):
+            result = await asyncio.wait_for(server.call_tool(tool_name, arguments), timeout)
+        return parse_tool_result(result), None, time.monotonic() - started
+    except asyncio.TimeoutError:
+        return None, f"timed out after {timeout:.0f}s", time.monotonic() - started
+    except Exception as e:
+        return None, str(e) or type(e).__name__, time.monotonic() - started
+
+
+class _SessionLease:
+    """One pooled session shared by the tool calls of a fan-out.
+
+    Borrowed by the first call that needs it and given back when the last one
+    finishes. The calls run as single-flight tasks that can outlive the search
+    that started them, so the lease follows the calls and not the search.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._borrow = None
+        self._server = None
+        self._users = 0
+
+    async def __aenter__(self):
+        async with self._lock:
+            if self._borrow is None:
+                borrow = mcp_pool.session()
+                self._server = await borrow.__aenter__()
+                self._borrow = borrow
+            self._users += 1
+            return self._server
+
+    async def __aexit__(self, *exc_info):
+        async with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                borrow, self._borrow, self._server = self._borrow, None, None
+                await borrow.__aexit__(*exc_info)
+
+
+async def _fetch(lease: _SessionLease, tool_name: str, arguments: dict):
+    try:
+        async with admit("mcp", "mcp_call"):
+            async with lease as server:
+                data, error, elapsed = await _call(server, tool_name, arguments, SEARCH_TIMEOUTS[tool_name])
+    except Overloaded as e:
+        # like any failed search, only this tool's list stays empty
+        return None, str(e), 0.0
+    if error is None:
+        await mcp_cache.put(tool_name, arguments, data)
+    return data, error, elapsed
+
+
+async def search_travel_options(departure_location: str, arrival_location: str, departure_date: str, return_date: str) -> dict:
+    """Run flight, hotel and car search concurrently on one pooled MCP session.
+
+    Returns {"flights": ..., "hotels": ..., "cars": ..., "errors": {...}, "timings": {...}, "cached": [...]}.
+    A tool that fails or times out leaves its list empty and an entry in "errors",
+    the other results are still returned. Results come from `mcp_cache` when fresh,
+    a session is only borrowed for the tools that missed, and a call identical to
+    one already in flight waits for that one instead of going to the server again.
+    """
+    trip = {
+        "departure_location": departure_location,
+        "arrival_location": arrival_location,
+        "departure_date": departure_date,
+        "return_date": return_date,
+    }
+    payload = {key: [] for key in SEARCH_TOOLS.values()}
+    errors, timings, cached = {}, {}, []
+    started = time.monotonic()
+    schemas = await tool_schemas()
+    pending = {}
+    for tool_name in SEARCH_TOOLS:
+        if tool_name not in schemas:
+            errors[tool_name] = "not offered by the MCP server"
+            continue
+        try:
+            arguments = build_arguments(tool_name, trip, schemas[tool_name])
+        except ValueError as e:
+            errors[tool_name] = str(e)
+            continue
+        data = await mcp_cache.get(tool_name, arguments)
+        if data is not None:
+            payload[SEARCH_TOOLS[tool_name]] = data
+            cached.append(tool_name)
+        else:
+            pending[tool_name] = arguments
+    if pending:
+        # a single MCP session multiplexes concurrent requests, no need to borrow one per tool
+        lease = _SessionLease()
+        # the tool calls run in parallel, each takes its own global and MCP admission
+        async with fan_out():
+            results = await asyncio.gather(*(
+                tool_flights.do(canonical_key(tool_name, arguments), functools.partial(_fetch, lease, tool_name, arguments))
+                for tool_name, arguments in pending.items()
+            ))
+        for tool_name, (data, error, elapsed) in zip(pending, results):
+            timings[tool_name] = round(elapsed, 3)
+            if error is not None:
+                errors[tool_name] = error
+            else:
+                payload[SEARCH_TOOLS[tool_name]] = data
+    for tool_name, error in errors.items():
+        app_logger.warning(f"MCP {tool_name} failed: {error}")
+    app_logger.info(f"MCP search fan-out finished in {time.monotonic() - started:.2f}s ({timings}, cached: {cached})")
+    payload["errors"] = errors
+    payload["timings"] = timings
+    payload["cached"] = cached
+    return payload
@@ -1,19 +1,25 @@
 from datetime import datetime
+import asyncio
+import base64
+import json
 import uuid
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 from .Message import RequestMessage, ResponseMessage
-import json
-import os
-import dotenv
 # from travelAgent import TravelAgent
-from guardianAgent import run_guardian_agent
+# guardianAgent and travelAgent load the agents SDK, they are imported by the turns that
+# need them (or by the warm-up in warmup.py) so importing the app stays fast
+from chat_stream import translate_stream
 from schemas import RequestMessageSchema, ChatSchema, ResponseMessageSchema
 from models.Message import OutputResponse
 from logger import app_logger
-
-dotenv.load_dotenv()
-DB_FILE = os.getenv("DB_FILE", "db.json")
-CHATS_KEY = "chats"
+from storage import get_store, run_blocking, TITLE_LENGTH
+from unit_of_work import track, untrack
+from chat_cache import chat_cache
+from chat_context import ChatContext
+from slot_extractor import SlotTracker, SLOT_FAST_PATH, detect_language, route_counts, trip_details
+from itinerary_cache import get_itinerary, itinerary_key, put_itinerary
+from tracing import span
+from admission import admit
 
 # factory for messages
 def message_factory(msg: dict):
@@ -32,6 +38,17 @@ def message_schema_factory(msg: RequestMessage| ResponseMessage):
     else:
         raise ValueError(f"Unknown role in message: {msg.role}")
 
+def encode_cursor(cursor: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of encode_cursor, raises ValueError on anything it did not produce"""
+    try:
+        updated_at, chat_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return (str(updated_at), str(chat_id))
+
 class Chat:
     def __init__(
         self,
@@ -39,43 +56,162 @@ class Chat:
         messages: Optional[List[RequestMessage| ResponseMessage]] = None,
         created_at: Optional[datetime] = None,
         updated_at: Optional[datetime] = None,
+        persisted: bool = False,
     ):
         self.id = id or str(uuid.uuid4())
         self.messages = messages or []
         self.created_at = created_at or datetime.utcnow()
         self.updated_at = updated_at or datetime.utcnow()
 
-        # runtime-only attribute
+        # runtime-only attributes, a chat hydrated from the database starts clean
         #self._agent = TravelAgent()
         #self.guardian_agent = GuardianAgent()
+        self._is_new = not persisted
+        self._pending_messages: List[RequestMessage | ResponseMessage] = []
+        self._deleted = False
+        # one write per chat at a time, so appends land in order
+        self._write_lock = asyncio.Lock()
+        # rendered, token budgeted history for the agents, built on first use
+        self._context: Optional[ChatContext] = None
+        self._slots: Optional[SlotTracker] = None
         app_logger.info(f"Chat initialized with ID={self.id}")
-        self._save_to_db()
+        if self._is_new:
+            track(self)
+
+    @property
+    def is_dirty(self) -> bool:
+        return self._is_new or bool(self._pending_messages)
+
+    @property
+    def is_new(self) -> bool:
+        return self._is_new
+
+    async def commit(self):
+        """Called by the unit of work, hands the changes to the cache for write-behind"""
+        await chat_cache.mark_dirty(self)
+
+    def _take_changes(self) -> Optional[tuple]:
+        """Detach the pending changes as a store call, a clean or deleted chat has none"""
+        if self._deleted:
+            return None
+        store = get_store()
+        if self._is_new:
+            write = (store.save_chat, self.to_json())
+        elif self._pending_messages:
+            messages = [message.to_json() for message in self._pending_messages]
+            write = (store.append_messages, self.id, messages, self.updated_at.isoformat())
+        else:
+            return None
+        self._is_new = False
+        self._pending_messages = []
+        return write
+
+    def _write_to_db(self, func, *args):
+        try:
+            if func(*args) is False:
+                app_logger.warning(f"Chat ID={self.id} no longer exists, dropping its pending messages")
+        except Exception as e:
+            app_logger.error(f"Failed to save chat to database: {e}")
+
+    def flush(self):
+        """Write pending changes to the database, a clean chat performs no writes"""
+        write = self._take_changes()
+        if write is not None:
+            self._write_to_db(*write)
+
+    async def flush_async(self):
+        """Same as flush, but the disk work runs in the storage thread pool"""
+        async with self._write_lock:
+            write = self._take_changes()
+            if write is not None:
+                await run_blocking(self._write_to_db, *write)
  
     
+    async def _conversation_history(self) -> str:
+        """Rendered history for the next turn, only messages added since the last turn are rendered"""
+        if self._context is None:
+            self._context = ChatContext()
+        self._context.sync(self.messages)
+        await self._context.compact()
+        return self._context.render()
+
+    def _route(self, message: RequestMessageSchema):
+        """Decide with the slot rules whether the turn needs the guardian LLM, see SlotTracker.route"""
+        if not SLOT_FAST_PATH:
+            return "llm", None, None
+        if self._slots is None:
+            self._slots = SlotTracker()
+        self._slots.sync(self.messages)
+        route, slots, reply = self._slots.route(message.content)
+        route_counts[route] += 1
+        app_logger.info(f"Turn in chat ID={self.id} routed to {route}")
+        return route, slots, reply
+
+    def _itinerary_key(self, message: RequestMessageSchema, slots) -> dict:
+        texts = [msg.content for msg in self.messages if msg.role == "user"] + [message.content]
+        return itinerary_key(slots, texts, detect_language(message.content))
+
     async def add_message(self, message: RequestMessageSchema) -> OutputResponse:
         """Add a message to the chat and save to database"""
+        from guardianAgent import run_guardian_agent
+        from travelAgent import run_travel_agent
+
+        route, slots, reply = self._route(message)
+        if route == "ask":
+            # only trip details are missing, ask for them without a model call
+            response = reply
+        elif route == "travel":
+            # every slot is known, skip the guardian and its handoff
+            key = self._itinerary_key(message, slots)
+            response = None if message.fresh else await get_itinerary(key)
+            if response is None:
+                response = await run_travel_agent(f"{message.content}\n{trip_details(slots)}", await self._conversation_history())
+                await put_itinerary(key, response)
+        else:
+            # Call the agent with conversation history
+            response = await run_guardian_agent(message.content, await self._conversation_history())
+        return self._complete_turn(message, response)
+
+    async def add_message_streamed(self, message: RequestMessageSchema) -> AsyncIterator[dict]:
+        """Like add_message, but yields stream events while the agents work, ending with the saved reply"""
+        from guardianAgent import run_guardian_agent_streamed
+        from travelAgent import run_travel_agent_streamed
+
+        route, slots, reply = self._route(message)
+        key = self._itinerary_key(message, slots) if route == "travel" else None
+        cached = None if key is None or message.fresh else await get_itinerary(key)
+        if route == "ask":
+            response = reply
+        elif cached is not None:
+            # the same trip was planned recently, answer with that plan
+            response = cached
+        else:
+            history = await self._conversation_history()
+            # the streamed run starts on creation, so admission is taken here rather than in run_*_streamed
+            async with admit("openai", "travel_agent" if route == "travel" else "guardian"):
+                if route == "travel":
+                    result = run_travel_agent_streamed(f"{message.content}\n{trip_details(slots)}", history)
+                else:
+                    result = run_guardian_agent_streamed(message.content, history)
+                with span("travel_agent" if route == "travel" else "guardian", mode="stream"):
+                    async for event in translate_stream(result):
+                        yield event
+            response = result.final_output
+            if key is not None:
+                await put_itinerary(key, response)
+        self._complete_turn(message, response)
+        reply = ResponseMessageSchema(role="assistant", content=response.contents, plan=response.plan if hasattr(response, 'plan') else None)
+        yield {"event": "message", "data": reply.model_dump(mode="json")}
+
+    def _complete_turn(self, message: RequestMessageSchema, response: OutputResponse) -> OutputResponse:
         msg= RequestMessage(role=message.role, content=message.content, chat_id=self.id)
-        self.messages.append(msg)
-        self.updated_at = datetime.now()
-        #
-        # Build conversation history from existing messages
-        conversation_history = []
-        for existing_msg in self.messages[:-1]:  # Exclude the current message we just added
-            if existing_msg.role == "user":
-                conversation_history.append({"role": "user", "content": existing_msg.content})
-            elif existing_msg.role == "assistant":
-                # Convert Content objects to string for history
-                content_str = existing_msg.content
-                if isinstance(content_str, list):
-                    content_str = str(content_str)
-                conversation_history.append({"role": "assistant", "content": content_str})
-        
-        # Call the agent with conversation history
-        response = await run_guardian_agent(message.content, conversation_history)
         response_msg= ResponseMessage(role="assistant", content=response.contents, chat_id=self.id, plan=response.plan if hasattr(response, 'plan') else None)
-        self.messages.append(response_msg)
+        # the chat may be shared through the cache, only add the turn once it is complete
+        self.messages.extend([msg, response_msg])
+        self.updated_at = datetime.utcnow()
         app_logger.info(f"Message added to chat ID={self.id}. Total messages now: {len(self.messages)}")
-        self._save_to_db()
+        self._pending_messages.extend([msg, response_msg])
+        track(self)
         return response #return the response to the user
     
     def to_json(self):
@@ -86,6 +222,17 @@ class Chat:
             "updated_at": self.updated_at.isoformat()
         }
     
+    def meta(self) -> dict:
+        """Same shape as the store's chat metadata, computed from memory"""
+        title = next((msg.content[:TITLE_LENGTH] for msg in self.messages if msg.role == "user"), None)
+        return {
+            "id": self.id,
+            "title": title,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "message_count": len(self.messages)
+        }
+
     def to_schema(self) -> ChatSchema:
         return ChatSchema(
             id=self.id,
@@ -97,112 +244,90 @@ class Chat:
         
     
     @staticmethod
-    def get_chat(chat_id: str) -> Optional['Chat']:
+    def _from_json(chat_data: dict) -> 'Chat':
+        """Convert dict back to Chat object"""
+        return Chat(
+            id=chat_data["id"],
+            messages=[message_factory(msg) for msg in chat_data.get("messages", [])],
+            created_at=datetime.fromisoformat(chat_data["created_at"]),
+            updated_at=datetime.fromisoformat(chat_data["updated_at"]),
+            persisted=True
+        )
+
+    @staticmethod
+    def _load(chat_id: str) -> Optional['Chat']:
+        chat_data = get_store().get_chat(chat_id)
+        return Chat._from_json(chat_data) if chat_data is not None else None
+
+    @staticmethod
+    async def get_chat(chat_id: str) -> Optional['Chat']:
         """Get a specific chat by ID"""
+        chat = chat_cache.get(chat_id)
+        if chat is not None:
+            return chat
         try:
-            with open(DB_FILE, "r") as file:
-                data = json.load(file)
-                chats = data.get(CHATS_KEY, [])
-                for chat_data in chats:
-                    if chat_data.get("id") == chat_id:
-                        # Convert dict back to Chat object
-                        chat = Chat(
-                            id=chat_data["id"],
-                            messages=[message_factory(msg) for msg in chat_data.get("messages", [])],
-                            created_at=datetime.fromisoformat(chat_data["created_at"]),
-                            updated_at=datetime.fromisoformat(chat_data["updated_at"])
-                        )
-                        # Don't save to DB again since we're loading from DB
-                        #chat._agent = TravelAgent()
-                        app_logger.info(f"Chat fetched with ID={chat_id}")
-                        return chat
-        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            chat = await run_blocking(Chat._load, chat_id)
+            if chat is not None:
+                # another request may have cached (and changed) it while we were loading
+                cached = chat_cache.peek(chat_id)
+                if cached is not None:
+                    return cached
+                chat_cache.put(chat)
+                app_logger.info(f"Chat fetched with ID={chat_id}")
+                return chat
+        except KeyError:
             pass
         return None
 
     @staticmethod
-    def delete_chat(chat_id: str) -> bool:
+    async def delete_chat(chat_id: str) -> bool:
         """Delete a chat by ID"""
+        untrack(chat_id)
+        unflushed = False
+        cached = chat_cache.remove(chat_id)
+        if cached is not None:
+            # wait for an in-flight write so it can't land after the delete
+            async with cached._write_lock:
+                unflushed = cached.is_new
+                cached._deleted = True
         try:
-            with open(DB_FILE, "r") as file:
-                data = json.load(file)
-            
-            chats = data.get(CHATS_KEY, [])
-            # Filter out the chat with the given ID
-            original_length = len(chats)
-            chats = [chat for chat in chats if chat.get("id") != chat_id]
-            
-            if len(chats) < original_length:
-                # Chat was found and removed
-                data[CHATS_KEY] = chats
-                with open(DB_FILE, "w") as file:
-                    json.dump(data, file, indent=2)
+            if await run_blocking(get_store().delete_chat, chat_id) or unflushed:
                 app_logger.info(f"Chat deleted with ID={chat_id}")
                 return True
             app_logger.warning(f"Chat with ID={chat_id} not found for deletion")
             return False
-        except (FileNotFoundError, json.JSONDecodeError, KeyError):
-            app_logger.error(f"Error deleting chat with ID={chat_id}")
+        except Exception as e:
+            app_logger.error(f"Error deleting chat with ID={chat_id}: {e}")
             return False
 
     @staticmethod
-    def get_chats() -> List[Optional['Chat']]:
+    async def get_chats() -> List[Optional['Chat']]:
         """Get all chats"""
         try:
-            with open(DB_FILE, "r") as file:
-                data = json.load(file)
-                # Convert each chat dict back to Chat object
-                chats = []
-                for chat_data in data.get(CHATS_KEY, []):
-                    chat = Chat(
-                        id=chat_data["id"],
-                        messages=[message_factory(msg) for msg in chat_data.get("messages", [])],
-                        created_at=datetime.fromisoformat(chat_data["created_at"]),
-                        updated_at=datetime.fromisoformat(chat_data["updated_at"])
-                    )
-                    # Initialize agent for each chat
-                    #chat._agent = TravelAgent()
-                    chats.append(chat)
-                app_logger.info(f"Total chats fetched: {len(chats)}")
-                return chats
-        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            chats_data = await run_blocking(get_store().get_chats)
+            # cached chats may hold changes that are not written yet, prefer them over the stored copy
+            cached = {chat_data["id"]: chat_cache.peek(chat_data["id"]) for chat_data in chats_data}
+            missing = [chat_data for chat_data in chats_data if cached[chat_data["id"]] is None]
+            loaded = await run_blocking(lambda: {chat_data["id"]: Chat._from_json(chat_data) for chat_data in missing})
+            chats = [cached[chat_data["id"]] or loaded[chat_data["id"]] for chat_data in chats_data]
+            chats.extend(chat for chat in chat_cache.unflushed_new_chats() if chat.id not in cached)
+            app_logger.info(f"Total chats fetched: {len(chats)}")
+            return chats
+        except KeyError:
             app_logger.warning("No chats found in database")
             return []
 
-    def _save_to_db(self):
-        """Save chat to database"""
-        try:
-            # Try to read existing data
-            try:
-                with open(DB_FILE, "r") as file:
-                    data = json.load(file)
-            except (FileNotFoundError, json.JSONDecodeError):
-                data = {CHATS_KEY: []}
-            
-            # Ensure chats key exists
-            if CHATS_KEY not in data:
-                data[CHATS_KEY] = []
-            
-            # Check if chat already exists
-            chats = data[CHATS_KEY]
-            chat_exists = False
-            for i, existing_chat in enumerate(chats):
-                if existing_chat.get("id") == self.id:
-                    chats[i] = self.to_json()
-                    chat_exists = True
-                    break
-            
-            # If chat doesn't exist, add it
-            if not chat_exists:
-                chats.append(self.to_json())
-            
-            # Write back to file
-            with open(DB_FILE, "w") as file:
-                json.dump(data, file, indent=2)
-                
-        except Exception as e:
-            app_logger.error(f"Failed to save chat to database: {e}")
-
-
-
-
+    @staticmethod
+    async def list_chats(limit: int, cursor: Optional[tuple] = None) -> Tuple[List[dict], Optional[tuple]]:
+        """Page of chat metadata, newest first, without loading any message bodies"""
+        # chats waiting for write-behind are newer than their stored rows, merge them in from memory
+        pending = {chat.id: chat.meta() for chat in chat_cache.pending_chats()}
+        page = await run_blocking(get_store().list_chat_meta, limit + len(pending) + 1, cursor)
+        items = [meta for meta in page if meta["id"] not in pending]
+        items.extend(meta for meta in pending.values() if cursor is None or (meta["updated_at"], meta["id"]) < cursor)
+        items.sort(key=lambda meta: (meta["updated_at"], meta["id"]), reverse=True)
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = (items[-1]["updated_at"], items[-1]["id"])
+        return items, next_cursor
@@ -0,0 +1,50 @@
+import json
+import re
+from datetime import date, datetime
+from typing import Optional
+
+# Turkish letters folded to their ascii base, applied after the Turkish aware lowercasing
+TURKISH_FOLD = str.maketrans({"ı": "i", "ş": "s", "ğ": "g", "ç": "c", "ö": "o", "ü": "u", "â": "a", "î": "i", "û": "u"})
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%Y.%m.%d")
+_SPACES = re.compile(r"\s+")
+
+
+def turkish_lower(text: str) -> str:
+    """Lowercase with the Turkish dotted/dotless i rules (İ -> i, I -> ı)"""
+    return text.replace("İ", "i").replace("I", "ı").lower()
+
+
+def fold_text(text: str) -> str:
+    """Case and accent insensitive form of a name, "İSTANBUL", "Istanbul" and "istanbul" all give "istanbul" """
+    return _SPACES.sub(" ", turkish_lower(text).translate(TURKISH_FOLD)).strip()
+
+
+def normalize_date(text: str) -> Optional[str]:
+    """ISO date for the common numeric date spellings, None if text is not one of them"""
+    text = text.strip()
+    # "2025-11-03T00:00:00" and friends
+    if len(text) > 10 and text[4:5] == "-" and text[10:11] in ("T", " "):
+        text = text[:10]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def canonical_value(value):
+    if isinstance(value, str):
+        return normalize_date(value) or fold_text(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()[:10]
+    if isinstance(value, dict):
+        return {str(key): canonical_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical_value(item) for item in value]
+    return value
+
+
+def canonical_key(name: str, arguments: dict) -> str:
+    """Stable key for a call, equal for arguments that only differ in case, Turkish letters, spacing or date format"""
+    return name + ":" + json.dumps(canonical_value(arguments), sort_keys=True, ensure_ascii=False)
@@ -0,0 +1,207 @@
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from models.Message import Content
+from normalize import fold_text, normalize_date
+from option_records import LINK_FIELDS, field_value, normalize_field, option_items, parse_moment, parse_records, project, to_number
+
+load_dotenv()
+OPTION_RANKER = os.getenv("OPTION_RANKER", "1") == "1"  # pick options with the local scorer, 0 sends every pick to the LLM
+OPTION_TIEBREAK_MARGIN = float(os.getenv("OPTION_TIEBREAK_MARGIN", "0"))  # score gap under which the LLM breaks the tie, 0 never asks it
+OPTION_TOP_K = int(os.getenv("OPTION_TOP_K", "3"))  # options per category handed to the agents, 0 keeps them all
+
+CATEGORIES = {"flights": "Flight", "hotels": "Hotel", "cars": "Car rental"}
+
+# feature -> (weight, whether lower is better), per category
+FEATURES = {
+    "flights": {"price": (1.0, True), "stops": (1.0, True), "duration": (0.5, True), "times": (1.0, False)},
+    "hotels": {"price": (1.0, True), "rating": (1.0, False), "distance": (0.5, True)},
+    "cars": {"price": (1.0, True)},
+}
+MATCH_WEIGHT = 2.0  # weight of a preference word found in an option's own text
+
+# preference wording -> weight multipliers, matched on folded text
+PREFERENCE_RULES = [
+    (("ucuz", "ekonomik", "uygun fiyat", "butce", "cheap", "budget", "affordable", "low cost"), {"price": 3.0}),
+    (("luks", "premium", "konforlu", "5 yildiz", "luxury", "comfortable", "five star", "5 star"), {"rating": 3.0, "price": 0.3}),
+    (("aktarmasiz", "direkt", "direct", "nonstop", "non-stop"), {"stops": 4.0}),
+    (("merkez", "center", "centre", "central", "downtown"), {"distance": 3.0}),
+    (("kisa", "hizli", "short", "fast", "quick"), {"duration": 2.0}),
+]
+# hours the outbound and return flights should ideally leave at, moved by time of day wording
+PREFERRED_HOURS = {"departure": 9, "return": 18}
+HOUR_RULES = [
+    (("sabah", "erken", "morning", "early"), {"departure": 7, "return": 10}),
+    (("aksam", "gec", "evening", "late", "night"), {"departure": 17, "return": 21}),
+]
+# Turkish words that should match the English values the search APIs use
+SYNONYMS = {"otomatik": "automatic", "manuel": "manual", "dizel": "diesel", "elektrikli": "electric", "kahvalti": "breakfast", "havuz": "pool", "deniz": "sea"}
+
+
+def parse_options(option_list: str) -> Optional[Tuple[Dict[str, List[dict]], dict]]:
+    """(option lists per category, trip window) from a get_mcp_lists payload, None when it is not one"""
+    try:
+        payload = json.loads(option_list)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(payload, dict):
+        return None
+    options = {}
+    for category in CATEGORIES:
+        items = option_items(payload, category)
+        options[category] = [item for item in items if isinstance(item, dict)]
+        if items and not options[category]:
+            # free text options, only the LLM can read those
+            return None
+    if not any(options.values()):
+        return None
+    trip = payload.get("trip")
+    return options, trip if isinstance(trip, dict) else {}
+
+
+def preference_weights(preferences: str) -> Tuple[Dict[str, float], Dict[str, float], set]:
+    """(feature weight multipliers, preferred flight hours, preference words) from the preferences text"""
+    folded = fold_text(preferences or "")
+    multipliers: Dict[str, float] = {}
+    for words, changes in PREFERENCE_RULES:
+        if any(re.search(rf"\b{re.escape(word)}", folded) for word in words):
+            for feature, factor in changes.items():
+                multipliers[feature] = multipliers.get(feature, 1.0) * factor
+    hours = dict(PREFERRED_HOURS)
+    for words, changes in HOUR_RULES:
+        if any(re.search(rf"\b{re.escape(word)}\b", folded) for word in words):
+            hours.update(changes)
+    words = {SYNONYMS.get(word, word) for word in re.findall(r"[a-z0-9]{3,}", folded)}
+    return multipliers, hours, words
+
+
+def _time_fit(option: dict, hours: Dict[str, float]) -> Optional[float]:
+    """How close the flight times are to the preferred hours, 0..1, None without any times"""
+    fits = []
+    for leg in ("departure", "return"):
+        hour = parse_moment(field_value(option, leg))[1]
+        if hour is not None:
+            fits.append(max(0.0, 1 - abs(hour - hours[leg]) / 12))
+    return sum(fits) / len(fits) if fits else None
+
+
+def _off_window(option: dict, trip: dict) -> bool:
+    """Whether a flight leaves on another day than the trip starts or ends"""
+    for leg, trip_date in (("departure", trip.get("departure_date")), ("return", trip.get("return_date"))):
+        day = parse_moment(field_value(option, leg))[0]
+        if day is not None and trip_date and day != normalize_date(trip_date):
+            return True
+    return False
+
+
+def _features(category: str, option: dict, hours: Dict[str, float]) -> Dict[str, Optional[float]]:
+    features = {"price": to_number(field_value(option, "price"))}
+    if category == "flights":
+        features["stops"] = to_number(field_value(option, "stops"))
+        features["duration"] = to_number(field_value(option, "duration"))
+        features["times"] = _time_fit(option, hours)
+    elif category == "hotels":
+        rating, stars = to_number(field_value(option, "rating")), to_number(field_value(option, "stars"))
+        # ratings come out of 5 or out of 10, stars out of 5
+        scores = [value / (10 if value > 5 else 5) for value in (rating,) if value is not None]
+        scores += [value / 5 for value in (stars,) if value is not None]
+        features["rating"] = sum(scores) / len(scores) if scores else None
+        features["distance"] = to_number(field_value(option, "distance"))
+    return features
+
+
+def _option_words(option: dict) -> set:
+    text = " ".join(str(value) for value in option.values() if isinstance(value, (str, int, float)))
+    return set(re.findall(r"[a-z0-9]{3,}", fold_text(text)))
+
+
+def score_options(category: str, options: List[dict], preferences: str = "", trip: Optional[dict] = None) -> List[float]:
+    """Score of every option of a category, higher is better.
+
+    Each feature is scaled to 0..1 across the options (cheapest, fewest stops,
+    best rating ... get 1), an option without the feature gets 0.5. The
+    weighted mean of the features and of whether a preference word appears in
+    the option's own fields is its score. Flights outside the trip dates score
+    below every flight inside them.
+    """
+    multipliers, hours, words = preference_weights(preferences)
+    rows = [_features(category, option, hours) for option in options]
+    totals = [0.0] * len(options)
+    weight_sum = 0.0
+    for feature, (weight, lower_better) in FEATURES[category].items():
+        weight *= multipliers.get(feature, 1.0)
+        values = [row.get(feature) for row in rows]
+        known = [value for value in values if value is not None]
+        if not known:
+            continue
+        low, high = min(known), max(known)
+        for index, value in enumerate(values):
+            if value is None:
+                scaled = 0.5
+            elif high == low:
+                scaled = 1.0
+            else:
+                scaled = (value - low) / (high - low)
+                if lower_better:
+                    scaled = 1 - scaled
+            totals[index] += weight * scaled
+        weight_sum += weight
+    if words:
+        for index, option in enumerate(options):
+            # most preference words never match an option, one that does ("automatic", "breakfast") is a strong hint
+            totals[index] += MATCH_WEIGHT if words & _option_words(option) else 0.0
+        weight_sum += MATCH_WEIGHT
+    scores = [total / weight_sum if weight_sum else 0.0 for total in totals]
+    if category == "flights" and trip:
+        # a flight on another day than the trip only wins when there is nothing else
+        scores = [score - 1 if _off_window(option, trip) else score for score, option in zip(scores, options)]
+    return scores
+
+
+def describe(category: str, option: dict) -> Content:
+    """The option as a Content, its scalar fields as text and its image as the link"""
+    parts = []
+    link = None
+    for key, value in option.items():
+        if normalize_field(key) in LINK_FIELDS and isinstance(value, str) and link is None:
+            link = value
+        elif isinstance(value, dict) and to_number(value) is not None:
+            parts.append(f"{key}: {' '.join(str(item) for item in value.values())}")
+        elif isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            parts.append(f"{key}: {value}")
+    return Content(text=f"{CATEGORIES[category]}: " + ", ".join(parts), link=link)
+
+
+def rank_options(options: Dict[str, List[dict]], preferences: str = "", trip: Optional[dict] = None) -> Tuple[Dict[str, dict], Dict[str, List[dict]]]:
+    """(best option per category, categories whose top options are within OPTION_TIEBREAK_MARGIN of each other)"""
+    picks, ties = {}, {}
+    for category, items in options.items():
+        if not items:
+            continue
+        scores = score_options(category, items, preferences, trip)
+        ranked = sorted(zip(scores, range(len(items))), key=lambda pair: (-pair[0], pair[1]))
+        picks[category] = items[ranked[0][1]]
+        tied = [items[index] for score, index in ranked if ranked[0][0] - score < OPTION_TIEBREAK_MARGIN]
+        if len(tied) > 1:
+            ties[category] = tied
+    return picks, ties
+
+
+def shortlist(payload: dict, preferences: str = "", trip: Optional[dict] = None, top_k: int = OPTION_TOP_K) -> dict:
+    """Compact search payload for the agents: the best `top_k` deduplicated option records per category and the search errors"""
+    records = parse_records(payload)
+    compact = {}
+    for category in CATEGORIES:
+        options = [project(record) for record in records[category]]
+        if not options:
+            # nothing we recognize, the raw options are still better than none
+            options = option_items(payload, category)
+        elif len(options) > 1:
+            scores = score_options(category, options, preferences, trip)
+            options = [option for _, _, option in sorted(zip(scores, range(len(options)), options), key=lambda row: (-row[0], row[1]))]
+        compact[category] = options[:top_k] if top_k > 0 else options
+    if payload.get("errors"):
+        compact["errors"] = payload["errors"]
+    return compact
@@ -0,0 +1,189 @@
+import re
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, List, Optional, Tuple, Union
+from normalize import fold_text, normalize_date
+
+# option field names each value may appear under, compared lowercased with "_" and "-" removed
+FIELD_ALIASES = {
+    "id": ["id", "optionid", "offerid"],
+    "price": ["price", "totalprice", "total", "amount", "fare", "cost", "pricepernight", "nightlyprice", "priceperday", "dailyprice", "fiyat"],
+    "currency": ["currency", "currencycode", "parabirimi"],
+    "departure": ["departure", "departuretime", "departuredatetime", "departureat", "departs", "outbound", "outbounddeparture", "kalkis"],
+    "return": ["return", "returntime", "returndeparture", "returndatetime", "inbound", "inbounddeparture", "donus"],
+    "stops": ["stops", "stopcount", "numberofstops", "transfers", "transfercount", "aktarma"],
+    "duration": ["durationminutes", "duration", "flighttime", "sure"],
+    "airline": ["airline", "airlinename", "carrier", "marketingairline", "company", "havayolu"],
+    "flight_number": ["flightnumber", "flightno", "flightcode"],
+    "name": ["name", "hotelname", "title", "otel"],
+    "rating": ["rating", "score", "reviewscore", "guestrating", "puan"],
+    "stars": ["stars", "star", "starrating", "yildiz"],
+    "distance": ["distance", "distancekm", "distancetocenter", "centerdistance", "distancefromcenter", "uzaklik"],
+    "model": ["model", "carmodel", "carname", "vehicle", "car", "name", "arac"],
+    "category": ["category", "carclass", "class", "segment", "type", "sinif"],
+    "transmission": ["transmission", "gear", "gearbox", "vites"],
+    "image": ["image", "imageurl", "photo", "thumbnail", "picture"],
+    "link": ["url", "link", "bookingurl", "deeplink"],
+}
+LINK_FIELDS = set(FIELD_ALIASES["image"] + FIELD_ALIASES["link"])
+_ALIASES = {feature: set(names) for feature, names in FIELD_ALIASES.items()}
+
+
+def normalize_field(name: str) -> str:
+    return name.lower().replace("_", "").replace("-", "")
+
+
+def field_value(option: dict, feature: str):
+    """Value of the first field of `option` that is an alias of `feature`, None if it has none"""
+    names = _ALIASES[feature]
+    for key, value in option.items():
+        if normalize_field(key) in names and value is not None:
+            return value
+    return None
+
+
+def to_number(value) -> Optional[float]:
+    """A number out of 12.5, "1.500 TL", {"amount": 1500, "currency": "TRY"}, ..."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        for key in ("amount", "value", "total", "price"):
+            if key in value:
+                return to_number(value[key])
+        return None
+    if isinstance(value, list):
+        # a list of stop or segment objects counts them
+        return float(len(value)) if value and isinstance(value[0], dict) else None
+    if isinstance(value, str):
+        match = re.search(r"\d{1,3}(?:[.,]\d{3})+(?!\d)|\d+(?:[.,]\d+)?", value)
+        if match is None:
+            return None
+        text = match.group(0)
+        if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", text):
+            text = re.sub(r"[.,]", "", text)
+        return float(text.replace(",", "."))
+    return None
+
+
+def parse_moment(value) -> Tuple[Optional[str], Optional[float]]:
+    """(ISO date, hour of day) of a time field, either may be None"""
+    if not isinstance(value, str):
+        return None, None
+    day = normalize_date(value[:10]) if len(value) >= 10 else None
+    match = re.search(r"(?:^|[T\s])(\d{1,2})[:.](\d{2})", value)
+    hour = int(match.group(1)) + int(match.group(2)) / 60 if match else None
+    return day, hour
+
+
+def option_items(payload: dict, category: str) -> list:
+    """The options of a category in a search payload, servers wrap their lists differently"""
+    items = payload.get(category)
+    if isinstance(items, dict):
+        # {"results": [...]}
+        items = next((value for value in items.values() if isinstance(value, list)), [])
+    if isinstance(items, list) and items and all(isinstance(item, list) for item in items):
+        # several content parts
+        items = [option for part in items for option in part]
+    return items if isinstance(items, list) else []
+
+
+@dataclass(slots=True)
+class FlightOption:
+    id: Optional[str] = None
+    airline: Optional[str] = None
+    flight_number: Optional[str] = None
+    departure: Optional[str] = None  # outbound departure, as the server wrote it
+    inbound: Optional[str] = None  # return departure
+    duration_minutes: Optional[float] = None
+    stops: Optional[int] = None
+    price: Optional[float] = None
+    currency: Optional[str] = None
+
+
+@dataclass(slots=True)
+class HotelOption:
+    id: Optional[str] = None
+    name: Optional[str] = None
+    stars: Optional[float] = None
+    rating: Optional[float] = None
+    distance: Optional[float] = None
+    price: Optional[float] = None  # per night
+    currency: Optional[str] = None
+    image: Optional[str] = None
+
+
+@dataclass(slots=True)
+class CarOption:
+    id: Optional[str] = None
+    model: Optional[str] = None
+    category: Optional[str] = None
+    transmission: Optional[str] = None
+    price: Optional[float] = None  # per day
+    currency: Optional[str] = None
+    image: Optional[str] = None
+
+
+OptionRecord = Union[FlightOption, HotelOption, CarOption]
+RECORD_TYPES = {"flights": FlightOption, "hotels": HotelOption, "cars": CarOption}
+# record field -> feature looked up in FIELD_ALIASES, where the names differ
+RECORD_FEATURES = {"inbound": "return", "duration_minutes": "duration"}
+NUMERIC_FIELDS = {"duration_minutes", "stops", "price", "stars", "rating", "distance"}
+# fields that tell two options apart, the id is left out since servers repeat offers under new ids
+IDENTITY_SKIP = {"id", "image"}
+
+
+def parse_record(category: str, item: dict) -> Optional[OptionRecord]:
+    """Typed record of one option from a search result, None when none of its fields are recognized"""
+    record_type = RECORD_TYPES[category]
+    values = {}
+    for record_field in fields(record_type):
+        name = record_field.name
+        value = field_value(item, RECORD_FEATURES.get(name, name))
+        if name in NUMERIC_FIELDS:
+            value = to_number(value)
+            # 2600.0 -> 2600, the records end up in prompts
+            if value is not None and (name == "stops" or value.is_integer()):
+                value = int(value)
+        elif name == "currency":
+            # usually sits next to the amount, {"price": {"amount": 1500, "currency": "TRY"}}
+            price = field_value(item, "price")
+            if isinstance(price, dict):
+                value = price.get("currency", value)
+        if isinstance(value, (int, float)) and name not in NUMERIC_FIELDS:
+            value = str(value)
+        if isinstance(value, (str, int, float)):
+            values[name] = value
+    if not set(values) - {"id", "currency"}:
+        return None
+    return record_type(**values)
+
+
+def project(record: OptionRecord) -> dict:
+    """Compact dict of a record, unset fields left out"""
+    return {name: value for name, value in asdict(record).items() if value is not None}
+
+
+def identity(record: OptionRecord) -> tuple:
+    return tuple(
+        fold_text(value) if isinstance(value, str) else value
+        for name, value in asdict(record).items()
+        if name not in IDENTITY_SKIP
+    )
+
+
+def parse_records(payload: dict) -> Dict[str, List[OptionRecord]]:
+    """Deduplicated records per category of a search payload, in the order the server sent them"""
+    records = {}
+    for category in RECORD_TYPES:
+        seen = set()
+        records[category] = []
+        for item in option_items(payload, category):
+            record = parse_record(category, item) if isinstance(item, dict) else None
+            if record is None:
+                continue
+            key = identity(record)
+            if key not in seen:
+                seen.add(key)
+                records[category].append(record)
+    return records
@@ -0,0 +1,19 @@
+from typing import Any
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from json_codec import dumps
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response that writes pydantic models straight to bytes with model_dump_json.
+
+    Returning one of these skips FastAPI's validate -> dict -> json.dumps round trip
+    of the response model, which is most of the time spent on a large chat.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode("utf-8")
+        if isinstance(content, list) and content and all(isinstance(item, BaseModel) for item in content):
+            return b"[" + b",".join(item.model_dump_json().encode("utf-8") for item in content) + b"]"
+        return dumps(content)
@@ -9,6 +9,7 @@ from typing import Optional
 class RequestMessageSchema(BaseModel):
     role : str = "user"
     content: str  # List of each day's plan as strings
+    fresh: bool = Field(default=False, exclude=True)  # skip the itinerary cache and plan again
 
 class ResponseMessageSchema(BaseModel):
     role: str = "assistant"
@@ -21,3 +22,23 @@ class ChatSchema(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     messages: List[Union[RequestMessageSchema, ResponseMessageSchema]] = Field(default_factory=list)
 
+class ChatSummarySchema(BaseModel):
+    id: str
+    title: Optional[str] = None  # start of the first user message
+    created_at: datetime
+    updated_at: datetime
+    message_count: int = 0
+
+class ChatPageSchema(BaseModel):
+    items: List[ChatSummarySchema]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= to get the next page, None on the last one
+
+class JobSchema(BaseModel):
+    id: str
+    chat_id: str
+    status: str  # queued | running | succeeded | failed
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[ResponseMessageSchema] = None  # the assistant reply, once succeeded
+    error: Optional[str] = None
@@ -0,0 +1,325 @@
+import os
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from models.Message import Content, OutputResponse
+from normalize import fold_text, normalize_date
+
+load_dotenv()
+SLOT_FAST_PATH = os.getenv("SLOT_FAST_PATH", "1") == "1"  # answer / route turns without the guardian LLM when the rules are sure
+
+SLOTS = ("departure_location", "arrival_location", "departure_date", "return_date")
+
+# folded spelling -> display name, Turkish and English names of the same city map to one entry
+CITIES = {
+    "istanbul": "İstanbul", "ankara": "Ankara", "izmir": "İzmir", "antalya": "Antalya", "bursa": "Bursa",
+    "adana": "Adana", "konya": "Konya", "gaziantep": "Gaziantep", "kayseri": "Kayseri", "trabzon": "Trabzon",
+    "samsun": "Samsun", "eskisehir": "Eskişehir", "diyarbakir": "Diyarbakır", "erzurum": "Erzurum",
+    "mersin": "Mersin", "bodrum": "Bodrum", "dalaman": "Dalaman", "mugla": "Muğla", "denizli": "Denizli",
+    "malatya": "Malatya", "hatay": "Hatay", "sanliurfa": "Şanlıurfa", "urfa": "Şanlıurfa", "mardin": "Mardin",
+    "kars": "Kars", "nevsehir": "Nevşehir", "kapadokya": "Nevşehir", "cappadocia": "Nevşehir", "sinop": "Sinop",
+    "rize": "Rize", "canakkale": "Çanakkale", "edirne": "Edirne", "alanya": "Alanya", "fethiye": "Fethiye",
+    "london": "London", "londra": "London", "paris": "Paris", "rome": "Rome", "roma": "Rome",
+    "berlin": "Berlin", "amsterdam": "Amsterdam", "barcelona": "Barcelona", "barselona": "Barcelona",
+    "madrid": "Madrid", "vienna": "Vienna", "viyana": "Vienna", "prague": "Prague", "prag": "Prague",
+    "athens": "Athens", "atina": "Athens", "munich": "Munich", "munih": "Munich", "milan": "Milan", "milano": "Milan",
+    "dubai": "Dubai", "baku": "Baku", "tbilisi": "Tbilisi", "tiflis": "Tbilisi",
+    "new york": "New York", "tokyo": "Tokyo", "budapest": "Budapest", "budapeste": "Budapest",
+}
+
+# Turkish case endings, after folding ("'dan", "'ya", ...)
+ABLATIVE = ("dan", "den", "tan", "ten")  # from X
+DATIVE = ("ya", "ye", "a", "e")  # to X
+LOCATIVE = ("da", "de", "ta", "te")  # in X
+
+MONTHS = {
+    "ocak": 1, "subat": 2, "mart": 3, "nisan": 4, "mayis": 5, "haziran": 6,
+    "temmuz": 7, "agustos": 8, "eylul": 9, "ekim": 10, "kasim": 11, "aralik": 12,
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8, "sep": 9, "sept": 9,
+    "oct": 10, "nov": 11, "dec": 12,
+}
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_SUFFIX = r"(?:'?(?:nda|ndan|da|de|ta|te|dan|den|tan|ten|ya|ye|a|e))?"
+# "10 kasım", "3 kasım 2025'de", "10-15 kasım"
+DAY_MONTH = re.compile(rf"\b(\d{{1,2}})(?:\s*[-–]\s*(\d{{1,2}}))?\s+({_MONTH})\.?{_SUFFIX}(?:\s+(\d{{4}}))?{_SUFFIX}\b")
+# "november 3", "nov 3rd, 2025", "november 10-15"
+MONTH_DAY = re.compile(rf"\b({_MONTH})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?(?:\s*[-–]\s*(\d{{1,2}})(?:st|nd|rd|th)?)?(?:,?\s+(\d{{4}}))?\b")
+NUMERIC_DATE = re.compile(r"\b(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}[./-]\d{1,2}[./-]\d{4})\b")
+
+RETURN_WORDS = {"donus", "donuste", "donmek", "donecegim", "return", "returning", "back", "geri", "until", "kadar"}
+DEPARTURE_WORDS = {"gidis", "gitmek", "gidecegim", "depart", "departure", "departing", "leave", "leaving", "cikis"}
+# wording the rules can't resolve to a date, left to the LLM
+RELATIVE_WORDS = {"yarin", "bugun", "haftaya", "hafta", "tomorrow", "today", "tonight", "next", "weekend", "week", "month", "ay"}
+TURKISH_HINTS = {"ve", "icin", "bir", "istiyorum", "gitmek", "ucak", "otel", "araba", "tatil", "gidis", "donus", "bilet", "lutfen", "merhaba"}
+
+SLOT_LABELS = {
+    "tr": {"departure_location": "kalkış şehri", "arrival_location": "varış şehri", "departure_date": "gidiş tarihi", "return_date": "dönüş tarihi"},
+    "en": {"departure_location": "departure city", "arrival_location": "destination", "departure_date": "departure date", "return_date": "return date"},
+}
+
+
+class TripSlots(BaseModel):
+    departure_location: Optional[str] = None
+    arrival_location: Optional[str] = None
+    departure_date: Optional[str] = None  # ISO date
+    return_date: Optional[str] = None  # ISO date
+
+    def missing(self) -> List[str]:
+        return [slot for slot in SLOTS if getattr(self, slot) is None]
+
+    def complete(self) -> bool:
+        return not self.missing()
+
+
+class Extraction(BaseModel):
+    found: Dict[str, str] = {}
+    ambiguous: bool = False
+    reason: Optional[str] = None
+
+
+def detect_language(text: str) -> str:
+    if any(char in text for char in "çğışöüÇĞİŞÖÜ"):
+        return "tr"
+    words = set(re.findall(r"[a-z]+", fold_text(text)))
+    return "tr" if words & TURKISH_HINTS else "en"
+
+
+def _resolve_date(day: int, month: int, year: Optional[int], today: date) -> Optional[date]:
+    """The date, or its next occurrence from today on when the year is left out"""
+    try:
+        if year is not None:
+            return date(year, month, day)
+        resolved = date(today.year, month, day)
+        return resolved if resolved >= today else date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+
+def _find_dates(text: str, today: date) -> Tuple[List[Tuple[int, int, List[date]]], bool]:
+    """(start, end, dates) for every date mention in folded text, and whether an invalid one was seen"""
+    found, invalid = [], False
+    taken = []
+
+    def add(match, days, month, year):
+        nonlocal invalid
+        if any(start < match.end() and match.start() < end for start, end in taken):
+            return
+        dates = [_resolve_date(int(day), month, int(year) if year else None, today) for day in days if day]
+        if None in dates:
+            invalid = True
+            return
+        taken.append((match.start(), match.end()))
+        found.append((match.start(), match.end(), dates))
+
+    for match in NUMERIC_DATE.finditer(text):
+        iso = normalize_date(match.group(1))
+        if iso is None:
+            invalid = True
+            continue
+        taken.append((match.start(), match.end()))
+        found.append((match.start(), match.end(), [date.fromisoformat(iso)]))
+    for match in DAY_MONTH.finditer(text):
+        add(match, [match.group(1), match.group(2)], MONTHS[match.group(3)], match.group(4))
+    for match in MONTH_DAY.finditer(text):
+        add(match, [match.group(2), match.group(3)], MONTHS[match.group(1)], match.group(4))
+    found.sort()
+    return found, invalid
+
+
+def _date_role(text: str, start: int, end: int, language: str, lower: int, upper: int) -> Optional[str]:
+    # Turkish puts the keyword after the date ("3 kasım gidiş"), English before it ("return on nov 10").
+    # the window never reaches into the neighbouring date mentions (lower/upper)
+    window = text[end:min(end + 25, upper)] if language == "tr" else text[max(start - 25, lower):start]
+    words = set(re.findall(r"[a-z]+", window))
+    if words & RETURN_WORDS:
+        return "return_date"
+    if words & DEPARTURE_WORDS:
+        return "departure_date"
+    return None
+
+
+def _find_cities(text: str) -> List[Tuple[int, str, Optional[str]]]:
+    """(position, city, role from grammar) for every known city in folded text"""
+    found = []
+    for token in re.finditer(r"[a-z]+(?:'[a-z]+)?", text):
+        word = token.group(0)
+        base, _, suffix = word.partition("'")
+        city = CITIES.get(base)
+        if city is None and not suffix:
+            # "istanbuldan", "ankaraya": suffix glued to the name
+            for ending in ABLATIVE + DATIVE + LOCATIVE:
+                if word.endswith(ending) and word[:-len(ending)] in CITIES:
+                    base, suffix = word[:-len(ending)], ending
+                    city = CITIES[base]
+                    break
+        if city is None:
+            # two word names
+            following = re.match(r" ([a-z]+)", text[token.end():])
+            if following and f"{word} {following.group(1)}" in CITIES:
+                city = CITIES[f"{word} {following.group(1)}"]
+            else:
+                continue
+        role = None
+        if suffix in ABLATIVE:
+            role = "departure_location"
+        elif suffix in DATIVE or suffix in LOCATIVE:
+            role = "arrival_location"
+        else:
+            before = re.findall(r"[a-z]+", text[max(0, token.start() - 8):token.start()])
+            if before and before[-1] == "from":
+                role = "departure_location"
+            elif before and before[-1] in ("to", "in"):
+                role = "arrival_location"
+        found.append((token.start(), city, role))
+    return found
+
+
+def extract_slots(text: str, known: Optional[TripSlots] = None, today: Optional[date] = None) -> Extraction:
+    """Pull trip slots out of one user message.
+
+    `known` are the slots from earlier messages, used to decide what a lone city
+    or date refers to. Anything the rules can't place with confidence (relative
+    dates, three cities, a return before the departure, ...) marks the
+    extraction ambiguous.
+    """
+    known = known or TripSlots()
+    today = today or date.today()
+    language = detect_language(text)
+    folded = fold_text(text)
+    found: Dict[str, str] = {}
+
+    def ambiguous(reason: str) -> Extraction:
+        return Extraction(found=found, ambiguous=True, reason=reason)
+
+    if set(re.findall(r"[a-z]+", folded)) & RELATIVE_WORDS:
+        return ambiguous("relative date")
+
+    # cities, "X-Y" / "X to Y" / two bare names read as departure then arrival
+    cities = _find_cities(folded)
+    unplaced = []
+    for _, city, role in cities:
+        if role is None:
+            unplaced.append(city)
+        elif found.get(role, city) != city:
+            return ambiguous(f"two values for {role}")
+        else:
+            found[role] = city
+    open_roles = [role for role in ("departure_location", "arrival_location") if role not in found]
+    if len(unplaced) > len(open_roles):
+        return ambiguous("more cities than open slots")
+    if len(unplaced) == 2:
+        found["departure_location"], found["arrival_location"] = unplaced
+    elif len(unplaced) == 1:
+        if len(open_roles) == 1:
+            found[open_roles[0]] = unplaced[0]
+        elif known.departure_location and not known.arrival_location:
+            found["arrival_location"] = unplaced[0]
+        elif known.arrival_location and not known.departure_location:
+            found["departure_location"] = unplaced[0]
+        else:
+            return ambiguous("city without a direction")
+    if found.get("departure_location") and found.get("departure_location") == found.get("arrival_location"):
+        return ambiguous("same departure and arrival")
+
+    # dates, ranges give both ends, keywords pick the role, otherwise first is departure
+    mentions, invalid = _find_dates(folded, today)
+    if invalid:
+        return ambiguous("invalid date")
+    unlabeled = []
+    for index, (start, end, dates) in enumerate(mentions):
+        if len(dates) == 2:
+            found["departure_date"], found["return_date"] = dates[0].isoformat(), dates[1].isoformat()
+            continue
+        lower = mentions[index - 1][1] if index else 0
+        upper = mentions[index + 1][0] if index + 1 < len(mentions) else len(folded)
+        role = _date_role(folded, start, end, language, lower, upper)
+        if role is None:
+            unlabeled.append(dates[0].isoformat())
+        elif found.get(role, dates[0].isoformat()) != dates[0].isoformat():
+            return ambiguous(f"two values for {role}")
+        else:
+            found[role] = dates[0].isoformat()
+    open_dates = [role for role in ("departure_date", "return_date") if role not in found]
+    if len(unlabeled) > len(open_dates):
+        return ambiguous("more dates than open slots")
+    if len(unlabeled) == 2:
+        found["departure_date"], found["return_date"] = unlabeled
+    elif len(unlabeled) == 1:
+        if len(open_dates) == 1:
+            found[open_dates[0]] = unlabeled[0]
+        elif not known.departure_date:
+            found["departure_date"] = unlabeled[0]
+        elif not known.return_date:
+            found["return_date"] = unlabeled[0]
+        else:
+            return ambiguous("date without a role")
+
+    merged = known.model_copy(update=found)
+    if merged.departure_date and merged.departure_date < today.isoformat():
+        return ambiguous("departure in the past")
+    if merged.departure_date and merged.return_date and merged.return_date < merged.departure_date:
+        return ambiguous("return before departure")
+    return Extraction(found=found)
+
+
+def missing_slots_reply(slots: TripSlots, language: str) -> OutputResponse:
+    """Local answer asking for the slots that are still missing"""
+    labels = SLOT_LABELS[language]
+    missing = [labels[slot] for slot in slots.missing()]
+    known = ", ".join(f"{labels[slot]}: {getattr(slots, slot)}" for slot in SLOTS if getattr(slots, slot))
+    if language == "tr":
+        asked = " ve ".join([", ".join(missing[:-1]), missing[-1]] if len(missing) > 1 else missing)
+        text = (f"Harika, şunları not aldım: {known}. " if known else "") + f"Planlamaya başlayabilmem için {asked} bilgisini de paylaşır mısın?"
+    else:
+        asked = " and ".join([", ".join(missing[:-1]), missing[-1]] if len(missing) > 1 else missing)
+        text = (f"Great, I have noted {known}. " if known else "") + f"To start planning, could you tell me your {asked}?"
+    return OutputResponse(contents=[Content(text=text)])
+
+
+def trip_details(slots: TripSlots) -> str:
+    """Line appended to the travel agent input so it gets the extracted slots verbatim"""
+    return "Trip details: " + ", ".join(f"{slot}={getattr(slots, slot)}" for slot in SLOTS if getattr(slots, slot))
+
+
+class SlotTracker:
+    """Trip slots of one chat, folded in from its user messages as they arrive.
+
+    `route` decides how the next message is handled without changing the
+    tracker; the message is folded in by the next `sync`, which gives the same
+    result because extraction only depends on the text and the earlier slots.
+    """
+
+    def __init__(self):
+        self.slots = TripSlots()
+        self._processed = 0
+
+    def sync(self, messages: list, today: Optional[date] = None) -> None:
+        if len(messages) < self._processed:
+            self.__init__()
+        for message in messages[self._processed:]:
+            if message.role == "user":
+                extraction = extract_slots(message.content, self.slots, today)
+                # what the rules only half understood was for the guardian to sort out
+                if not extraction.ambiguous:
+                    self.slots = self.slots.model_copy(update=extraction.found)
+        self._processed = len(messages)
+
+    def route(self, text: str, today: Optional[date] = None) -> Tuple[str, TripSlots, Optional[OutputResponse]]:
+        """("ask", slots, reply) when slots are missing and the message was clear,
+        ("travel", slots, None) when the message completed the trip details,
+        ("llm", slots, None) when the guardian should look at it"""
+        extraction = extract_slots(text, self.slots, today)
+        slots = self.slots.model_copy(update=extraction.found)
+        if extraction.ambiguous or not extraction.found:
+            return "llm", slots, None
+        if slots.complete():
+            return "travel", slots, None
+        return "ask", slots, missing_slots_reply(slots, detect_language(text))
+
+
+# Global count of how turns were routed, reported on /api/stats
+route_counts = {"ask": 0, "travel": 0, "llm": 0}
@@ -0,0 +1,31 @@
+import time
+from typing import Dict, Optional, Tuple
+from agents import RunHooks
+from tracing import handoffs, record_stage
+
+
+class StageHooks(RunHooks):
+    """Agents SDK run hooks that time every LLM call and handoff of a run as spans"""
+
+    def __init__(self):
+        self._llm_started: Dict[str, float] = {}
+        self._handoff_started: Optional[Tuple[float, str, str]] = None
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items) -> None:
+        self._llm_started[agent.name] = time.perf_counter()
+
+    async def on_llm_end(self, context, agent, response) -> None:
+        started = self._llm_started.pop(agent.name, None)
+        if started is not None:
+            record_stage("llm", time.perf_counter() - started, agent=agent.name)
+
+    async def on_handoff(self, context, from_agent, to_agent) -> None:
+        handoffs.inc(source=from_agent.name, target=to_agent.name)
+        self._handoff_started = (time.perf_counter(), from_agent.name, to_agent.name)
+
+    async def on_agent_start(self, context, agent) -> None:
+        # a handoff lasts until the agent it went to starts
+        if self._handoff_started is not None and self._handoff_started[2] == agent.name:
+            started, source, target = self._handoff_started
+            self._handoff_started = None
+            record_stage("handoff", time.perf_counter() - started, source=source, target=target)
@@ -0,0 +1,786 @@
+import argparse
+import asyncio
+import atexit
+import bisect
+import contextvars
+import functools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypeVar
+import dotenv
+from json_codec import dumps, loads
+from logger import app_logger
+from tracing import span
+
+try:
+    import msgpack
+except ImportError:  # optional, only DB_ENCODING=msgpack needs it
+    msgpack = None
+
+dotenv.load_dotenv()
+DB_FILE = os.getenv("DB_FILE", "db.json")
+DB_BACKEND = os.getenv("DB_BACKEND", "")  # json | sqlite | journal, inferred from DB_FILE when empty
+DB_ENCODING = os.getenv("DB_ENCODING", "json")  # json | json-indent | msgpack, how the json store and the journal snapshot are written
+CHATS_KEY = "chats"
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+JOURNAL_FSYNC_EVERY = int(os.getenv("JOURNAL_FSYNC_EVERY", "32"))  # records per fsync
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "1.0"))  # max seconds between fsyncs
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", str(4 * 1024 * 1024)))
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "4"))  # threads doing blocking disk work
+TITLE_LENGTH = 60
+ENCODINGS = ("json", "json-indent", "msgpack")
+STORE_FORMAT_VERSION = 1
+MSGPACK_MAGIC = b"TPCHATS"  # then one version byte, then the msgpack body
+
+T = TypeVar("T")
+
+# blocking store calls run here so they never stall the event loop
+storage_executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage")
+
+
+async def run_blocking(func: Callable[..., T], *args) -> T:
+    """Run func in the storage thread pool, keeping the caller's context (request id etc.)"""
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(storage_executor, functools.partial(ctx.run, func, *args))
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write data to path through a temp file and os.replace, readers see the old or the new file, never half of it"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        # mkstemp creates the file as 0600, keep the permissions of the file we replace
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class UnsupportedStoreFormat(Exception):
+    """The store file was written by a newer version or needs a package that is not installed"""
+
+
+def encode_store(data: dict, encoding: str = DB_ENCODING) -> bytes:
+    """File contents of a whole store, {"chats": [...]} plus whatever else the backend keeps"""
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise UnsupportedStoreFormat("DB_ENCODING=msgpack needs the msgpack package")
+        return MSGPACK_MAGIC + bytes([STORE_FORMAT_VERSION]) + msgpack.packb(data, use_bin_type=True)
+    data = {"version": STORE_FORMAT_VERSION, **data}
+    if encoding == "json-indent":
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    if encoding == "json":
+        return dumps(data)
+    raise ValueError(f"Unknown DB_ENCODING: {encoding}")
+
+
+def decode_store(raw: bytes) -> dict:
+    """Inverse of encode_store for any encoding, files from before the version header read as version 0"""
+    if raw.startswith(MSGPACK_MAGIC):
+        version = raw[len(MSGPACK_MAGIC)]
+        if msgpack is None:
+            raise UnsupportedStoreFormat("the store is msgpack encoded, install the msgpack package to read it")
+        data = msgpack.unpackb(raw[len(MSGPACK_MAGIC) + 1:], raw=False)
+    else:
+        data = loads(raw)
+        version = data.pop("version", 0) if isinstance(data, dict) else 0
+    if version > STORE_FORMAT_VERSION:
+        raise UnsupportedStoreFormat(f"store format version {version} is newer than this app ({STORE_FORMAT_VERSION})")
+    return data
+
+
+def store_encoding(raw: bytes) -> str:
+    if raw.startswith(MSGPACK_MAGIC):
+        return "msgpack"
+    return "json-indent" if raw[:2] == b"{\n" else "json"
+
+
+def chat_title(messages: List[dict]) -> Optional[str]:
+    """Sidebar title of a chat, the start of its first user message"""
+    for message in messages:
+        if message.get("role") == "user" and isinstance(message.get("content"), str):
+            return message["content"][:TITLE_LENGTH]
+    return None
+
+
+def chat_meta(chat: dict) -> dict:
+    """Metadata of a chat as listed in the sidebar, never includes message bodies"""
+    messages = chat.get("messages", [])
+    return {
+        "id": chat["id"],
+        "title": chat_title(messages),
+        "created_at": chat["created_at"],
+        "updated_at": chat["updated_at"],
+        "message_count": len(messages),
+    }
+
+
+def appended_meta(meta: dict, messages: List[dict], updated_at: str) -> dict:
+    return dict(
+        meta,
+        title=meta["title"] or chat_title(messages),
+        updated_at=updated_at,
+        message_count=meta["message_count"] + len(messages),
+    )
+
+
+class ChatIndex:
+    """In-memory chat metadata sorted by (updated_at, id), updated on every write instead of rebuilt."""
+
+    def __init__(self):
+        self._meta: Dict[str, dict] = {}
+        self._keys: List[tuple] = []  # ascending (updated_at, id)
+
+    def upsert(self, meta: dict) -> None:
+        self.remove(meta["id"])
+        self._meta[meta["id"]] = meta
+        bisect.insort(self._keys, (meta["updated_at"], meta["id"]))
+
+    def append(self, chat_id: str, messages: List[dict], updated_at: str) -> None:
+        meta = self._meta.get(chat_id)
+        if meta is not None:
+            self.upsert(appended_meta(meta, messages, updated_at))
+
+    def remove(self, chat_id: str) -> None:
+        meta = self._meta.pop(chat_id, None)
+        if meta is not None:
+            key = (meta["updated_at"], chat_id)
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def page(self, limit: int, cursor: Optional[tuple] = None) -> List[dict]:
+        """Newest first, only entries strictly older than cursor"""
+        end = bisect.bisect_left(self._keys, tuple(cursor)) if cursor else len(self._keys)
+        keys = self._keys[max(0, end - limit):end]
+        return [self._meta[chat_id] for _, chat_id in reversed(keys)]
+
+    def __len__(self) -> int:
+        return len(self._meta)
+
+
+class ChatStore:
+    """Storage interface for chats.
+
+    Chats are passed in and out in their `Chat.to_json()` form so the backends
+    stay independent of the pydantic models.
+    """
+
+    def get_chat(self, chat_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_chats(self) -> List[dict]:
+        raise NotImplementedError
+
+    def save_chat(self, chat: dict) -> None:
+        """Insert or replace a whole chat"""
+        raise NotImplementedError
+
+    def append_messages(self, chat_id: str, messages: List[dict], updated_at: str) -> bool:
+        """Append messages to an existing chat, returns False if the chat is unknown"""
+        raise NotImplementedError
+
+    def delete_chat(self, chat_id: str) -> bool:
+        raise NotImplementedError
+
+    def list_chat_meta(self, limit: int, cursor: Optional[tuple] = None) -> List[dict]:
+        """Page of chat metadata ordered by (updated_at, id) descending, starting after cursor"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonChatStore(ChatStore):
+    """Keeps every chat in a single json file, each write atomically rewrites the whole file."""
+
+    def __init__(self, path: str = DB_FILE):
+        self.path = path
+        # read-modify-write cycles from different threads must not interleave
+        self._lock = threading.RLock()
+        # built from the file on the first listing, then kept up to date by our own writes
+        self._index: Optional[ChatIndex] = None
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "rb") as file:
+                data = decode_store(file.read())
+        except (FileNotFoundError, ValueError):
+            data = {CHATS_KEY: []}
+        # Ensure chats key exists
+        if CHATS_KEY not in data:
+            data[CHATS_KEY] = []
+        return data
+
+    def _dump(self, data: dict) -> None:
+        atomic_write(self.path, encode_store(data))
+
+    def get_chat(self, chat_id: str) -> Optional[dict]:
+        for chat in self._load()[CHATS_KEY]:
+            if chat.get("id") == chat_id:
+                return chat
+        return None
+
+    def get_chats(self) -> List[dict]:
+        return self._load()[CHATS_KEY]
+
+    def save_chat(self, chat: dict) -> None:
+        with self._lock:
+            data = self._load()
+            chats = data[CHATS_KEY]
+            for i, existing_chat in enumerate(chats):
+                if existing_chat.get("id") == chat["id"]:
+                    chats[i] = chat
+                    break
+            else:
+                chats.append(chat)
+            self._dump(data)
+            if self._index is not None:
+                self._index.upsert(chat_meta(chat))
+
+    def append_messages(self, chat_id: str, messages: List[dict], updated_at: str) -> bool:
+        with self._lock:
+            data = self._load()
+            for chat in data[CHATS_KEY]:
+                if chat.get("id") == chat_id:
+                    chat.setdefault("messages", []).extend(messages)
+                    chat["updated_at"] = updated_at
+                    self._dump(data)
+                    if self._index is not None:
+                        self._index.append(chat_id, messages, updated_at)
+                    return True
+            return False
+
+    def delete_chat(self, chat_id: str) -> bool:
+        with self._lock:
+            data = self._load()
+            chats = data[CHATS_KEY]
+            remaining = [chat for chat in chats if chat.get("id") != chat_id]
+            if len(remaining) == len(chats):
+                return False
+            data[CHATS_KEY] = remaining
+            self._dump(data)
+            if self._index is not None:
+                self._index.remove(chat_id)
+            return True
+
+    def list_chat_meta(self, limit: int, cursor: Optional[tuple] = None) -> List[dict]:
+        with self._lock:
+            if self._index is None:
+                self._index = ChatIndex()
+                for chat in self._load()[CHATS_KEY]:
+                    self._index.upsert(chat_meta(chat))
+            return self._index.page(limit, cursor)
+
+
+class SqliteChatStore(ChatStore):
+    """Chats indexed by id with one row per message, WAL mode so readers never wait on writers."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chats (
+            id TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            title TEXT,
+            message_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            chat_id TEXT NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            body TEXT NOT NULL,
+            PRIMARY KEY (chat_id, seq)
+        ) WITHOUT ROWID;
+    """
+    INDEX_SCHEMA = """
+        CREATE INDEX IF NOT EXISTS chats_by_updated_at ON chats (updated_at DESC, id DESC);
+    """
+
+    def __init__(self, path: str = DB_FILE):
+        self.path = path
+        # sqlite connections can't be shared between threads, keep one per thread
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+        self._add_meta_columns(conn)
+        conn.executescript(self.INDEX_SCHEMA)
+
+    @staticmethod
+    def _add_meta_columns(conn: sqlite3.Connection) -> None:
+        """Upgrade stores created before the metadata columns existed"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+        if "message_count" in columns:
+            return
+        with _Transaction(conn):
+            conn.execute("ALTER TABLE chats ADD COLUMN title TEXT")
+            conn.execute("ALTER TABLE chats ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+            conn.execute(
+                "UPDATE chats SET "
+                "message_count = (SELECT COUNT(*) FROM messages WHERE chat_id = chats.id), "
+                f"title = (SELECT substr(json_extract(body, '$.content'), 1, {TITLE_LENGTH}) FROM messages "
+                "WHERE chat_id = chats.id AND role = 'user' ORDER BY seq LIMIT 1)"
+            )
+        app_logger.info("Added metadata columns to the sqlite chat store")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _write(self):
+        return _Transaction(self._conn())
+
+    @staticmethod
+    def _chat_from_rows(row, message_rows) -> dict:
+        return {
+            "id": row[0],
+            "messages": [loads(body) for (body,) in message_rows],
+            "created_at": row[1],
+            "updated_at": row[2],
+        }
+
+    def get_chat(self, chat_id: str) -> Optional[dict]:
+        conn = self._conn()
+        row = conn.execute("SELECT id, created_at, updated_at FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        if row is None:
+            return None
+        message_rows = conn.execute("SELECT body FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,)).fetchall()
+        return self._chat_from_rows(row, message_rows)
+
+    def get_chats(self) -> List[dict]:
+        conn = self._conn()
+        chats = {}
+        # rowid keeps the insertion order the json file used to have
+        for row in conn.execute("SELECT id, created_at, updated_at FROM chats ORDER BY rowid"):
+            chats[row[0]] = self._chat_from_rows(row, [])
+        for chat_id, body in conn.execute("SELECT chat_id, body FROM messages ORDER BY chat_id, seq"):
+            if chat_id in chats:
+                chats[chat_id]["messages"].append(loads(body))
+        return list(chats.values())
+
+    def save_chat(self, chat: dict) -> None:
+        with self._write() as conn:
+            self._upsert_chat(conn, chat)
+
+    @classmethod
+    def _upsert_chat(cls, conn: sqlite3.Connection, chat: dict) -> None:
+        meta = chat_meta(chat)
+        conn.execute(
+            "INSERT INTO chats (id, created_at, updated_at, title, message_count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET created_at = excluded.created_at, updated_at = excluded.updated_at, "
+            "title = excluded.title, message_count = excluded.message_count",
+            (meta["id"], meta["created_at"], meta["updated_at"], meta["title"], meta["message_count"]),
+        )
+        conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat["id"],))
+        cls._insert_messages(conn, chat["id"], chat.get("messages", []), 0)
+
+    def append_messages(self, chat_id: str, messages: List[dict], updated_at: str) -> bool:
+        with self._write() as conn:
+            updated = conn.execute(
+                "UPDATE chats SET updated_at = ?, message_count = message_count + ?, title = COALESCE(title, ?) WHERE id = ?",
+                (updated_at, len(messages), chat_title(messages), chat_id),
+            ).rowcount
+            if not updated:
+                return False
+            (last_seq,) = conn.execute("SELECT COALESCE(MAX(seq), -1) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()
+            self._insert_messages(conn, chat_id, messages, last_seq + 1)
+        return True
+
+    @staticmethod
+    def _insert_messages(conn: sqlite3.Connection, chat_id: str, messages: List[dict], start_seq: int) -> None:
+        conn.executemany(
+            "INSERT INTO messages (chat_id, seq, role, body) VALUES (?, ?, ?, ?)",
+            [
+                (chat_id, start_seq + i, message.get("role", ""), dumps(message).decode("utf-8"))
+                for i, message in enumerate(messages)
+            ],
+        )
+
+    def delete_chat(self, chat_id: str) -> bool:
+        with self._write() as conn:
+            return conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,)).rowcount > 0
+
+    def list_chat_meta(self, limit: int, cursor: Optional[tuple] = None) -> List[dict]:
+        query = "SELECT id, title, created_at, updated_at, message_count FROM chats"
+        params: tuple = ()
+        if cursor:
+            query += " WHERE (updated_at, id) < (?, ?)"
+            params = tuple(cursor)
+        query += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+        rows = self._conn().execute(query, params + (limit,)).fetchall()
+        return [
+            {"id": row[0], "title": row[1], "created_at": row[2], "updated_at": row[3], "message_count": row[4]}
+            for row in rows
+        ]
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block of writes"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class JournalChatStore(ChatStore):
+    """File based store made of a json snapshot plus an append-only jsonl journal.
+
+    Every write appends one record to the journal, fsyncs are batched by count and
+    time. A background thread folds the journal into the snapshot once it grows past
+    JOURNAL_COMPACT_BYTES. Records carry a sequence number and the snapshot stores the
+    last one it contains, so replaying after a crash at any point never applies a
+    record twice. A torn last line is dropped on startup.
+    """
+
+    def __init__(
+        self,
+        path: str = DB_FILE,
+        fsync_every: int = JOURNAL_FSYNC_EVERY,
+        fsync_interval: float = JOURNAL_FSYNC_INTERVAL,
+        compact_bytes: int = JOURNAL_COMPACT_BYTES,
+    ):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._chats: Dict[str, dict] = {}
+        self._index = ChatIndex()
+        self._seq = 0
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._replay()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._background, name="journal-compactor", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    # --- startup -----------------------------------------------------------
+
+    def _replay(self) -> None:
+        try:
+            with open(self.path, "rb") as file:
+                snapshot = decode_store(file.read())
+        except FileNotFoundError:
+            snapshot = {}
+        self._seq = snapshot.get("seq", 0)
+        for chat in snapshot.get(CHATS_KEY, []):
+            self._chats[chat["id"]] = chat
+            self._index.upsert(chat_meta(chat))
+
+        replayed = 0
+        good_offset = 0
+        try:
+            with open(self.journal_path, "rb") as file:
+                for line in file:
+                    try:
+                        record = loads(line)
+                    except ValueError:
+                        # torn write from a crash, everything after it is garbage
+                        app_logger.warning(f"Dropping torn journal tail at offset {good_offset} in {self.journal_path}")
+                        break
+                    good_offset += len(line)
+                    if record["seq"] > self._seq:
+                        self._apply(record)
+                        self._seq = record["seq"]
+                        replayed += 1
+            with open(self.journal_path, "r+b") as file:
+                file.truncate(good_offset)
+        except FileNotFoundError:
+            pass
+        app_logger.info(f"Journal store loaded {len(self._chats)} chats, replayed {replayed} records")
+
+    def _apply(self, record: dict) -> bool:
+        op = record["op"]
+        if op == "put":
+            self._chats[record["chat"]["id"]] = self._copy(record["chat"])
+            self._index.upsert(chat_meta(record["chat"]))
+            return True
+        if op == "append":
+            chat = self._chats.get(record["id"])
+            if chat is None:
+                return False
+            chat.setdefault("messages", []).extend(record["messages"])
+            chat["updated_at"] = record["updated_at"]
+            self._index.append(record["id"], record["messages"], record["updated_at"])
+            return True
+        if op == "delete":
+            self._index.remove(record["id"])
+            return self._chats.pop(record["id"], None) is not None
+        raise ValueError(f"Unknown journal op: {op}")
+
+    # --- writes ------------------------------------------------------------
+
+    def _applies(self, record: dict) -> bool:
+        return record["op"] == "put" or record["id"] in self._chats
+
+    def _log(self, record: dict) -> bool:
+        with self._lock:
+            if not self._applies(record):
+                return False
+            # journal first: a record that could not be written must not show up in memory
+            record["seq"] = self._seq + 1
+            offset = self._journal.tell()
+            try:
+                self._journal.write(dumps(record).decode("utf-8") + "\n")
+                self._journal.flush()
+            except BaseException:
+                self._discard_tail(offset)
+                raise
+            self._seq = record["seq"]
+            self._apply(record)
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            return True
+
+    def _discard_tail(self, offset: int) -> None:
+        """Cut a partly written record off the journal, the records after it would be lost on replay"""
+        try:
+            self._journal.close()
+        except OSError:
+            # the buffered part of the record can't be flushed either, which is what we want
+            pass
+        try:
+            os.truncate(self.journal_path, offset)
+        except OSError as e:
+            app_logger.error(f"Could not cut the failed record off {self.journal_path}: {e}")
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _fsync(self) -> None:
+        if self._unsynced:
+            os.fsync(self._journal.fileno())
+            self._unsynced = 0
+        self._last_fsync = time.monotonic()
+
+    def save_chat(self, chat: dict) -> None:
+        self._log({"op": "put", "chat": chat})
+
+    def append_messages(self, chat_id: str, messages: List[dict], updated_at: str) -> bool:
+        return self._log({"op": "append", "id": chat_id, "messages": messages, "updated_at": updated_at})
+
+    def delete_chat(self, chat_id: str) -> bool:
+        return self._log({"op": "delete", "id": chat_id})
+
+    # --- reads -------------------------------------------------------------
+
+    @staticmethod
+    def _copy(chat: dict) -> dict:
+        # appends mutate the message list in place, hand out a stable copy
+        return dict(chat, messages=list(chat.get("messages", [])))
+
+    def get_chat(self, chat_id: str) -> Optional[dict]:
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            return self._copy(chat) if chat is not None else None
+
+    def get_chats(self) -> List[dict]:
+        with self._lock:
+            return [self._copy(chat) for chat in self._chats.values()]
+
+    def list_chat_meta(self, limit: int, cursor: Optional[tuple] = None) -> List[dict]:
+        with self._lock:
+            return self._index.page(limit, cursor)
+
+    # --- compaction --------------------------------------------------------
+
+    def compact(self) -> None:
+        """Fold the journal into the snapshot"""
+        with self._compact_lock:
+            with self._lock:
+                self._fsync()
+                seq = self._seq
+                chats = [self._copy(chat) for chat in self._chats.values()]
+                offset = self._journal.tell()
+
+            # the slow part runs without blocking writers
+            atomic_write(self.path, encode_store({"seq": seq, CHATS_KEY: chats}))
+
+            with self._lock:
+                # keep only the records written while the snapshot was being dumped
+                self._journal.flush()
+                with open(self.journal_path, "rb") as file:
+                    file.seek(offset)
+                    tail = file.read()
+                self._journal.close()
+                try:
+                    atomic_write(self.journal_path, tail)
+                finally:
+                    self._journal = open(self.journal_path, "a", encoding="utf-8")
+            app_logger.info(f"Journal compacted into snapshot at seq={seq}, {len(tail)} bytes carried over")
+
+    def _background(self) -> None:
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                with self._lock:
+                    self._fsync()
+                    journal_size = self._journal.tell()
+                if journal_size >= self.compact_bytes:
+                    self.compact()
+            except Exception as e:
+                app_logger.error(f"Journal background task failed: {e}")
+
+    def close(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._worker.join()
+        with self._lock:
+            self._fsync()
+            self._journal.close()
+
+
+class CountingChatStore(ChatStore):
+    """Wraps a store, counts reads and writes (read-only requests must never write) and times every call."""
+
+    def __init__(self, inner: ChatStore):
+        self.inner = inner
+        self.reads = 0
+        self.writes = 0
+
+    def get_chat(self, chat_id: str) -> Optional[dict]:
+        self.reads += 1
+        with span("storage", op="get_chat"):
+            return self.inner.get_chat(chat_id)
+
+    def get_chats(self) -> List[dict]:
+        self.reads += 1
+        with span("storage", op="get_chats"):
+            return self.inner.get_chats()
+
+    def save_chat(self, chat: dict) -> None:
+        self.writes += 1
+        with span("storage", op="save_chat"):
+            self.inner.save_chat(chat)
+
+    def append_messages(self, chat_id: str, messages: List[dict], updated_at: str) -> bool:
+        self.writes += 1
+        with span("storage", op="append_messages"):
+            return self.inner.append_messages(chat_id, messages, updated_at)
+
+    def delete_chat(self, chat_id: str) -> bool:
+        self.writes += 1
+        with span("storage", op="delete_chat"):
+            return self.inner.delete_chat(chat_id)
+
+    def list_chat_meta(self, limit: int, cursor: Optional[tuple] = None) -> List[dict]:
+        self.reads += 1
+        with span("storage", op="list_chat_meta"):
+            return self.inner.list_chat_meta(limit, cursor)
+
+    def close(self) -> None:
+        self.inner.close()
+
+    def stats(self) -> dict:
+        return {"backend": type(self.inner).__name__, "reads": self.reads, "writes": self.writes}
+
+
+def create_store(backend: str = DB_BACKEND, path: str = DB_FILE) -> ChatStore:
+    """Build the store selected by DB_BACKEND (or by the DB_FILE extension)"""
+    backend = (backend or "").lower()
+    if not backend:
+        backend = "sqlite" if path.endswith(SQLITE_SUFFIXES) else "json"
+    if backend == "sqlite":
+        store = SqliteChatStore(path)
+    elif backend == "json":
+        store = JsonChatStore(path)
+    elif backend == "journal":
+        store = JournalChatStore(path)
+    else:
+        raise ValueError(f"Unknown DB_BACKEND: {backend}")
+    app_logger.info(f"Using {backend} chat store at {path}")
+    return store
+
+
+_store: Optional[CountingChatStore] = None
+
+
+def get_store() -> CountingChatStore:
+    """Process wide chat store, created on first use"""
+    global _store
+    if _store is None:
+        _store = CountingChatStore(create_store())
+    return _store
+
+
+def migrate_json_to_sqlite(json_path: str, sqlite_path: str) -> int:
+    """Import every chat of a db.json file into a sqlite store, returns the number of chats imported"""
+    chats = JsonChatStore(json_path).get_chats()
+    store = SqliteChatStore(sqlite_path)
+    try:
+        with store._write() as conn:
+            for chat in chats:
+                store._upsert_chat(conn, chat)
+    finally:
+        store.close()
+    app_logger.info(f"Migrated {len(chats)} chats from {json_path} to {sqlite_path}")
+    return len(chats)
+
+
+def convert_store(path: str, encoding: str, output: Optional[str] = None) -> tuple:
+    """Rewrite a json store or journal snapshot in another DB_ENCODING, returns (bytes before, bytes after)"""
+    with open(path, "rb") as file:
+        raw = file.read()
+    encoded = encode_store(decode_store(raw), encoding)
+    atomic_write(output or path, encoded)
+    app_logger.info(f"Converted {path} from {store_encoding(raw)} to {encoding}, {len(raw)} -> {len(encoded)} bytes")
+    return len(raw), len(encoded)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import an existing db.json into a sqlite chat store, or convert its encoding")
+    parser.add_argument("json_path", nargs="?", default="db.json")
+    parser.add_argument("sqlite_path", nargs="?", default="chats.db")
+    parser.add_argument("--convert", choices=ENCODINGS, help="rewrite json_path in this encoding instead of importing it")
+    parser.add_argument("--output", help="with --convert, write the converted store here instead of over json_path")
+    args = parser.parse_args()
+    if args.convert:
+        before, after = convert_store(args.json_path, args.convert, args.output)
+        print(f"Wrote {args.output or args.json_path} as {args.convert}: {before} -> {after} bytes")
+    else:
+        count = migrate_json_to_sqlite(args.json_path, args.sqlite_path)
+        print(f"Imported {count} chats into {args.sqlite_path}")
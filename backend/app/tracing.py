@@ -0,0 +1,191 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+from logger import app_logger, request_id_ctx
+
+# seconds, covers a storage call up to a full trip plan
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_label_text(key)} {value}" for key, value in sorted(self._values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._values: Dict[tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_label_text(key + (('le', repr(float(bound))),))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(key + (('le', '+Inf'),))} {counts[-2]}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {counts[-1]}")
+                lines.append(f"{self.name}_count{_label_text(key)} {counts[-2]}")
+        return lines
+
+
+class Gauge:
+    """Read from a callback at scrape time, the callback returns a number or {labels tuple: number}"""
+
+    def __init__(self, name: str, help: str, read: Callable):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        value = self.read()
+        if isinstance(value, dict):
+            lines += [f"{self.name}{_label_text(key)} {item}" for key, item in sorted(value.items())]
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable) -> Gauge:
+        self._metrics[name] = Gauge(name, help, read)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines += metric.render()
+            except Exception as e:
+                app_logger.warning(f"Could not render metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry, served on /metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram("trip_planner_stage_duration_seconds", "Duration of a request stage (agent run, llm call, tool, MCP call, storage op)")
+stage_errors = metrics.counter("trip_planner_stage_errors_total", "Stages that ended with an exception")
+request_seconds = metrics.histogram("trip_planner_http_request_duration_seconds", "HTTP request duration by route")
+handoffs = metrics.counter("trip_planner_handoffs_total", "Agent handoffs")
+
+
+class RequestTrace:
+    """Stage timings of one request, filled by `span` from any task or thread of the request"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: Dict[str, List[float]] = {}  # stage -> [count, seconds]
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def breakdown(self) -> dict:
+        with self._lock:
+            stages = {stage: {"count": count, "seconds": round(seconds, 4)} for stage, (count, seconds) in self.stages.items()}
+        return {
+            "request": self.name,
+            "request_id": request_id_ctx.get(),
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "stages": stages,
+        }
+
+
+# ContextVar for the trace of the current request, tasks and storage threads get a copy that points at the same object
+request_trace_ctx: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def record_stage(stage: str, seconds: float, **labels) -> None:
+    stage_seconds.observe(seconds, stage=stage, **labels)
+    trace = request_trace_ctx.get()
+    if trace is not None:
+        detail = ",".join(str(value) for _, value in sorted(labels.items()))
+        trace.add(f"{stage}[{detail}]" if detail else stage, seconds)
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """Time a stage into the stage histogram and the current request's breakdown.
+
+    Works in sync and async code alike (`with span("trip_plan"):`). Spans may
+    nest, so the breakdown shows overlapping times, not a partition.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=stage, **labels)
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - started, **labels)
+
+
+@contextmanager
+def request_trace(name: str):
+    """Collect the stages of a request and log their breakdown when it ends"""
+    trace = RequestTrace(name)
+    token = request_trace_ctx.set(trace)
+    try:
+        yield trace
+    finally:
+        request_trace_ctx.reset(token)
+        if trace.stages:
+            app_logger.info(f"Request stage breakdown: {json.dumps(trace.breakdown(), ensure_ascii=False)}")
@@ -1,35 +1,57 @@
-from agents import Agent, Runner, handoff
+from agents import Agent, Runner, handoff, RunResultStreaming
 from agents.mcp import MCPServerStdio
 from models.Message import Content, OutputResponse
-from typing import List, Optional
+from typing import List, Optional, Union
 import os
+import json
+import functools
 from dotenv import load_dotenv
 from agents import function_tool
 from models.Message import Content
 from typing import List
-from mcp_agent_runner import MCPAgentRunner
-from openai import OpenAI
+from mcp_search import search_travel_options
+from normalize import canonical_key
+from single_flight import search_flights
+from chat_context import build_context
+from tracing import span
+from stage_hooks import StageHooks
+from admission import admit
+from day_planner import plan_days
+from option_ranker import OPTION_RANKER, CATEGORIES, describe, parse_options, rank_options, shortlist
+from logger import app_logger
+from pydantic import BaseModel
 from datetime import datetime
-client = OpenAI()
 
 
 
 @function_tool
-async def get_mcp_lists(departure_location:str, arrival_location:str, departure_date:str, return_date:str, preferences:str) -> None:
+async def get_mcp_lists(departure_location:str, arrival_location:str, departure_date:str, return_date:str, preferences:str) -> str:
     """
-    This tool fetches the list of options from MCP server by using the tools flight_search, hotel_search, car_search based on user preferences and budget. Just return the response from MCP server. 
+    This tool searches flights, hotels and car rentals on the MCP server for the trip and returns the few best options of each, ranked by user preferences and budget. Pass its result to pick_options as is.
     Args:
         departure_location (str): The location from which the user is departing.
         arrival_location (str): The location to which the user is arriving.
         departure_date (str): The date of departure in YYYY-MM-DD format.
         return_date (str): The date of return in YYYY-MM-DD format.
         preferences (str): User preferences and budget information.
+    Returns:
+        str: JSON object with the best few "flights", "hotels" and "cars" options, "errors" for searches that failed and the "trip" dates.
     """
-    runner = MCPAgentRunner()
-    response = await runner.run(f"Get me flight and hotel and car rental options based on the following details:\n Departure Location: {departure_location}\n Arrival Location: {arrival_location}\n Departure Date: {departure_date}\n Return Date: {return_date}\n Preferences: {preferences}")
-    print("MCP Response:", response)
-    await runner.close()
-    return response
+    # the arguments are already structured, so the MCP tools are called directly and in parallel
+    # instead of letting an LLM decide on them one turn at a time. preferences rank the shortlist.
+    trip = (departure_location, arrival_location, departure_date, return_date)
+    # identical searches already running are joined instead of repeated
+    with span("get_mcp_lists"):
+        response = await search_flights.do(
+            canonical_key("get_mcp_lists", list(trip)),
+            functools.partial(search_travel_options, *trip),
+        )
+    # the agents get typed, deduplicated top options instead of the raw results, and the
+    # trip window goes along for pick_options to judge the flight times against
+    trip = dict(zip(("departure_location", "arrival_location", "departure_date", "return_date"), trip))
+    options = json.dumps({**shortlist(response, preferences, trip), "trip": trip}, ensure_ascii=False, separators=(",", ":"), default=str)
+    app_logger.info(f"get_mcp_lists passes on {len(options)} characters of options ({len(json.dumps(response, ensure_ascii=False, default=str))} raw)")
+    return options
 
 
 @function_tool
@@ -37,7 +59,7 @@ async def pick_options(option_list : str, preferences:str) -> List[Content]:
     """
      This tool picks the most related option within the text field of each content, it should pick one flight, one hotel, one car rental option based on user preferences and budget.
     Args:
-        option_list str: List of flight, hotel, car rental options in string format.
+        option_list str: The JSON returned by get_mcp_lists, passed on unchanged.
         preferences (str): User preferences and budget information.
     Returns:
         List[Content]: A list containing the most related options. Like 
@@ -47,18 +69,86 @@ async def pick_options(option_list : str, preferences:str) -> List[Content]:
             Content(text="Selected car rental's details...", link=None)
         ]
     """
-    #TODO: llm based implementation
-    
-    agent = Agent(
-        name="OptionPickerAgent",
-        instructions="From the following list of options of flights, hotels, and car rentals, pick the most suitable single option from each category based on the user's preferences and budget. Provide your selections in a concise manner.",
-        output_type=List[Content],
-        model="gpt-4o-mini"
-    )
-    response = await Runner.run(agent, input=f"Option list: {option_list}\n User preferences and budget: {preferences}")
+    parsed = parse_options(option_list) if OPTION_RANKER else None
+    if parsed is None:
+        return await _pick_with_llm(option_list, preferences)
+    options, trip = parsed
+    # scored locally, the model is only asked when the best options are too close to call
+    with span("pick_options", mode="local"):
+        picks, ties = rank_options(options, preferences, trip)
+    if ties:
+        picks.update(await _break_ties(ties, preferences))
+    contents = [
+        describe(category, picks[category]) if category in picks else Content(text=f"{label}: no options found")
+        for category, label in CATEGORIES.items()
+    ]
+    if trip.get("departure_date") and trip.get("return_date"):
+        # trip_plan reads the days to plan from here
+        contents.append(Content(text=f"Trip: {trip.get('departure_location')} - {trip.get('arrival_location')}, {trip['departure_date']} to {trip['return_date']}"))
+    return contents
+
+
+# the helper agents are built once, a run does not change them
+option_picker_agent = Agent(
+    name="OptionPickerAgent",
+    instructions="From the following list of options of flights, hotels, and car rentals, pick the most suitable single option from each category based on the user's preferences and budget. Provide your selections in a concise manner.",
+    output_type=List[Content],
+    model="gpt-4o-mini"
+)
+
+
+async def _pick_with_llm(option_list: str, preferences: str) -> List[Content]:
+    async with admit("openai", "pick_options"):
+        with span("pick_options"):
+            response = await Runner.run(option_picker_agent, input=f"Option list: {option_list}\n User preferences and budget: {preferences}", hooks=StageHooks())
     return response.final_output
 
 
+class TieBreak(BaseModel):
+    choices: List[int]
+
+
+tiebreak_agent = Agent(
+    name="OptionTieBreakerAgent",
+    instructions="Each numbered list holds travel options that score the same on price, times and ratings. Pick the option that suits the user's preferences best from every list and answer with its number, one number per list in the order given.",
+    output_type=TieBreak,
+    model="gpt-4o-mini"
+)
+
+
+async def _break_ties(ties: dict, preferences: str) -> dict:
+    """The option the LLM prefers from each list of equally scored options, the local picks stay when it fails"""
+    lists = "\n\n".join(
+        f"{CATEGORIES[category]} options:\n" + "\n".join(f"{number}. {describe(category, option).text}" for number, option in enumerate(options, 1))
+        for category, options in ties.items()
+    )
+    try:
+        async with admit("openai", "pick_options"):
+            with span("pick_options", mode="tiebreak"):
+                response = await Runner.run(tiebreak_agent, input=f"{lists}\n\nUser preferences and budget: {preferences}", hooks=StageHooks())
+    except Exception as e:
+        app_logger.warning(f"Option tiebreak failed, keeping the local picks: {e}")
+        return {}
+    picks = {}
+    for (category, options), choice in zip(ties.items(), response.final_output.choices):
+        if 1 <= choice <= len(options):
+            picks[category] = options[choice - 1]
+    return picks
+
+
+trip_planner_agent = Agent(
+    name="TripPlannerAgent",
+    instructions=(
+        "Using the selected options for flight, hotel, and car rental, create a day-by-day trip plan. "
+        "Divide each day into morning/afternoon/evening and suggest activities and food, taking flight times into account on the first and last day. "
+        "CRITICAL OUTPUT FORMAT: Return ONLY a JSON array where each element has keys day_number (int), hour (HH:MM 24h string), activity_title (string), activity_content (string). "
+        "Do not include markdown or any text outside the JSON. Example: [{\"day_number\":1,\"hour\":\"09:00\",\"activity_title\":\"Check-in\",\"activity_content\":\"Arrive and check into hotel\"}]."
+    ),
+    output_type=str,
+    model="gpt-4o-mini"
+)
+
+
 @function_tool
 async def trip_plan(selected_options:str,preferences:str) -> str:
     """
@@ -69,19 +159,13 @@ async def trip_plan(selected_options:str,preferences:str) -> str:
     Returns:
         str: A summary of the trip plan. day by day plan with activities and food suggestions. provide the plan in a detailed  and clean manner.
     """
-    #TODO: llm based implementation
-    agent = Agent(
-        name="TripPlannerAgent",
-        instructions=(
-            "Using the selected options for flight, hotel, and car rental, create a day-by-day trip plan. "
-            "Divide each day into morning/afternoon/evening and suggest activities and food, taking flight times into account on the first and last day. "
-            "CRITICAL OUTPUT FORMAT: Return ONLY a JSON array where each element has keys day_number (int), hour (HH:MM 24h string), activity_title (string), activity_content (string). "
-            "Do not include markdown or any text outside the JSON. Example: [{\"day_number\":1,\"hour\":\"09:00\",\"activity_title\":\"Check-in\",\"activity_content\":\"Arrive and check into hotel\"}]."
-        ),
-        output_type=str,
-        model="gpt-4o-mini"
-    )
-    response = await Runner.run(agent, input=f"Selected options: {selected_options}\nUser preferences and budget: {preferences}")
+    # long trips are planned a few days per call, concurrently
+    plan = await plan_days(selected_options, preferences)
+    if plan is not None:
+        return plan
+    async with admit("openai", "trip_plan"):
+        with span("trip_plan"):
+            response = await Runner.run(trip_planner_agent, input=f"Selected options: {selected_options}\nUser preferences and budget: {preferences}", hooks=StageHooks())
     return response.final_output
 
 load_dotenv(override=True)
@@ -126,26 +210,21 @@ class TravelAgent(Agent):
 travelAgent = TravelAgent()
 
 
-async def run_travel_agent(input_text: str, conversation_history: Optional[List[dict]] = None):
-    """Run the travel agent with the given input text and conversation history."""
-    # Build context from conversation history if provided
-    context = input_text
-    if conversation_history:
-        context_parts = []
-        for message in conversation_history:
-            role = message["role"]
-            content = message["content"]
-            if role == "user":
-                context_parts.append(f"User: {content}")
-            elif role == "assistant":
-                context_parts.append(f"Assistant: {content}")
-        context_parts.append(f"User: {input_text}")
-        context = "\n".join(context_parts)
-    
-    result = await Runner.run(travelAgent, input=context)
+async def run_travel_agent(input_text: str, conversation_history: Optional[Union[str, List[dict]]] = None):
+    """Run the travel agent with the given input text and conversation history (rendered string or message dicts)."""
+    context = build_context(input_text, conversation_history)
+    async with admit("openai", "travel_agent"):
+        with span("travel_agent"):
+            result = await Runner.run(travelAgent, input=context, hooks=StageHooks())
     return result.final_output
 
 
+def run_travel_agent_streamed(input_text: str, conversation_history: Optional[Union[str, List[dict]]] = None) -> RunResultStreaming:
+    """Start the travel agent in streaming mode, iterate `stream_events()` of the result and read `final_output` at the end."""
+    context = build_context(input_text, conversation_history)
+    return Runner.run_streamed(travelAgent, input=context, hooks=StageHooks())
+
+
 
 if __name__ == "__main__":
     import asyncio
@@ -0,0 +1,82 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from locks import chat_locks
+from logger import app_logger
+
+
+class UnitOfWork:
+    """Collects the objects changed during a request and commits each of them once at the end.
+
+    Tracked objects only need an `id` and an async `commit()` method. Chat locks
+    taken through the unit of work are held until after the commit, so the next
+    request on the same chat always sees this one's changes.
+    """
+
+    def __init__(self):
+        self._dirty: Dict[str, object] = {}
+        self._held: List[str] = []
+        self.committed = 0
+
+    def register(self, obj) -> None:
+        self._dirty[obj.id] = obj
+
+    def discard(self, obj_id: str) -> None:
+        self._dirty.pop(obj_id, None)
+
+    async def lock(self, chat_id: str) -> None:
+        if chat_id not in self._held:
+            await chat_locks.acquire(chat_id)
+            self._held.append(chat_id)
+
+    def release_locks(self) -> None:
+        while self._held:
+            chat_locks.release(self._held.pop())
+
+    async def commit(self) -> None:
+        dirty, self._dirty = self._dirty, {}
+        for obj in dirty.values():
+            await obj.commit()
+        self.committed += len(dirty)
+        if dirty:
+            app_logger.info(f"Unit of work committed {len(dirty)} dirty objects")
+
+
+# ContextVar for the unit of work of the current request
+unit_of_work_ctx: ContextVar[Optional[UnitOfWork]] = ContextVar("unit_of_work", default=None)
+
+
+@asynccontextmanager
+async def unit_of_work():
+    """Open a unit of work, committed when the block exits without an error"""
+    uow = UnitOfWork()
+    token = unit_of_work_ctx.set(uow)
+    try:
+        yield uow
+        await uow.commit()
+    finally:
+        uow.release_locks()
+        unit_of_work_ctx.reset(token)
+
+
+async def lock_chat(chat_id: str) -> None:
+    """Serialize the rest of the current unit of work with every other one touching chat_id"""
+    uow = unit_of_work_ctx.get()
+    if uow is None:
+        raise RuntimeError("lock_chat needs an active unit of work")
+    await uow.lock(chat_id)
+
+
+def track(obj) -> None:
+    """Mark obj dirty, outside of a unit of work it is flushed right away"""
+    uow = unit_of_work_ctx.get()
+    if uow is None:
+        obj.flush()
+    else:
+        uow.register(obj)
+
+
+def untrack(obj_id: str) -> None:
+    uow = unit_of_work_ctx.get()
+    if uow is not None:
+        uow.discard(obj_id)
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from logger import app_logger
+from tracing import record_stage
+
+load_dotenv()
+WARMUP_BACKGROUND = os.getenv("WARMUP_BACKGROUND", "0") == "1"  # build the agents behind the first requests too, not only the MCP warm-up
+WARMUP_MCP_TOOLS = os.getenv("WARMUP_MCP_TOOLS", "1") == "1"  # fetch the MCP tool list before the first trip needs it
+WARMUP_MCP_TIMEOUT = float(os.getenv("WARMUP_MCP_TIMEOUT", "10"))  # seconds, the first search fetches the tool list when this runs out
+
+
+class Startup:
+    """Timings of the startup phases and whether the warm-up has finished"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.import_seconds: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.agents = 0
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+
+    def imported(self, started: float) -> None:
+        """Called at the end of main.py with the time its import started, time to ready counts from there"""
+        self.started = started
+        self.import_seconds = time.perf_counter() - started
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            # a phase that fails leaves its work to the first request, like a cold start
+            self.errors[name] = str(e) or type(e).__name__
+            app_logger.error(f"Warm-up phase {name} failed: {self.errors[name]}")
+        finally:
+            self.phases[name] = round(time.perf_counter() - started, 4)
+            record_stage("startup", self.phases[name], phase=name)
+
+    async def start(self) -> None:
+        """Build the agents, then warm up MCP in the background, /ready reports when both are done.
+
+        The MCP server is an upstream, serving never waits for it. With
+        WARMUP_BACKGROUND set the agents are built in the background as well.
+        """
+        if WARMUP_BACKGROUND:
+            self._task = asyncio.create_task(self.warm_up())
+        else:
+            await self.build_agents()
+            self._task = asyncio.create_task(self.warm_up_mcp())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def warm_up(self) -> None:
+        await self.build_agents()
+        await self.warm_up_mcp()
+
+    async def build_agents(self) -> None:
+        with self.phase("agents"):
+            # the imports hold the GIL for most of the time, a thread at least keeps /health answering
+            self.agents = await asyncio.to_thread(build_agents)
+
+    async def warm_up_mcp(self) -> None:
+        from mcp_pool import mcp_pool
+
+        with self.phase("mcp_pool"):
+            # spawns MCP_POOL_MIN sessions, 0 leaves them to the first search
+            await mcp_pool.start()
+        if WARMUP_MCP_TOOLS:
+            from mcp_search import tool_schemas
+
+            with self.phase("mcp_tools"):
+                await asyncio.wait_for(tool_schemas(), WARMUP_MCP_TIMEOUT)
+        self.ready_seconds = round(time.perf_counter() - self.started, 4)
+        self.ready = True
+        app_logger.info(f"Ready in {self.ready_seconds:.2f}s (import {self.import_seconds or 0:.2f}s, warm-up {self.phases})")
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "import_seconds": round(self.import_seconds, 4) if self.import_seconds is not None else None,
+            "ready_seconds": self.ready_seconds,
+            "phases": self.phases,
+            "errors": self.errors,
+            "agents": self.agents,
+        }
+
+
+def build_agents() -> int:
+    """Import the agent modules, which build every agent once, returns how many were built"""
+    import chat_context
+    import day_planner
+    import guardianAgent
+    import travelAgent
+
+    built = [
+        guardianAgent.guardian_agent,
+        travelAgent.travelAgent,
+        travelAgent.option_picker_agent,
+        travelAgent.tiebreak_agent,
+        travelAgent.trip_planner_agent,
+        day_planner.day_planner_agent,
+        chat_context.summary_agent(),
+    ]
+    return len(built)
+
+
+# Global startup state, the warm-up runs in the app lifespan
+startup = Startup()
@@ -0,0 +1,91 @@
+"""Helpers shared by the benchmarks: percentiles, result files and comparisons."""
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "app")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile, 0.0 for an empty list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Latency percentiles in milliseconds and throughput of a run"""
+    return {
+        "count": len(latencies),
+        "rps": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BENCH_DIR, capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_result(name: str, result: dict, output: Optional[str] = None) -> str:
+    """Write a result json, by default to results/<name>-<revision>.json, returns the path"""
+    result = {"benchmark": name, "revision": git_revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(), **result}
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{result['revision']}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2, ensure_ascii=False)
+    return output
+
+
+def print_comparison(baseline_path: str, current: Dict[str, Dict[str, float]], keys=("rps", "p50_ms", "p95_ms", "p99_ms")) -> None:
+    """Print current vs baseline for every row both have, rows are dicts of metrics"""
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    print(f"\ncompared with {baseline_path} (revision {baseline.get('revision')})")
+    for row, metrics in current.items():
+        old = baseline.get("rows", {}).get(row)
+        if not old:
+            continue
+        deltas = []
+        for key in keys:
+            if key in metrics and old.get(key):
+                change = (metrics[key] - old[key]) / old[key] * 100
+                deltas.append(f"{key} {old[key]} -> {metrics[key]} ({change:+.1f}%)")
+        print(f"  {row}: " + ", ".join(deltas))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def python() -> str:
+    return sys.executable
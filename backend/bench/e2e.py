@@ -0,0 +1,224 @@
+"""End-to-end benchmark of the chat API, fully offline.
+
+Starts the fake LLM (fake_openai.py) and the app (serve.py) with the fake MCP
+server (fake_mcp.py) as its MCP command, then lets `--users` simulated users
+run scripted conversations against `POST /api/chat/{id}/message` (or the
+stream endpoint with `--stream`) at the same time. Each conversation first
+gives part of the trip, which is answered without the travel agent, then the
+rest of it, which runs the full get_mcp_lists / pick_options / trip_plan
+chain. Reports p50/p95/p99 latency and requests per second per turn kind and
+writes them with the config and git revision to results/, so runs of two
+commits can be compared with `--compare`.
+
+    python e2e.py --users 20 --conversations 5 --llm-latency 0.3 --mcp-latency 0.2
+    python e2e.py --users 20 --conversations 5 --compare results/e2e-a3a4e7d.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+from bench_utils import BENCH_DIR, free_port, latency_summary, print_comparison, write_result
+
+# scripted conversations, the first turn is missing slots, the second completes the trip
+CONVERSATIONS = [
+    ["Merhaba, Antalya'ya bir tatil planlamak istiyorum", "İstanbul'dan 3 Kasım'da gidip 6 Kasım'da döneceğim"],
+    ["Hi, I want to plan a trip to Rome", "I'll fly from London on 3 November and return on 7 November"],
+    ["Trabzon'a gitmek istiyorum", "İzmir'den 10 Kasım'da gidip 14 Kasım'da döneceğim"],
+    ["I'd like to visit Barcelona", "Flying from Berlin on 12 November, coming back on 16 November"],
+    ["Kapadokya gezisi planlar mısın?", "Ankara'dan 20 Kasım'da gidip 23 Kasım'da döneceğim"],
+    ["Plan a trip to Paris for me", "From Amsterdam on 5 December and back on 9 December"],
+    ["Bodrum'a gitmek istiyorum", "Bursa'dan 1 Aralık'ta gidip 4 Aralık'ta döneceğim"],
+    ["Help me plan a holiday in Vienna", "I leave Munich on 8 December and return on 11 December"],
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--conversations", type=int, default=3, help="conversations per user")
+    parser.add_argument("--warmup", type=int, default=1, help="conversations run before timing starts")
+    parser.add_argument("--stream", action="store_true", help="use the SSE endpoint, also reports time to first event")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per fake LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="extra seconds per token the fake LLM answers with")
+    parser.add_argument("--mcp-latency", type=float, default=0.2, help="seconds per fake MCP tool call")
+    parser.add_argument("--mcp-jitter", type=float, default=0.0)
+    parser.add_argument("--no-fast-path", action="store_true", help="route every turn through the guardian LLM (SLOT_FAST_PATH=0)")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="extra environment for the app (repeatable)")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds per request")
+    parser.add_argument("--output", help="result file, default results/e2e-<revision>.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    return parser.parse_args()
+
+
+def start(args, workdir: str):
+    """Start the fake LLM and the app, returns (processes, app url, llm url)"""
+    llm_port, app_port = free_port(), free_port()
+    llm_log = open(os.path.join(workdir, "fake_openai.log"), "w")
+    llm = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_openai.py"), "--port", str(llm_port),
+         "--latency", str(args.llm_latency), "--jitter", str(args.llm_jitter), "--token-latency", str(args.llm_token_latency)],
+        stdout=llm_log, stderr=subprocess.STDOUT,
+    )
+    # the MCP subprocess only inherits a few variables, so its config goes on the command line
+    mcp_args = [os.path.join(BENCH_DIR, "fake_mcp.py"), "--latency", str(args.mcp_latency), "--jitter", str(args.mcp_jitter)]
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "OPENAI_AGENTS_DISABLE_TRACING": "1",
+        "DB_FILE": os.path.join(workdir, "db.json"),
+        "MCP_COMMAND": sys.executable,
+        "MCP_ARGS": " ".join(mcp_args),
+        "OPENSEARCH_URL": "",
+        "SLOT_FAST_PATH": "0" if args.no_fast_path else "1",
+    }
+    for item in args.env:
+        name, _, value = item.partition("=")
+        env[name] = value
+    app_log = open(os.path.join(workdir, "app.log"), "w")
+    app = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "serve.py"), "--port", str(app_port)],
+        stdout=app_log, stderr=subprocess.STDOUT, env=env, cwd=workdir,
+    )
+    return [llm, app], f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{llm_port}"
+
+
+async def wait_healthy(client: httpx.AsyncClient, url: str, processes, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for process in processes:
+            if process.poll() is not None:
+                raise RuntimeError(f"{process.args[1]} exited with {process.returncode}, see its log")
+        try:
+            if (await client.get(f"{url}/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become healthy in {timeout} seconds")
+
+
+async def send(client: httpx.AsyncClient, url: str, chat_id: str, text: str, stream: bool):
+    """Send one turn, returns (kind, seconds, seconds to first event or None)"""
+    started = time.perf_counter()
+    if not stream:
+        response = await client.post(f"{url}/api/chat/{chat_id}/message", json={"content": text})
+        response.raise_for_status()
+        return ("plan" if response.json().get("plan") else "ask"), time.perf_counter() - started, None
+    first, event, message = None, None, None
+    async with client.stream("POST", f"{url}/api/chat/{chat_id}/message/stream", json={"content": text}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first is None and line:
+                first = time.perf_counter() - started
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:") and event in ("message", "error"):
+                if event == "error":
+                    raise RuntimeError(line[5:].strip())
+                message = json.loads(line[5:])
+    return ("plan" if message and message.get("plan") else "ask"), time.perf_counter() - started, first
+
+
+async def user(client: httpx.AsyncClient, url: str, index: int, conversations: int, stream: bool, samples: Dict[str, list], ttfe: list, errors: List[str]) -> None:
+    for number in range(conversations):
+        turns = CONVERSATIONS[(index + number) % len(CONVERSATIONS)]
+        try:
+            chat = (await client.post(f"{url}/api/chat")).json()
+            for text in turns:
+                kind, seconds, first = await send(client, url, chat["id"], text, stream)
+                samples[kind].append(seconds)
+                samples["all"].append(seconds)
+                if first is not None:
+                    ttfe.append(first)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+
+async def run(args, url: str, llm_url: str, processes) -> dict:
+    limits = httpx.Limits(max_connections=args.users + 4, max_keepalive_connections=args.users + 4)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        await wait_healthy(client, url, processes)
+        await wait_healthy(client, llm_url, processes)
+        if args.warmup:
+            warmup_errors: List[str] = []
+            await user(client, url, 0, args.warmup, args.stream, defaultdict(list), [], warmup_errors)
+            if warmup_errors:
+                raise RuntimeError(f"warmup failed: {warmup_errors[0]}")
+        llm_before = (await client.get(f"{llm_url}/stats")).json()
+
+        samples: Dict[str, list] = defaultdict(list)
+        ttfe: List[float] = []
+        errors: List[str] = []
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            user(client, url, index, args.conversations, args.stream, samples, ttfe, errors)
+            for index in range(args.users)
+        ])
+        elapsed = time.perf_counter() - started
+
+        llm_stats = (await client.get(f"{llm_url}/stats")).json()
+        app_stats = (await client.get(f"{url}/api/stats")).json()
+    rows = {kind: latency_summary(values, elapsed) for kind, values in sorted(samples.items())}
+    if ttfe:
+        rows["first_event"] = latency_summary(ttfe, elapsed)
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "rows": rows,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "llm_calls": llm_stats["total"] - llm_before["total"],
+        "llm_calls_by_agent": llm_stats["calls"],
+        # estimated as characters / 4 by the fake LLM
+        "prompt_tokens": llm_stats["prompt_tokens_total"] - llm_before["prompt_tokens_total"],
+        "prompt_tokens_by_agent": llm_stats["prompt_tokens"],
+        "app_stats": app_stats,
+    }
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="trip-bench-") as workdir:
+        processes, url, llm_url = start(args, workdir)
+        try:
+            result = asyncio.run(run(args, url, llm_url, processes))
+        except Exception:
+            with open(os.path.join(workdir, "app.log")) as log:
+                sys.stderr.write(log.read()[-4000:])
+            raise
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    result = {"config": config, **result}
+    path = write_result("e2e", result, args.output)
+
+    print(f"{args.users} users x {args.conversations} conversations in {result['elapsed_seconds']}s, "
+          f"{result['errors']} errors, {result['llm_calls']} LLM calls, ~{result['prompt_tokens']} prompt tokens")
+    print(f"{'turn':<12}{'count':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, row in result["rows"].items():
+        print(f"{kind:<12}{row['count']:>7}{row['rps']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    for sample in result["error_samples"]:
+        print(f"error: {sample}")
+    print(f"results written to {path}")
+    if args.compare:
+        print_comparison(args.compare, result["rows"])
+
+
+if __name__ == "__main__":
+    main()
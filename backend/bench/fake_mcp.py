@@ -0,0 +1,108 @@
+"""Stdio MCP server with canned flight_search, hotel_search and car_search tools.
+
+Stands in for the enuygun MCP server in the benchmarks. Payloads are generated
+from the arguments with a seeded RNG, so the same trip always returns the same
+options and different trips return different ones. The tool schemas use other
+property names than our trip fields on purpose, so `build_arguments` is
+exercised the same way as against the real server.
+
+    python fake_mcp.py --latency 0.3 --jitter 0.1 --hotel-latency 0.8
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from typing import Optional
+
+from mcp.server.fastmcp import FastMCP
+
+AIRLINES = ["Turkish Airlines", "Pegasus", "AJet", "SunExpress"]
+HOTELS = ["Grand Palace Hotel", "Old Town Suites", "Seaside Resort", "City Center Inn", "Boutique Konak", "Park Residence"]
+CARS = [("Fiat Egea", "economy"), ("Renault Clio", "economy"), ("Toyota Corolla", "compact"), ("VW Passat", "midsize"), ("Peugeot 3008", "suv")]
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--latency", type=float, default=0.2, help="seconds per tool call")
+parser.add_argument("--jitter", type=float, default=0.0, help="uniform extra seconds, 0..jitter")
+parser.add_argument("--flight-latency", type=float, help="overrides --latency for flight_search")
+parser.add_argument("--hotel-latency", type=float, help="overrides --latency for hotel_search")
+parser.add_argument("--car-latency", type=float, help="overrides --latency for car_search")
+parser.add_argument("--results", type=int, default=5, help="options returned per search")
+args = parser.parse_args()
+
+mcp = FastMCP("fake-travel")
+
+
+def _rng(*parts) -> random.Random:
+    seed = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return random.Random(int(seed[:16], 16))
+
+
+async def _wait(latency: Optional[float]) -> None:
+    delay = args.latency if latency is None else latency
+    if args.jitter:
+        delay += random.uniform(0, args.jitter)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+@mcp.tool(structured_output=False)
+async def flight_search(origin: str, destination: str, departure_date: str, return_date: Optional[str] = None, adults: int = 1) -> str:
+    """Search round trip flights between two cities."""
+    await _wait(args.flight_latency)
+    rng = _rng("flight", origin, destination, departure_date, return_date, adults)
+    flights = []
+    for index in range(args.results):
+        hour = rng.randint(6, 21)
+        flights.append({
+            "id": f"FL{index + 1}",
+            "airline": rng.choice(AIRLINES),
+            "origin": origin,
+            "destination": destination,
+            "departure": f"{departure_date}T{hour:02d}:{rng.choice(['00', '15', '30', '45'])}",
+            "return": f"{return_date}T{rng.randint(8, 22):02d}:00" if return_date else None,
+            "duration_minutes": rng.randint(55, 240),
+            "stops": rng.choice([0, 0, 0, 1]),
+            "price": {"amount": rng.randint(1500, 9000) * adults, "currency": "TRY"},
+        })
+    return json.dumps(flights, ensure_ascii=False)
+
+
+@mcp.tool(structured_output=False)
+async def hotel_search(city: str, check_in: str, check_out: Optional[str] = None, guests: int = 1) -> str:
+    """Search hotels in a city for the given dates."""
+    await _wait(args.hotel_latency)
+    rng = _rng("hotel", city, check_in, check_out, guests)
+    hotels = []
+    for index, name in enumerate(rng.sample(HOTELS, min(args.results, len(HOTELS)))):
+        hotels.append({
+            "id": f"HT{index + 1}",
+            "name": f"{name} {city}",
+            "stars": rng.randint(3, 5),
+            "rating": round(rng.uniform(7.0, 9.8), 1),
+            "price_per_night": {"amount": rng.randint(1200, 12000), "currency": "TRY"},
+            "image": f"https://images.example.com/hotels/{index + 1}.jpg",
+        })
+    return json.dumps(hotels, ensure_ascii=False)
+
+
+@mcp.tool(structured_output=False)
+async def car_search(pickup_location: str, pickup_date: str, dropoff_date: Optional[str] = None) -> str:
+    """Search rental cars at a location for the given dates."""
+    await _wait(args.car_latency)
+    rng = _rng("car", pickup_location, pickup_date, dropoff_date)
+    cars = []
+    for index, (model, category) in enumerate(rng.sample(CARS, min(args.results, len(CARS)))):
+        cars.append({
+            "id": f"CR{index + 1}",
+            "model": model,
+            "category": category,
+            "transmission": rng.choice(["manual", "automatic"]),
+            "pickup": pickup_location,
+            "price_per_day": {"amount": rng.randint(900, 4000), "currency": "TRY"},
+        })
+    return json.dumps(cars, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    mcp.run("stdio")
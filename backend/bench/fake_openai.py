@@ -0,0 +1,279 @@
+"""OpenAI compatible chat completions stub with scripted answers per agent.
+
+The agent is recognized from its system prompt and answered the way the real
+model is expected to: the guardian hands off to the travel agent, the travel
+agent calls get_mcp_lists, pick_options and trip_plan in turn and then returns
+an OutputResponse, the option picker and trip planner return their structured
+output. Every answer waits `--latency` seconds (plus jitter, plus
+`--token-latency` per token of the answer) first; streamed answers are sent as
+chunks `--chunk-delay` apart. GET /stats returns the call
+count and the estimated prompt tokens per agent.
+
+    python fake_openai.py --port 8100 --latency 0.5 --jitter 0.2
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from datetime import date
+from typing import List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8100)
+parser.add_argument("--latency", type=float, default=0.3, help="seconds before each answer")
+parser.add_argument("--jitter", type=float, default=0.0, help="uniform extra seconds, 0..jitter")
+parser.add_argument("--latency-scale", action="append", default=[], metavar="AGENT=FACTOR",
+                    help="scale the latency for one agent, e.g. trip_planner=4 (repeatable)")
+parser.add_argument("--token-latency", type=float, default=0.0, help="extra seconds per answer token (4 characters), models decoding time")
+parser.add_argument("--chunk-delay", type=float, default=0.01, help="seconds between streamed chunks")
+parser.add_argument("--chunk-size", type=int, default=40, help="characters per streamed content chunk")
+
+# first system prompt fragment that identifies each agent
+AGENTS = [
+    ("guardian", "guardian agent"),
+    ("travel", "AI travel assistant"),
+    ("option_picker", "From the following list of options"),
+    ("day_planner", "You plan a single day"),
+    ("trip_planner", "day-by-day trip plan"),
+    ("summary", "running summary"),
+]
+TRIP_DETAILS = re.compile(r"Trip details: (.+)")
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+DAY_LINE = re.compile(r"Day (\d+) of \d+")
+DEFAULT_TRIP = {"departure_location": "İstanbul", "arrival_location": "Antalya", "departure_date": "2025-11-03", "return_date": "2025-11-06"}
+ACTIVITIES = [
+    ("08:30", "Breakfast", "Local breakfast near the hotel"),
+    ("13:00", "Old town walk", "Walk through the historic centre and the bazaar"),
+    ("19:30", "Dinner", "Seafood dinner by the harbour"),
+]
+
+app = FastAPI()
+agent_calls = Counter()
+agent_prompt_tokens = Counter()
+config = None
+
+
+def detect_agent(messages: List[dict]) -> str:
+    system = next((message.get("content") or "" for message in messages if message.get("role") in ("system", "developer")), "")
+    if isinstance(system, list):
+        system = " ".join(part.get("text", "") for part in system)
+    for agent, fragment in AGENTS:
+        if fragment in system:
+            return agent
+    return "unknown"
+
+
+def last_user_text(messages: List[dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content") or ""
+            return content if isinstance(content, str) else " ".join(part.get("text", "") for part in content)
+    return ""
+
+
+def tool_outputs(messages: List[dict]) -> dict:
+    """Outputs of the tools called since the last user message, by tool name"""
+    start = max((index for index, message in enumerate(messages) if message.get("role") == "user"), default=-1)
+    names, outputs = {}, {}
+    for message in messages[start + 1:]:
+        for call in message.get("tool_calls") or []:
+            names[call["id"]] = call["function"]["name"]
+        if message.get("role") == "tool":
+            outputs[names.get(message.get("tool_call_id"), "")] = message.get("content") or ""
+    return outputs
+
+
+def trip_from(messages: List[dict]) -> dict:
+    trip = dict(DEFAULT_TRIP)
+    for message in messages:
+        content = message.get("content")
+        match = TRIP_DETAILS.search(content) if isinstance(content, str) else None
+        if match:
+            for pair in match.group(1).split(", "):
+                key, _, value = pair.partition("=")
+                if key in trip and value:
+                    trip[key] = value.strip()
+    return trip
+
+
+def trip_days(trip: dict) -> int:
+    try:
+        days = (date.fromisoformat(trip["return_date"]) - date.fromisoformat(trip["departure_date"])).days + 1
+    except ValueError:
+        days = 3
+    return max(1, min(days, 14))
+
+
+def pick(option_list: str) -> List[dict]:
+    """First option of every category of a get_mcp_lists payload"""
+    try:
+        options = json.loads(option_list)
+    except ValueError:
+        options = {}
+    picked = []
+    for key in ("flights", "hotels", "cars"):
+        items = options.get(key) if isinstance(options, dict) else None
+        if items:
+            item = items[0]
+            picked.append({"text": f"{key[:-1].capitalize()}: {json.dumps(item, ensure_ascii=False)}", "link": item.get("image") if isinstance(item, dict) else None})
+        else:
+            picked.append({"text": f"No {key} found", "link": None})
+    return picked
+
+
+def plan(days) -> List[dict]:
+    return [
+        {"day_number": day, "hour": hour, "activity_title": title, "activity_content": content}
+        for day in (range(1, days + 1) if isinstance(days, int) else days)
+        for hour, title, content in ACTIVITIES
+    ]
+
+
+def text_days(text: str) -> int:
+    """Days between the first and last ISO date of the text"""
+    dates = sorted(ISO_DATE.findall(text))
+    if not dates:
+        return trip_days(DEFAULT_TRIP)
+    return trip_days({"departure_date": dates[0], "return_date": dates[-1]})
+
+
+def tool_call(name: str, arguments: dict) -> dict:
+    return {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)}}
+
+
+def script(agent: str, body: dict):
+    """(content, tool_calls) the agent answers with"""
+    messages = body.get("messages", [])
+    tools = [tool["function"]["name"] for tool in body.get("tools") or []]
+    if agent == "guardian":
+        handoff = next((name for name in tools if name.startswith("transfer_to")), None)
+        if handoff and not tool_outputs(messages):
+            return None, [tool_call(handoff, {})]
+        return json.dumps({"plan": None, "contents": [{"text": "Where and when would you like to travel?", "link": None}]}), None
+    if agent == "travel":
+        outputs = tool_outputs(messages)
+        trip = trip_from(messages)
+        preferences = "mid-range budget"
+        if "get_mcp_lists" not in outputs:
+            return None, [tool_call("get_mcp_lists", {**trip, "preferences": preferences})]
+        if "pick_options" not in outputs:
+            return None, [tool_call("pick_options", {"option_list": outputs["get_mcp_lists"], "preferences": preferences})]
+        if "trip_plan" not in outputs:
+            return None, [tool_call("trip_plan", {"selected_options": outputs["pick_options"], "preferences": preferences})]
+        # pick_options output is the repr of a Content list, pick again from the search payload
+        contents = pick(outputs["get_mcp_lists"])
+        try:
+            items = json.loads(outputs["trip_plan"])
+        except ValueError:
+            items = outputs["trip_plan"]
+        return json.dumps({"plan": items, "contents": contents}, ensure_ascii=False), None
+    if agent == "option_picker":
+        text = last_user_text(messages)
+        option_list = text.split("Option list: ", 1)[-1].split("\n User preferences", 1)[0]
+        return json.dumps({"response": pick(option_list)}, ensure_ascii=False), None
+    if agent == "trip_planner":
+        return json.dumps(plan(text_days(last_user_text(messages))), ensure_ascii=False), None
+    if agent == "day_planner":
+        days = [int(day) for day in DAY_LINE.findall(last_user_text(messages))]
+        return json.dumps({"items": plan(days)}, ensure_ascii=False), None
+    if agent == "summary":
+        return "The user is planning a trip and has shared their route and dates.", None
+    return "OK", None
+
+
+def agent_latency(agent: str) -> float:
+    delay = config.latency * config.scales.get(agent, 1.0)
+    if config.jitter:
+        delay += random.uniform(0, config.jitter)
+    return delay
+
+
+def usage(body: dict, content: Optional[str]) -> dict:
+    messages = body.get("messages", [])
+    characters = sum(len(str(message.get("content") or "")) for message in messages)
+    # arguments the model passed to tools are sent back with the next prompt as well
+    characters += sum(len(call["function"].get("arguments") or "") for message in messages for call in message.get("tool_calls") or [])
+    prompt = characters // 4
+    completion = len(content or "") // 4 + 1
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+async def stream(body: dict, content: Optional[str], tool_calls: Optional[list]):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    def chunk(delta: dict, finish_reason=None, **extra) -> str:
+        payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body.get("model", "fake"),
+                   "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    if tool_calls:
+        for index, call in enumerate(tool_calls):
+            yield chunk({"tool_calls": [{"index": index, **call}]})
+    else:
+        for start in range(0, len(content), config.chunk_size):
+            await asyncio.sleep(config.chunk_delay)
+            yield chunk({"content": content[start:start + config.chunk_size]})
+    yield chunk({}, "tool_calls" if tool_calls else "stop")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body.get("model", "fake"),
+                   "choices": [], "usage": usage(body, content)}
+        yield f"data: {json.dumps(payload)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    agent = detect_agent(body.get("messages", []))
+    agent_calls[agent] += 1
+    agent_prompt_tokens[agent] += usage(body, None)["prompt_tokens"]
+    content, tool_calls = script(agent, body)
+    await asyncio.sleep(agent_latency(agent) + config.token_latency * usage(body, content)["completion_tokens"])
+    if body.get("stream"):
+        return StreamingResponse(stream(body, content, tool_calls), media_type="text/event-stream")
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return JSONResponse({
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+        "usage": usage(body, content),
+    })
+
+
+@app.get("/stats")
+async def stats() -> dict:
+    return {
+        "calls": dict(agent_calls),
+        "total": sum(agent_calls.values()),
+        "prompt_tokens": dict(agent_prompt_tokens),
+        "prompt_tokens_total": sum(agent_prompt_tokens.values()),
+    }
+
+
+@app.get("/health")
+async def health() -> dict:
+    return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+    config.scales = {}
+    for item in config.latency_scale:
+        agent, _, factor = item.partition("=")
+        config.scales[agent] = float(factor)
+    uvicorn.run(app, host=config.host, port=config.port, log_level="warning")
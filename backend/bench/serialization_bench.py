@@ -0,0 +1,132 @@
+"""Micro-benchmark of chat store encodings and API response serialization.
+
+Store: a synthetic db.json style store of each `--sizes` chat count (the same
+generator as storage_bench.py) is written in every DB_ENCODING. Reported per
+encoding: bytes on disk and the median time to encode and decode the whole
+store. `json-indent` is how db.json used to be written.
+
+Responses: chats of each `--messages` count are serialized the way FastAPI
+does for a returned response model (model_dump -> validate -> dump to json
+types -> json.dumps) and through FastJSONResponse (model_dump_json). Reported
+is the median time per response and its size.
+
+    python serialization_bench.py --sizes 100,1000 --messages 10,100
+    python serialization_bench.py --compare results/serialization-a3a4e7d.json
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse
+
+from bench_utils import APP_DIR, print_comparison, write_result
+from storage_bench import assistant_reply, synthetic_chat, user_text
+
+sys.path.insert(0, APP_DIR)
+import json_codec  # noqa: E402
+import storage  # noqa: E402
+from models.Chat import Chat  # noqa: E402
+from responses import FastJSONResponse  # noqa: E402
+from schemas import ChatSchema  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000", help="comma separated chat counts of the store")
+    parser.add_argument("--messages", default="10,100,500", help="comma separated message counts of a serialized chat")
+    parser.add_argument("--turns", type=int, default=6, help="max turns of a generated store chat")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per store measurement, the median is reported")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="result file, default results/serialization-<revision>.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    return parser.parse_args()
+
+
+def median_ms(func: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def bench_store(size: int, turns: int, seed: int, repeat: int) -> Dict[str, dict]:
+    rng = random.Random(seed)
+    data = {storage.CHATS_KEY: [synthetic_chat(rng, turns, datetime(2025, 1, 1)) for _ in range(size)]}
+    rows = {}
+    for encoding in storage.ENCODINGS:
+        if encoding == "msgpack" and storage.msgpack is None:
+            print("skipping msgpack, the msgpack package is not installed")
+            continue
+        encoded = storage.encode_store(data, encoding)
+        rows[encoding] = {
+            "bytes": len(encoded),
+            "encode_ms": median_ms(lambda: storage.encode_store(data, encoding), repeat),
+            "decode_ms": median_ms(lambda: storage.decode_store(encoded), repeat),
+        }
+    return rows
+
+
+def chat_schema(messages: int, seed: int) -> ChatSchema:
+    rng = random.Random(seed)
+    chat = synthetic_chat(rng, 0, datetime(2025, 1, 1))
+    for _ in range(messages // 2):
+        contents, plan = assistant_reply(rng, rng.random() < 0.6)
+        chat["messages"].append({"role": "user", "content": user_text(rng), "chat_id": chat["id"]})
+        chat["messages"].append({"role": "assistant", "content": contents, "chat_id": chat["id"], "plan": plan})
+    return Chat._from_json(chat).to_schema()
+
+
+def bench_responses(messages: int, seed: int) -> Dict[str, dict]:
+    schema = chat_schema(messages, seed)
+    adapter = TypeAdapter(ChatSchema)
+
+    def fastapi_default() -> bytes:
+        # what FastAPI does with a returned response_model instance
+        content = adapter.dump_python(adapter.validate_python(schema.model_dump()), mode="json")
+        return JSONResponse(content).body
+
+    def fast_response() -> bytes:
+        return FastJSONResponse(schema).body
+
+    # enough runs for a stable median at every chat size
+    repeat = max(20, 5000 // max(messages, 1))
+    rows = {}
+    for name, func in (("fastapi_default", fastapi_default), ("fast_json_response", fast_response)):
+        rows[name] = {"bytes": len(func()), "serialize_ms": median_ms(func, repeat)}
+    return rows
+
+
+def main():
+    args = parse_args()
+    rows: Dict[str, dict] = {}
+    for size in [int(size) for size in args.sizes.split(",")]:
+        print(f"store with {size} chats")
+        print(f"  {'encoding':<14}{'bytes':>12}{'encode ms':>12}{'decode ms':>12}")
+        for encoding, row in bench_store(size, args.turns, args.seed, args.repeat).items():
+            rows[f"store/{size}/{encoding}"] = row
+            print(f"  {encoding:<14}{row['bytes']:>12}{row['encode_ms']:>12}{row['decode_ms']:>12}")
+    counts: List[int] = [int(count) for count in args.messages.split(",")]
+    for count in counts:
+        print(f"response of a chat with {count} messages")
+        print(f"  {'serializer':<20}{'bytes':>10}{'ms':>10}")
+        for name, row in bench_responses(count, args.seed).items():
+            rows[f"response/{count}/{name}"] = row
+            print(f"  {name:<20}{row['bytes']:>10}{row['serialize_ms']:>10}")
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    config["orjson"] = json_codec.orjson is not None
+    path = write_result("serialization", {"config": config, "rows": rows}, args.output)
+    print(f"results written to {path}")
+    if args.compare:
+        print_comparison(args.compare, rows, keys=("bytes", "encode_ms", "decode_ms", "serialize_ms"))
+
+
+if __name__ == "__main__":
+    main()
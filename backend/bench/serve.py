@@ -0,0 +1,30 @@
+"""Run the backend app for the benchmarks.
+
+The fake LLM only speaks chat completions, so the Agents SDK is switched over
+from the Responses API before the app is imported. Everything else comes from
+the environment (OPENAI_BASE_URL, DB_FILE, MCP_COMMAND, ...), see e2e.py.
+
+    python serve.py --port 8200
+"""
+import argparse
+import sys
+
+from bench_utils import APP_DIR
+
+sys.path.insert(0, APP_DIR)
+
+import uvicorn  # noqa: E402
+from agents import set_default_openai_api, set_tracing_disabled  # noqa: E402
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8200)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    set_default_openai_api("chat_completions")
+    # traces would be exported to the OpenAI platform
+    set_tracing_disabled(True)
+    from main import app  # noqa: E402
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,326 @@
+"""Micro-benchmark of chat persistence through models/Chat.py.
+
+For every backend and store size a synthetic db.json style store is generated
+(a seeded mix of chats with 0 to `--turns` turns, assistant replies carrying
+Content lists and, for planned trips, PlanItem lists) and imported into the
+backend the way the app would. A fresh process then opens it and runs each
+operation `--ops` times from `--concurrency` concurrent tasks, going through
+the same Chat / unit of work code as the API:
+
+    create       POST /api/chat
+    get          GET /api/chat/{id}
+    list         GET /api/chats?limit=50
+    add_message  one finished turn appended to an existing chat
+    delete       DELETE /api/chat/{id}, of the last seeded chats, or of --ops
+                 extra chats added after loading when the store is not larger
+    mixed        10% create, 50% get, 15% list, 25% add_message
+
+Reported per operation: ops/sec, p50/p95/p99 latency and bytes written per op
+(bytes passed to write(2), from /proc/self/io). Peak RSS and load time are
+reported per store. The chat cache is off by default so every op reaches the
+store; pass `--cache-size` to measure with it.
+
+    python storage_bench.py --backends sqlite,journal --sizes 100,10000,100000
+    python storage_bench.py --compare results/storage-a3a4e7d.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bench_utils import APP_DIR, latency_summary, print_comparison, write_result
+
+OPERATIONS = ("create", "get", "list", "add_message", "delete", "mixed")
+MIXED = [("create", 10), ("get", 50), ("list", 15), ("add_message", 25)]
+LIST_LIMIT = 50
+CITIES = ["İstanbul", "Ankara", "İzmir", "Antalya", "Trabzon", "Bodrum", "Rome", "Paris", "London", "Berlin", "Vienna", "Barcelona"]
+ACTIVITIES = [
+    ("08:30", "Breakfast", "Local breakfast near the hotel with fresh simit, cheese and tea"),
+    ("11:00", "Museum visit", "Guided tour of the archaeology museum and the old town walls"),
+    ("13:30", "Lunch", "Lunch at a family run restaurant known for its meze selection"),
+    ("16:00", "Old town walk", "Walk through the historic centre, the bazaar and the harbour"),
+    ("19:30", "Dinner", "Seafood dinner by the harbour with a view of the sunset"),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="json,sqlite,journal", help="comma separated DB_BACKEND values")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma separated chat counts")
+    parser.add_argument("--ops", type=int, default=200, help="operations per kind")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent tasks")
+    parser.add_argument("--turns", type=int, default=6, help="max turns of a generated chat")
+    parser.add_argument("--cache-size", type=int, default=0, help="CHAT_CACHE_SIZE, 0 measures the store alone")
+    parser.add_argument("--json-limit", type=int, default=1000, help="skip json stores larger than this, every json write rewrites the file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="result file, default results/storage-<revision>.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+# --- synthetic data ------------------------------------------------------------
+
+
+def user_text(rng: random.Random) -> str:
+    departure, arrival = rng.sample(CITIES, 2)
+    day = rng.randint(1, 25)
+    return rng.choice([
+        f"{departure}'dan {arrival}'ya {day} Kasım'da gidip {day + 3} Kasım'da döneceğim",
+        f"I want to fly from {departure} to {arrival} on {day} November and return on {day + 3} November",
+        f"{arrival} için orta bütçeli bir otel ve ekonomik bir araba istiyorum",
+        "Can you make the second day a bit more relaxed?",
+    ])
+
+
+def assistant_reply(rng: random.Random, planned: bool):
+    """(contents, plan) of an assistant message, plan is None for a follow-up question"""
+    if not planned:
+        return [{"text": "Harika! Planlamaya başlayabilmem için dönüş tarihini de paylaşır mısın?", "link": None}], None
+    hotel = rng.randint(1, 500)
+    contents = [
+        {"text": f"Flight: {rng.choice(CITIES)} -> {rng.choice(CITIES)}, departs 0{rng.randint(6, 9)}:15, {rng.randint(1500, 9000)} TRY, direct", "link": None},
+        {"text": f"Hotel: Grand Palace {hotel}, 4 stars, rating {rng.randint(70, 98) / 10}, {rng.randint(1200, 12000)} TRY per night", "link": f"https://images.example.com/hotels/{hotel}.jpg"},
+        {"text": f"Car: Renault Clio, automatic, {rng.randint(900, 4000)} TRY per day", "link": None},
+    ]
+    plan = [
+        {"day_number": day, "hour": hour, "activity_title": title, "activity_content": content}
+        for day in range(1, rng.randint(2, 6) + 1)
+        for hour, title, content in ACTIVITIES
+    ]
+    return contents, plan
+
+
+def synthetic_chat(rng: random.Random, max_turns: int, started: datetime) -> dict:
+    chat_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    created_at = started + timedelta(seconds=rng.randint(0, 90 * 24 * 3600))
+    messages = []
+    for _ in range(rng.randint(0, max_turns)):
+        contents, plan = assistant_reply(rng, rng.random() < 0.6)
+        messages.append({"role": "user", "content": user_text(rng), "chat_id": chat_id})
+        messages.append({"role": "assistant", "content": contents, "chat_id": chat_id, "plan": plan})
+    updated_at = created_at + timedelta(minutes=2 * len(messages))
+    return {"id": chat_id, "messages": messages, "created_at": created_at.isoformat(), "updated_at": updated_at.isoformat()}
+
+
+def write_seed(path: str, ids_path: str, size: int, max_turns: int, seed: int) -> None:
+    """Stream `size` chats into a db.json style file, and their ids one per line"""
+    rng = random.Random(seed)
+    started = datetime(2025, 1, 1)
+    with open(path, "w", encoding="utf-8") as file, open(ids_path, "w") as ids:
+        file.write('{"chats": [')
+        for index in range(size):
+            chat = synthetic_chat(rng, max_turns, started)
+            file.write(("," if index else "") + json.dumps(chat, ensure_ascii=False))
+            ids.write(chat["id"] + "\n")
+        file.write("]}")
+
+
+# --- measurement, runs in a fresh process per store -------------------------------
+
+
+def written_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/io") as file:
+            for line in file:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def measure(config: dict) -> dict:
+    sys.path.insert(0, APP_DIR)
+    import logging
+    from models.Chat import Chat
+    from models.Message import Content, OutputResponse, PlanItem
+    from schemas import RequestMessageSchema
+    from storage import get_store
+    from unit_of_work import lock_chat, unit_of_work
+
+    # per op info logs would dominate the timings
+    logging.getLogger("ai_trip_planner").setLevel(logging.WARNING)
+    rng = random.Random(config["seed"] + 1)
+    with open(config["ids_path"]) as file:
+        ids = file.read().split()
+    # the last ids are deleted, the rest are read and appended to. A store with
+    # no more chats than --ops gets --ops extra chats to delete instead
+    seeded_for_delete = len(ids) <= config["ops"]
+    deletable = [] if seeded_for_delete else ids[-config["ops"]:]
+    live = ids[:len(ids) - len(deletable)]
+
+    started = time.perf_counter()
+    await Chat.list_chats(1)  # opens the store and builds its index
+    load_seconds = time.perf_counter() - started
+    if seeded_for_delete:
+        store = get_store()
+        for _ in range(config["ops"]):
+            chat = synthetic_chat(rng, config["turns"], datetime(2025, 1, 1))
+            store.save_chat(chat)
+            deletable.append(chat["id"])
+
+    async def create():
+        async with unit_of_work():
+            live.append(Chat().id)
+
+    async def get():
+        await Chat.get_chat(rng.choice(live))
+
+    async def list_page():
+        await Chat.list_chats(LIST_LIMIT)
+
+    async def add_message():
+        async with unit_of_work():
+            chat_id = rng.choice(live)
+            await lock_chat(chat_id)
+            chat = await Chat.get_chat(chat_id)
+            contents, plan = assistant_reply(rng, rng.random() < 0.6)
+            response = OutputResponse(
+                contents=[Content(**content) for content in contents],
+                plan=[PlanItem(**item) for item in plan] if plan else None,
+            )
+            chat._complete_turn(RequestMessageSchema(content=user_text(rng)), response)
+
+    async def delete():
+        chat_id = deletable.pop()
+        async with unit_of_work():
+            await lock_chat(chat_id)
+            await Chat.delete_chat(chat_id)
+
+    operations = {"create": create, "get": get, "list": list_page, "add_message": add_message, "delete": delete}
+    weights = [weight for _, weight in MIXED]
+
+    async def mixed():
+        await operations[rng.choices([name for name, _ in MIXED], weights)[0]]()
+
+    operations["mixed"] = mixed
+    rows = {}
+    for name in OPERATIONS:
+        count = config["ops"]
+        queue = list(range(count))
+        latencies: List[float] = []
+
+        async def worker():
+            while queue:
+                queue.pop()
+                op_started = time.perf_counter()
+                await operations[name]()
+                latencies.append(time.perf_counter() - op_started)
+
+        bytes_before = written_bytes()
+        phase_started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(config["concurrency"])])
+        elapsed = time.perf_counter() - phase_started
+        bytes_after = written_bytes()
+        row = latency_summary(latencies, elapsed)
+        row["ops_per_sec"] = row.pop("rps")
+        if bytes_before is not None and bytes_after is not None:
+            row["bytes_per_op"] = round((bytes_after - bytes_before) / count)
+        rows[name] = row
+    get_store().close()
+    delete_source = "extra seeded chats" if seeded_for_delete else "seeded store chats"
+    return {"load_seconds": round(load_seconds, 3), "peak_rss_mb": peak_rss_mb(), "delete_source": delete_source, "rows": rows}
+
+
+def run_child(path: str) -> None:
+    with open(path) as file:
+        config = json.load(file)
+    result = asyncio.run(measure(config))
+    with open(config["result_path"], "w") as file:
+        json.dump(result, file)
+
+
+# --- driver ------------------------------------------------------------------
+
+
+def bench_store(args, backend: str, size: int, workdir: str) -> dict:
+    seed_path = os.path.join(workdir, f"seed-{size}.json")
+    ids_path = os.path.join(workdir, f"seed-{size}.ids")
+    if not os.path.exists(seed_path):
+        write_seed(seed_path, ids_path, size, args.turns, args.seed)
+    store_dir = os.path.join(workdir, f"{backend}-{size}")
+    os.makedirs(store_dir)
+    db_file = os.path.join(store_dir, "chats.db" if backend == "sqlite" else "chats.json")
+    env = {
+        **os.environ,
+        "DB_FILE": db_file,
+        "DB_BACKEND": backend,
+        "CHAT_CACHE_SIZE": str(args.cache_size),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "bench"),
+        "OPENSEARCH_URL": "",
+    }
+    # import the seed the way an existing db.json would be brought over
+    if backend == "sqlite":
+        subprocess.run(
+            [sys.executable, "storage.py", seed_path, db_file],
+            cwd=APP_DIR, env=env, check=True, stdout=subprocess.DEVNULL,
+        )
+    else:
+        # the journal snapshot has the same shape as db.json
+        with open(seed_path, "rb") as source, open(db_file, "wb") as target:
+            target.write(source.read())
+    store_bytes = sum(os.path.getsize(os.path.join(store_dir, name)) for name in os.listdir(store_dir))
+
+    config_path = os.path.join(store_dir, "config.json")
+    result_path = os.path.join(store_dir, "result.json")
+    with open(config_path, "w") as file:
+        json.dump({"ids_path": ids_path, "ops": args.ops, "concurrency": args.concurrency, "turns": args.turns, "seed": args.seed, "result_path": result_path}, file)
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--child", config_path], env=env, check=True, stdout=subprocess.DEVNULL)
+    with open(result_path) as file:
+        result = json.load(file)
+    result["store_bytes"] = store_bytes
+    return result
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        run_child(args.child)
+        return
+    backends = [backend.strip() for backend in args.backends.split(",") if backend.strip()]
+    sizes = [int(size) for size in args.sizes.split(",")]
+    stores: Dict[str, dict] = {}
+    rows: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(prefix="storage-bench-") as workdir:
+        for size in sizes:
+            for backend in backends:
+                if backend == "json" and size > args.json_limit:
+                    print(f"skipping json with {size} chats (--json-limit {args.json_limit})")
+                    continue
+                name = f"{backend}/{size}"
+                print(f"{name}: running", flush=True)
+                result = bench_store(args, backend, size, workdir)
+                stores[name] = {key: value for key, value in result.items() if key != "rows"}
+                for op, row in result["rows"].items():
+                    rows[f"{name}/{op}"] = row
+                print(f"{name}: loaded in {result['load_seconds']}s, store {result['store_bytes'] / 1e6:.1f} MB, peak RSS {result['peak_rss_mb']} MB")
+                print(f"  delete runs on {args.ops} {result['delete_source']}")
+                print(f"  {'op':<12}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'bytes/op':>12}")
+                for op, row in result["rows"].items():
+                    print(f"  {op:<12}{row['ops_per_sec']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row.get('bytes_per_op', '-'):>12}")
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "child")}
+    path = write_result("storage", {"config": config, "stores": stores, "rows": rows}, args.output)
+    print(f"results written to {path}")
+    if args.compare:
+        print_comparison(args.compare, rows, keys=("ops_per_sec", "p50_ms", "p99_ms", "bytes_per_op"))
+
+
+if __name__ == "__main__":
+    main()
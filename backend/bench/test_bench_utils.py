@@ -0,0 +1,15 @@
+from bench_utils import percentile
+
+
+def test_percentile_nearest_rank():
+    assert percentile(list(range(1, 11)), 50) == 5
+    assert percentile(list(range(1, 11)), 99) == 10
+    assert percentile(list(range(1, 101)), 50) == 50
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile(list(range(1, 31)), 90) == 27
+
+
+def test_percentile_bounds():
+    assert percentile([], 50) == 0.0
+    assert percentile([3.0], 0) == 3.0
+    assert percentile([1.0, 2.0], 100) == 2.0